@@ -0,0 +1,275 @@
+"""
+Times the model operations on synthetic datasets of several sizes.
+
+For every size a data directory is seeded in a temporary directory with
+users (each with one bank account and money in the wallet) and showings
+with part of their seats reserved. A fresh interpreter is then started in
+that directory, so every size begins cold: it times startup (importing the
+models and loading every store) and then register, login, charge_wallet,
+book_ticket, transfer and get_active_showings, plus turning records into
+model objects and back and the memory each hydrated user or showing
+takes. The datasets and the choice of users and showings are derived
+from --seed, so runs are comparable.
+
+Results are written as JSON. --compare reads an earlier results file and
+flags the operations that got slower by more than --tolerance.
+
+    python benchmarks/bench_models.py --sizes 1000 10000 100000 --output results.json
+    python benchmarks/bench_models.py --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import utils
+
+PASSWORD = 'password'
+ACCOUNT_PASSWORD = '1234'
+CVV2 = 1234
+SHOWINGS_PER_USER = 0.1
+SHOWING_CAPACITY = 200
+OPERATIONS = ('register', 'login', 'charge_wallet', 'book_ticket', 'transfer', 'get_active_showings',
+              'user_from_dict', 'user_to_dict', 'showing_from_dict', 'showing_to_dict')
+MEMORY_SAMPLE = 1000
+
+
+def seeded_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def make_dataset(size: int, rng: random.Random, password_cost: int) -> tuple:
+    """Returns user, bank account and showing records for a dataset size."""
+    password_hash = utils.make_password(PASSWORD, password_cost)
+    account_hash = utils.hash_password(ACCOUNT_PASSWORD)
+    users, accounts, showings = [], [], []
+    for i in range(size):
+        uid = seeded_uuid(rng)
+        account_number = str(10_000_000 + i)
+        users.append({
+            'role': 'user',
+            'uid': uid,
+            'username': f'user{i}',
+            'phone_number': None,
+            'password': password_hash,
+            'birth_date': f'13{rng.randint(50, 85)}-{rng.randint(1, 12)}-{rng.randint(1, 28)}',
+            'bank_accounts': [account_number],
+            'wallet_balance': 1_000_000,
+            'subscription': 'bronze',
+            'cashback_count': 0,
+            'cashback_date': '1404-06-14T22:32:56.731855',
+            'cashback_percent': 0,
+            'gift': None,
+            'created_at': '1404-06-14T22:32:56.731855',
+            'is_hashed': True,
+        })
+        accounts.append({
+            'owner_uid': uid,
+            'account_number': account_number,
+            'password': account_hash,
+            'cvv2': CVV2,
+            'balance': 1_000_000,
+        })
+    for i in range(max(1, int(size * SHOWINGS_PER_USER))):
+        taken = rng.sample(range(SHOWING_CAPACITY), rng.randint(0, SHOWING_CAPACITY // 2))
+        showings.append({
+            'id': seeded_uuid(rng),
+            'name': f'Movie {i % 300}',
+            'age_group': 0,
+            'showing_capacity': SHOWING_CAPACITY,
+            'price': 10,
+            'showing_time': f'1410-{i % 12 + 1}-{i % 28 + 1} {10 + i % 12}:00',
+            'seat_columns': 10,
+            'reserved_seat': {str(seat): users[rng.randrange(size)]['uid'] for seat in sorted(taken)},
+        })
+    return users, accounts, showings
+
+
+def summarise(operation: str, timings: list) -> dict:
+    timings = sorted(timings)
+    return {
+        'operation': operation,
+        'runs': len(timings),
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'ops_per_s': len(timings) / sum(timings) if sum(timings) else None,
+    }
+
+
+def bytes_per_object(records: list, from_dict) -> float:
+    """Returns the memory allocated per model object hydrated from records."""
+    tracemalloc.start()
+    objects = [from_dict(record) for record in records]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return allocated / len(objects)
+
+
+def run_worker(size: int, repeat: int, seed: int, password_cost: int) -> dict:
+    """Times the operations in the current directory; runs in a fresh interpreter."""
+    utils.PASSWORD_COST = password_cost
+    start = time.perf_counter()
+    from models.bank import BankAccount
+    from models.cinema import Showing
+    from models.user import User
+    for store in (User.users, BankAccount.accounts, Showing.showings):
+        len(store)
+    results = [summarise('cold_start', [time.perf_counter() - start])]
+
+    rng = random.Random(seed)
+    showing_ids = [showing['id'] for showing in Showing.showings]
+
+    def pick_user() -> User:
+        return User.from_dict(User.users.find('username', f'user{rng.randrange(size)}'))
+
+    def pick_account() -> BankAccount:
+        return BankAccount.get_account(str(10_000_000 + rng.randrange(size)))
+
+    def time_operation(operation: str, prepare, call) -> None:
+        timings = []
+        for number in range(repeat):
+            arguments = prepare(number)
+            call_start = time.perf_counter()
+            call(*arguments)
+            timings.append(time.perf_counter() - call_start)
+        results.append(summarise(operation, timings))
+
+    time_operation('register', lambda number: (f'new{number}',),
+                   lambda username: User.register(username, PASSWORD, '1370-01-01'))
+    time_operation('login', lambda number: (f'user{rng.randrange(size)}',),
+                   lambda username: User.login(username, PASSWORD))
+    time_operation('charge_wallet', lambda number: (pick_user(),),
+                   lambda user: user.charge_wallet(10, user.bank_accounts[0], ACCOUNT_PASSWORD, CVV2))
+    time_operation('book_ticket',
+                   lambda number: (pick_user(), Showing.from_dict(Showing.showings.get(rng.choice(showing_ids)))),
+                   lambda user, showing: user.book_ticket(showing))
+    time_operation('transfer', lambda number: (pick_account(), str(10_000_000 + rng.randrange(size))),
+                   lambda account, destination: account.transfer(1, ACCOUNT_PASSWORD, CVV2, destination))
+    time_operation('get_active_showings', lambda number: (), Showing.get_active_showings)
+
+    user_records = [User.users.find('username', f'user{rng.randrange(size)}') for _ in range(MEMORY_SAMPLE)]
+    showing_records = [Showing.showings.get(rng.choice(showing_ids)) for _ in range(MEMORY_SAMPLE)]
+    time_operation('user_from_dict', lambda number: (user_records[number % MEMORY_SAMPLE],), User.from_dict)
+    time_operation('user_to_dict', lambda number: (User.from_dict(user_records[number % MEMORY_SAMPLE]),),
+                   User.to_dict)
+    time_operation('showing_from_dict', lambda number: (showing_records[number % MEMORY_SAMPLE],),
+                   Showing.from_dict)
+    time_operation('showing_to_dict', lambda number: (Showing.from_dict(showing_records[number % MEMORY_SAMPLE]),),
+                   Showing.to_dict)
+    memory = {
+        'bytes_per_user': bytes_per_object(user_records, User.from_dict),
+        'bytes_per_showing': bytes_per_object(showing_records, Showing.from_dict),
+    }
+    return {'results': results, 'memory': memory}
+
+
+def run_size(size: int, repeat: int, seed: int, password_cost: int) -> dict:
+    """Seeds a data directory for a size and times it in a fresh interpreter."""
+    users, accounts, showings = make_dataset(size, random.Random(seed), password_cost)
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, 'data'))
+        utils.snapshot_dump(os.path.join(directory, 'data', 'user.json'), users)
+        utils.snapshot_dump(os.path.join(directory, 'data', 'bank.json'), accounts)
+        utils.snapshot_dump(os.path.join(directory, 'data', 'showings.json'), showings)
+        command = [sys.executable, os.path.abspath(__file__), '--worker', '--sizes', str(size),
+                   '--repeat', str(repeat), '--seed', str(seed), '--password-cost', str(password_cost)]
+        completed = subprocess.run(command, cwd=directory, capture_output=True, text=True, check=True,
+                                   env={**os.environ, 'PYTHONPATH': project_root,
+                                        'CINEMA_LOG_FILE': os.path.join(directory, 'bench.log')})
+        measured = json.loads(completed.stdout.splitlines()[-1])
+    for result in measured['results']:
+        result['size'] = size
+    measured['memory']['size'] = size
+    return measured
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> int:
+    """Prints the change against an earlier run; returns how many operations regressed."""
+    with open(baseline_path) as file:
+        baseline = {(result['size'], result['operation']): result for result in json.load(file)['results']}
+    regressions = 0
+    print(f"\n{'size':>8} {'operation':<20}{'before ms':>11}{'after ms':>11}{'change':>9}")
+    for result in results:
+        before = baseline.get((result['size'], result['operation']))
+        if before is None or not before['p50_ms']:
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1
+        regressed = change > tolerance
+        regressions += regressed
+        print(f"{result['size']:>8} {result['operation']:<20}{before['p50_ms']:>11.3f}{result['p50_ms']:>11.3f}"
+              f"{change:>+9.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Model operation benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=50, help='Timed calls per operation')
+    parser.add_argument('--seed', type=int, default=1404)
+    parser.add_argument('--password-cost', type=int, default=utils.PASSWORD_COST, help='scrypt cost of passwords')
+    parser.add_argument('--output', type=str, default='bench_results.json', help='Where to write the results')
+    parser.add_argument('--compare', type=str, help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Slowdown of the median counted as regression')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.sizes[0], args.repeat, args.seed, args.password_cost)))
+        return
+
+    results, memory = [], []
+    print(f"{'size':>8} {'operation':<20}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>10}")
+    for size in args.sizes:
+        measured = run_size(size, args.repeat, args.seed, args.password_cost)
+        for result in measured['results']:
+            results.append(result)
+            print(f"{size:>8} {result['operation']:<20}{result['runs']:>6}{result['p50_ms']:>10.3f}"
+                  f"{result['p95_ms']:>10.3f}{result['ops_per_s'] or 0:>10.0f}")
+        memory.append(measured['memory'])
+        print(f"{size:>8} {'memory':<20}{measured['memory']['bytes_per_user']:>10.0f} B/user"
+              f"{measured['memory']['bytes_per_showing']:>10.0f} B/showing")
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'meta': {
+                'time': datetime.now(timezone.utc).isoformat(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'sizes': args.sizes,
+                'repeat': args.repeat,
+                'seed': args.seed,
+                'password_cost': args.password_cost,
+            },
+            'results': results,
+            'memory': memory,
+        }, file, indent=4)
+    print(f'\nResults written to {args.output}')
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures logins per second at different password hashing costs.
+
+Users are stored in memory with passwords hashed at each scrypt cost, then
+a pool of threads logs them in for a fixed time.
+
+    python benchmarks/bench_password.py --costs 4096 16384 32768 --threads 8
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import utils
+from models.user import User
+from store import UserStore
+
+PASSWORD = 'password'
+
+
+def make_users(count: int, password_hash: str) -> UserStore:
+    users = UserStore()
+    for i in range(count):
+        users.insert({
+            'role': 'user',
+            'uid': str(uuid.uuid4()),
+            'username': f'user{i}',
+            'phone_number': None,
+            'password': password_hash,
+            'birth_date': '1370-01-01',
+            'bank_accounts': [],
+            'wallet_balance': 0,
+            'subscription': 'bronze',
+            'cashback_count': 0,
+            'cashback_date': '1404-06-14T22:32:56.731855',
+            'cashback_percent': 0,
+            'gift': None,
+            'created_at': '1404-06-14T22:32:56.731855',
+            'is_hashed': True,
+        })
+    return users
+
+
+def run_logins(user_count: int, threads: int, duration: float) -> tuple:
+    deadline = time.perf_counter() + duration
+    latencies = []
+
+    def worker(thread: int) -> None:
+        number = thread
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            User.login(f'user{number % user_count}', PASSWORD)
+            latencies.append(time.perf_counter() - start)
+            number += threads
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    return latencies, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Password hashing cost benchmark')
+    parser.add_argument('--costs', type=int, nargs='+', default=[2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15])
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=3)
+    args = parser.parse_args()
+
+    original_users, original_cost = User.users, utils.PASSWORD_COST
+    print(f"{'scheme':<16}{'logins':>8}{'logins/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    try:
+        for cost in args.costs:
+            label = f'scrypt n={cost}'
+            utils.PASSWORD_COST = cost
+            User.users = make_users(args.users, utils.make_password(PASSWORD, cost))
+            latencies, elapsed = run_logins(args.users, args.threads, args.duration)
+            latencies.sort()
+            print(f'{label:<16}{len(latencies):>8}{len(latencies) / elapsed:>10.0f}'
+                  f'{latencies[len(latencies) // 2] * 1000:>9.2f}'
+                  f'{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:>9.2f}')
+    finally:
+        User.users, utils.PASSWORD_COST = original_users, original_cost
+
+
+if __name__ == '__main__':
+    main()
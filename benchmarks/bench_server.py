@@ -0,0 +1,186 @@
+"""
+Measures requests per second and latency of the HTTP service.
+
+A server process is started on a seeded temporary data directory and a
+pool of keep-alive connections sends requests for a fixed time per
+scenario. Each scenario reports throughput and the p50 and p99 latency.
+Booking connections log in once and send the session token afterwards.
+
+    python benchmarks/bench_server.py --connections 64 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils import make_password, snapshot_dump
+
+PASSWORD = 'password'
+SCENARIOS = ('showings', 'login', 'book')
+
+
+def make_users(count: int) -> list:
+    # One hash for everyone: hashing a thousand passwords would dominate the setup.
+    password = make_password(PASSWORD)
+    return [{
+        'role': 'user',
+        'uid': str(uuid.uuid4()),
+        'username': f'user{i}',
+        'phone_number': None,
+        'password': password,
+        'birth_date': '1370-01-01',
+        'bank_accounts': [],
+        'wallet_balance': 1_000_000,
+        'subscription': 'bronze',
+        'cashback_count': 0,
+        'cashback_date': '1404-06-14T22:32:56.731855',
+        'cashback_percent': 0,
+        'gift': None,
+        'created_at': '1404-06-14T22:32:56.731855',
+        'is_hashed': True,
+    } for i in range(count)]
+
+
+def make_showings(count: int, capacity: int) -> list:
+    return [{
+        'id': str(uuid.uuid4()),
+        'name': f'Movie {i}',
+        'age_group': 0,
+        'showing_capacity': capacity,
+        'price': 10,
+        'showing_time': f'1410-{i % 12 + 1}-{i % 28 + 1} 20:00',
+        'seat_columns': 10,
+        'reserved_seat': {},
+    } for i in range(count)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def encode_request(method: str, path: str, payload: dict | None = None, token: str | None = None) -> bytes:
+    body = json.dumps(payload).encode() if payload is not None else b''
+    head = f'{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(body)}\r\n'
+    if token is not None:
+        head += f'Authorization: Bearer {token}\r\n'
+    return head.encode() + b'\r\n' + body
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple:
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) != b'\r\n':
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def scenario_requests(scenario: str, connection: int, users: list, showings: list, reader, writer):
+    """Returns a function giving the next request of one connection."""
+    username = users[connection % len(users)]['username']
+    login = encode_request('POST', '/login', {'username': username, 'password': PASSWORD})
+    if scenario == 'showings':
+        request = encode_request('GET', '/showings')
+        return lambda number: request
+    if scenario == 'login':
+        return lambda number: login
+    writer.write(login)
+    status, body = await read_response(reader)
+    if status != 200:
+        raise RuntimeError(f'Login failed with status {status}.')
+    token = json.loads(body)['token']
+    requests = [encode_request('POST', f"/showings/{showing['id']}/book", {}, token) for showing in showings]
+    return lambda number: requests[(connection + number) % len(requests)]
+
+
+async def run_connection(port: int, scenario: str, connection: int, users: list, showings: list,
+                         deadline: float, latencies: list, errors: list) -> None:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    next_request = await scenario_requests(scenario, connection, users, showings, reader, writer)
+    number = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        writer.write(next_request(number))
+        status, _ = await read_response(reader)
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(status)
+        number += 1
+    writer.close()
+
+
+async def run_scenario(port: int, scenario: str, connections: int, duration: float, users: list, showings: list):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(run_connection(port, scenario, connection, users, showings, deadline, latencies, errors)
+                           for connection in range(connections)))
+    return latencies, errors
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('The server did not start.')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='HTTP service load benchmark')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--showings', type=int, default=1000)
+    parser.add_argument('--capacity', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None, help='Worker threads of the server')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+    showings = make_showings(args.showings, args.capacity)
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, 'data'))
+        snapshot_dump(os.path.join(directory, 'data', 'user.json'), users)
+        snapshot_dump(os.path.join(directory, 'data', 'showings.json'), showings)
+
+        port = free_port()
+        command = [sys.executable, os.path.join(project_root, 'server.py'), '--port', str(port)]
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        server = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  env={**os.environ, 'PYTHONPATH': project_root})
+        try:
+            wait_for_port(port)
+            print(f"{'scenario':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+            for scenario in args.scenarios:
+                latencies, errors = asyncio.run(run_scenario(port, scenario, args.connections, args.duration,
+                                                             users, showings))
+                latencies.sort()
+                print(f'{scenario:<10}{len(latencies):>10}{len(errors):>8}{len(latencies) / args.duration:>10.0f}'
+                      f'{percentile(latencies, 0.5) * 1000:>9.2f}{percentile(latencies, 0.99) * 1000:>9.2f}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
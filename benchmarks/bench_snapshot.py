@@ -0,0 +1,108 @@
+"""
+Compares snapshot load and save times of the supported formats.
+
+Synthetic users, bank accounts and showings are written to a temporary
+directory at each requested size and read back through the same functions
+the stores use.
+
+    python benchmarks/bench_snapshot.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils import snapshot_dump, snapshot_stream, SNAPSHOT_FORMATS
+
+
+def make_users(count: int) -> list:
+    return [{
+        'role': 'user',
+        'uid': str(uuid.uuid4()),
+        'username': f'user{i}',
+        'phone_number': None,
+        'password': 'f' * 64,
+        'birth_date': '1370-01-01',
+        'bank_accounts': [str(10_000_000 + i)],
+        'wallet_balance': i % 500,
+        'subscription': 'bronze',
+        'cashback_count': 0,
+        'cashback_date': '1404-06-14T22:32:56.731855',
+        'cashback_percent': 0,
+        'gift': None,
+        'created_at': '1404-06-14T22:32:56.731855',
+        'is_hashed': True,
+    } for i in range(count)]
+
+
+def make_accounts(count: int) -> list:
+    return [{
+        'owner_uid': str(uuid.uuid4()),
+        'account_number': str(10_000_000 + i),
+        'password': 'f' * 64,
+        'cvv2': 1234,
+        'balance': i % 1000,
+    } for i in range(count)]
+
+
+def make_showings(count: int) -> list:
+    return [{
+        'id': str(uuid.uuid4()),
+        'name': f'Movie {i % 300}',
+        'age_group': 12,
+        'showing_capacity': 80,
+        'price': 20,
+        'showing_time': f'1404-{i % 12 + 1}-{i % 28 + 1} 20:00',
+        'seat_columns': 10,
+        'reserved_seat': {str(seat): str(uuid.uuid4()) for seat in range(i % 40)},
+    } for i in range(count)]
+
+
+DATASETS = (('users', make_users), ('bank accounts', make_accounts), ('showings', make_showings))
+
+
+def available_formats() -> list:
+    formats = []
+    for snapshot_format in SNAPSHOT_FORMATS:
+        if snapshot_format == 'msgpack':
+            try:
+                import msgpack
+            except ImportError:
+                continue
+        formats.append(snapshot_format)
+    return formats
+
+
+def time_call(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Snapshot format benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    formats = available_formats()
+    print(f"{'dataset':<14}{'records':>10}{'format':>9}{'save s':>10}{'load s':>10}{'size MB':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, make_records in DATASETS:
+            for size in args.sizes:
+                records = make_records(size)
+                for snapshot_format in formats:
+                    path = os.path.join(directory, f'data.{snapshot_format}')
+                    save_time = time_call(lambda: snapshot_dump(path, records))
+                    load_time = time_call(lambda: sum(1 for _ in snapshot_stream(path)))
+                    megabytes = os.path.getsize(path) / 1_000_000
+                    print(f'{name:<14}{size:>10}{snapshot_format:>9}{save_time:>10.3f}{load_time:>10.3f}{megabytes:>10.1f}')
+                    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
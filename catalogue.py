@@ -0,0 +1,191 @@
+"""
+This module keeps the searchable fields of the showings in columns.
+
+ShowingCatalogue mirrors every showing as one row of parallel columns:
+start time (seconds since 1970), capacity, reserved seats, age group and
+price. Rows are kept sorted by start time, so a listing bisects past every
+showing that has already started and only looks at the future ones.
+
+A search such as "upcoming, not full, allowed at age X, at most Y per
+ticket" then compares whole columns from that row on instead of looping
+over record dictionaries. With NumPy installed the columns are NumPy arrays
+and every condition is a vectorised mask; without it they are array.array
+columns filtered in one pure-Python pass, with the same results.
+
+Keeping the rows sorted costs a shift of the later rows per new showing;
+loads and bulk inserts run inside bulk(), which sorts once at the end.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EPOCH = datetime(1970, 1, 1)
+COLUMNS = (('start', 'd'), ('capacity', 'q'), ('reserved', 'q'), ('age_group', 'q'), ('price', 'd'))
+INITIAL_ROWS = 64
+
+
+def seconds_of(moment: datetime) -> float:
+    """Returns a naive (Gregorian) datetime as seconds since 1970."""
+    return (moment - EPOCH).total_seconds()
+
+
+class ShowingCatalogue:
+    """The searchable columns of a set of showings, one row per showing id, earliest first."""
+
+    def __init__(self, use_numpy: bool | None = None):
+        """Creates an empty catalogue; NumPy is used whenever it is installed unless use_numpy says otherwise."""
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self._pending = None
+        self._set_rows([])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, key) -> bool:
+        return key in self._start_of
+
+    @contextmanager
+    def bulk(self):
+        """Collects the rows put or removed inside the block and sorts them once at its end."""
+        self._pending = {key: tuple(self._columns[name][row] for name, _ in COLUMNS)
+                         for row, key in enumerate(self.ids)}
+        try:
+            yield self
+        finally:
+            pending, self._pending = self._pending, None
+            self._set_rows(sorted(pending.items(), key=lambda item: item[1][0]))
+
+    def put(self, key, record: dict, start: datetime | None) -> None:
+        """Adds or updates the row of a showing record starting at a (Gregorian) time.
+
+        A showing without a start time is left out."""
+        if start is None:
+            self.remove(key)
+            return
+        seconds = seconds_of(start)
+        values = (seconds, record.get('showing_capacity') or 0, len(record.get('reserved_seat') or ()),
+                  record.get('age_group') or 0, record.get('price') or 0)
+        if self._pending is not None:
+            self._pending[key] = values
+            return
+        if self._start_of.get(key) == seconds:
+            row = self._row_of(key, seconds)
+            for (name, _), value in zip(COLUMNS, values):
+                self._columns[name][row] = value
+            return
+        self.remove(key)
+        row = self._bisect(seconds, bisect_right)
+        self._insert_row(row, values)
+        self.ids.insert(row, key)
+        self._start_of[key] = seconds
+
+    def remove(self, key) -> None:
+        """Drops the row of a showing, if present."""
+        if self._pending is not None:
+            self._pending.pop(key, None)
+            return
+        seconds = self._start_of.pop(key, None)
+        if seconds is None:
+            return
+        row = self._row_of(key, seconds)
+        self._delete_row(row)
+        del self.ids[row]
+
+    def after(self, moment: datetime) -> list:
+        """Returns the ids of the showings starting after a (Gregorian) time, earliest first."""
+        return self.ids[self._bisect(seconds_of(moment), bisect_right):]
+
+    def before(self, moment: datetime) -> list:
+        """Returns the ids of the showings that started before a (Gregorian) time, earliest first."""
+        return self.ids[:self._bisect(seconds_of(moment), bisect_left)]
+
+    def search(self, after: datetime, viewer_age: int | None = None, max_price: float | None = None,
+               available: bool = True) -> list:
+        """Returns the ids of the showings starting after a (Gregorian) time, earliest first.
+
+        available keeps only showings with a free seat, viewer_age only those
+        whose age group is below it and max_price those costing at most that."""
+        first = self._bisect(seconds_of(after), bisect_right)
+        if self.use_numpy:
+            return self._search_numpy(first, viewer_age, max_price, available)
+        columns = [self._columns[name][first:] for name in ('capacity', 'reserved', 'age_group', 'price')]
+        return [self.ids[first + offset]
+                for offset, (capacity, reserved, age_group, price) in enumerate(zip(*columns))
+                if (not available or reserved < capacity) and (viewer_age is None or age_group < viewer_age)
+                and (max_price is None or price <= max_price)]
+
+    def _search_numpy(self, first: int, viewer_age, max_price, available: bool) -> list:
+        size = len(self.ids)
+        mask = numpy.ones(size - first, dtype=bool)
+        if available:
+            mask &= self._columns['reserved'][first:size] < self._columns['capacity'][first:size]
+        if viewer_age is not None:
+            mask &= self._columns['age_group'][first:size] < viewer_age
+        if max_price is not None:
+            mask &= self._columns['price'][first:size] <= max_price
+        return [self.ids[first + offset] for offset in numpy.flatnonzero(mask).tolist()]
+
+    def _set_rows(self, rows: list) -> None:
+        """Replaces every row with (key, values) pairs given in start order."""
+        self.ids = [key for key, _ in rows]
+        self._start_of = {key: values[0] for key, values in rows}
+        columns = list(zip(*(values for _, values in rows))) or [()] * len(COLUMNS)
+        if self.use_numpy:
+            self._columns = {}
+            for (name, code), values in zip(COLUMNS, columns):
+                column = numpy.empty(max(INITIAL_ROWS, len(values)), dtype='f8' if code == 'd' else 'i8')
+                column[:len(values)] = values
+                self._columns[name] = column
+        else:
+            self._columns = {name: array(code, values) for (name, code), values in zip(COLUMNS, columns)}
+
+    def _bisect(self, seconds: float, bisect) -> int:
+        """Returns where seconds falls in the start column, like bisect_left or bisect_right."""
+        if self.use_numpy:
+            side = 'right' if bisect is bisect_right else 'left'
+            return int(numpy.searchsorted(self._columns['start'][:len(self.ids)], seconds, side))
+        return bisect(self._columns['start'], seconds)
+
+    def _row_of(self, key, seconds: float) -> int:
+        row = self._bisect(seconds, bisect_left)
+        while self.ids[row] != key:
+            row += 1
+        return row
+
+    def _insert_row(self, row: int, values: tuple) -> None:
+        size = len(self.ids)
+        if self.use_numpy:
+            self._grow(size + 1)
+        for (name, _), value in zip(COLUMNS, values):
+            column = self._columns[name]
+            if self.use_numpy:
+                column[row + 1:size + 1] = column[row:size]
+                column[row] = value
+            else:
+                column.insert(row, value)
+
+    def _delete_row(self, row: int) -> None:
+        size = len(self.ids)
+        for column in self._columns.values():
+            if self.use_numpy:
+                column[row:size - 1] = column[row + 1:size]
+            else:
+                del column[row]
+
+    def _grow(self, size: int) -> None:
+        """Doubles the NumPy columns until they hold size rows."""
+        capacity = len(self._columns['start'])
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = numpy.empty(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            self._columns[name] = grown
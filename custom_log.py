@@ -1,22 +1,126 @@
-"""Configures the application logger to write to cinematicket.log."""
+"""Configures the application logger to write to cinematicket.log.
+
+Records are put on a queue and written by a background QueueListener, so
+the code that logs never waits on the file or the terminal. The log file
+is rotated by size. The output can be switched to one JSON object per line
+with CINEMA_LOG_FORMAT=json; CINEMA_LOG_FILE, CINEMA_LOG_MAX_BYTES and
+CINEMA_LOG_BACKUPS set the file, its rotation size and how many rotated
+files are kept.
+"""
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 FORMAT = ('%(asctime)s - %(levelname)s \n\t'
           '--> %(message)s')
 
+LOG_FILE = os.environ.get('CINEMA_LOG_FILE', 'cinematicket.log')
+LOG_MAX_BYTES = int(os.environ.get('CINEMA_LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.environ.get('CINEMA_LOG_BACKUPS', 5))
+LOG_FORMAT = os.environ.get('CINEMA_LOG_FORMAT', 'text')
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class MessageQueueHandler(QueueHandler):
+    """Queues records with their message already merged with its arguments.
+
+    Unlike QueueHandler it keeps exc_info, so the writing handlers still
+    format the exception themselves."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-file_handler = logging.FileHandler('cinematicket.log')
-file_formatter = logging.Formatter(FORMAT)
+file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                   encoding='utf8', delay=True)
+file_formatter = JsonLinesFormatter() if LOG_FORMAT == 'json' else logging.Formatter(FORMAT)
 file_handler.setFormatter(file_formatter)
 
 stream_handler = logging.StreamHandler()
 stream_formatter = logging.Formatter(FORMAT)
 stream_handler.setFormatter(stream_formatter)
 
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+# Unbounded, so logging never blocks even when the writer falls behind.
+log_queue = queue.SimpleQueue()
+queue_handler = MessageQueueHandler(log_queue)
+logger.addHandler(queue_handler)
+
+# Guards stopping and restarting the listener against other threads and forks.
+_listener_lock = threading.Lock()
+listener = None
+
+
+def _start_listener():
+    global listener
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+
+
+_start_listener()
+
+
+def flush():
+    """Waits until every queued record has been written."""
+    with _listener_lock:
+        if listener is None:
+            return
+        listener.stop()
+        file_handler.flush()
+        listener.start()
+
+
+def _stop_listener():
+    global listener
+    with _listener_lock:
+        if listener is not None:
+            listener.stop()
+            listener = None
+
+
+def _flush_before_fork():
+    # Held across the fork, so no other thread is halfway through stopping or restarting the listener.
+    _listener_lock.acquire()
+    # Anything still buffered would be written again by the child.
+    file_handler.flush()
+    stream_handler.flush()
+
+
+def _release_after_fork_in_parent():
+    _listener_lock.release()
+
 
+def _restart_listener_in_child():
+    # A forked child does not inherit the writer thread, so it gets a listener and a lock of its own.
+    global _listener_lock
+    _listener_lock = threading.Lock()
+    _start_listener()
 
 
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_flush_before_fork, after_in_parent=_release_after_fork_in_parent,
+                        after_in_child=_restart_listener_in_child)
+atexit.register(_stop_listener)
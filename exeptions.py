@@ -46,3 +46,14 @@ class InvalidAccess(Exception):
     """Raised when access is invalid."""
     pass
 
+class CorruptDataFileError(Exception):
+    """Raised when a data file exists but cannot be parsed."""
+    pass
+
+class SeatUnavailableError(Exception):
+    """Raised when a requested seat is taken or does not exist."""
+    pass
+
+class ShowingConflictError(Exception):
+    """Raised when a showing overlaps another showing in the same hall."""
+    pass
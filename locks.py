@@ -0,0 +1,145 @@
+"""
+This module implements the record locks that serialise concurrent changes.
+
+Locks are taken per record key, so bookings of different showings or
+charges of different wallets never wait on each other. Keys are hashed onto
+LOCK_STRIPES stripes. Inside a process every stripe is a reentrant
+threading lock; for stores kept on disk it is also one byte of the store's
+lock file, locked with fcntl (msvcrt on Windows), so other processes are
+kept out as well. One more byte past the stripes guards the journal files:
+appends hold it shared and compaction holds it exclusively.
+
+Several keys of one store are always locked in stripe order. Code that locks
+records of several stores takes them in the order showings, users,
+bank_accounts, so two bookers can never deadlock on each other.
+"""
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+LOCK_STRIPES = 1024
+LOCK_RETRY_DELAY = 0.005
+
+
+def lock_stripe(key) -> int:
+    """Returns the stripe a record key is locked on; the same in every process."""
+    return zlib.crc32(str(key).encode('utf8')) % LOCK_STRIPES
+
+
+class StripedLock:
+    """Per-key locks of one store, backed by a lock file when lock_path is given."""
+
+    def __init__(self, lock_path: str | None = None) -> None:
+        """Creates the stripe locks; the lock file is opened on first use."""
+        self.lock_path = lock_path
+        self._thread_locks = [threading.RLock() for _ in range(LOCK_STRIPES + 1)]
+        self._depths = [0] * (LOCK_STRIPES + 1)
+        self._fd = None
+        self._fd_lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, *keys):
+        """Locks the given record keys for the duration of the block.
+
+        The lock is reentrant, so a block may lock a key it already holds."""
+        stripes = sorted({lock_stripe(key) for key in keys})
+        held = []
+        try:
+            for stripe in stripes:
+                self._acquire(stripe, exclusive=True)
+                held.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(held):
+                self._release(stripe)
+
+    @contextmanager
+    def journal(self, exclusive: bool = False):
+        """Guards the journal files: shared for appends, exclusive for compaction."""
+        self._acquire(LOCK_STRIPES, exclusive)
+        try:
+            yield
+        finally:
+            self._release(LOCK_STRIPES)
+
+    def _acquire(self, stripe: int, exclusive: bool) -> None:
+        self._thread_locks[stripe].acquire()
+        try:
+            if self._depths[stripe] == 0 and self.lock_path is not None:
+                self._lock_file(stripe, exclusive)
+        except BaseException:
+            self._thread_locks[stripe].release()
+            raise
+        self._depths[stripe] += 1
+
+    def _release(self, stripe: int) -> None:
+        self._depths[stripe] -= 1
+        try:
+            if self._depths[stripe] == 0 and self.lock_path is not None:
+                self._unlock_file(stripe)
+        finally:
+            self._thread_locks[stripe].release()
+
+    def _file(self) -> int:
+        """Returns the lock file descriptor, opening the file on first use.
+
+        It is never closed: closing any descriptor of a file drops every
+        fcntl lock the process holds on it."""
+        with self._fd_lock:
+            if self._fd is None:
+                directory = os.path.dirname(self.lock_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            return self._fd
+
+    def _lock_file(self, stripe: int, exclusive: bool) -> None:
+        fd = self._file()
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, 1, stripe)
+            return
+        # msvcrt locks bytes at the current position and has no shared locks.
+        while True:
+            with self._fd_lock:
+                os.lseek(fd, stripe, os.SEEK_SET)
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    pass
+            time.sleep(LOCK_RETRY_DELAY)
+
+    def _unlock_file(self, stripe: int) -> None:
+        fd = self._file()
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, stripe)
+            return
+        with self._fd_lock:
+            os.lseek(fd, stripe, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+_striped_locks = {}
+_striped_locks_lock = threading.Lock()
+
+
+def get_lock(lock_path: str | None) -> StripedLock:
+    """Returns the StripedLock of a lock file, shared by every store of this process.
+
+    Without a lock_path the lock only covers the threads of this process."""
+    if lock_path is None:
+        return StripedLock()
+    lock_path = os.path.abspath(lock_path)
+    with _striped_locks_lock:
+        striped_lock = _striped_locks.get(lock_path)
+        if striped_lock is None:
+            striped_lock = _striped_locks[lock_path] = StripedLock(lock_path)
+        return striped_lock
@@ -164,29 +164,32 @@ def show_list_of_showings(logged_in_user: User):
     os.system('cls')
     print("--- Show list of showings ---")
 
-    showing_list = Showing.get_active_showings()
-    available_showing = []
-    for i, show in enumerate(showing_list):
-
-        if logged_in_user.get_age() > show['age_group']:
-            print(
-                f'{i+1}- Movie: {show['name']}, Show Capacity: {show['showing_capacity']},Time: {show['time']}, Age Group:{show['age_group']} , Ticket Price:{show['price']}')
-            available_showing.append(show)
+    available_showing = Showing.get_active_showings(viewer_age=logged_in_user.get_age())
+    for i, show in enumerate(available_showing):
+        print(
+            f'{i+1}- Movie: {show['name']}, Show Capacity: {show['showing_capacity']},Time: {show['showing_time']}, Age Group:{show['age_group']} , Ticket Price:{show['price']}')
     return available_showing
 
 
 def main_book_ticket(logged_in_user: User):
 
     available_showing = show_list_of_showings(logged_in_user)
-    for i, show in enumerate(available_showing):
-        print(f"{i+1}- {show}")
 
     print("--- Booking Ticket ---")
 
     choice_str = input("Choose your showing by number: ")
     choice_index = int(choice_str) - 1
+    showing = Showing.from_dict(available_showing[choice_index])
+
+    print(showing.seat_map.layout())
+    seat_str = input("Seat as row-column (e.g. 3-5), or press Enter for the best free seat: ")
+    seats = None
+    if seat_str:
+        row, column = (int(part) for part in seat_str.split('-'))
+        seats = [showing.seat_map.seat_number(row, column)]
+
     print("Please wait , checking your wallet balance...")
-    logged_in_user.book_ticket(available_showing[choice_index])
+    logged_in_user.book_ticket(showing, seats)
     print("Your book ticket has been booked successfully. Enjoy the Movie.")
 
 
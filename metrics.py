@@ -0,0 +1,266 @@
+"""
+This module counts and times the hot paths of the application.
+
+Metrics are off unless the CINEMA_METRICS environment variable is set (or
+enable() is called). While they are off, a timed function costs one flag
+check and timer() hands back a shared no-op context manager, so the
+instrumentation can stay on the hot paths.
+
+Each timed operation gets a latency histogram ``cinema_<name>_seconds`` and
+an error counter ``cinema_<name>_errors_total``; stores also report their
+record counts as the gauge ``cinema_store_records``. Everything can be
+exported in the Prometheus text format or as a JSON snapshot. When
+CINEMA_METRICS_FILE is set, the metrics are written to that file at exit,
+as JSON if it ends in .json and as Prometheus text otherwise.
+"""
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+
+PREFIX = 'cinema_'
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+_enabled = os.environ.get('CINEMA_METRICS', '') not in ('', '0')
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A value that only goes up, per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, labels, value
+
+    def snapshot(self) -> list:
+        return [{'labels': dict(labels), 'value': value} for labels, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    """A value that is set, per label set."""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram:
+    """Counts of observed values in cumulative buckets, with their sum, per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self):
+        for labels, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series['counts']):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', labels, series['sum']
+            yield f'{self.name}_count', labels, series['count']
+
+    def snapshot(self) -> list:
+        return [{'labels': dict(labels), 'count': series['count'], 'sum': series['sum'],
+                 'buckets': dict(zip([_format_value(bound) for bound in self.buckets + (math.inf,)],
+                                     series['counts']))}
+                for labels, series in sorted(self.values.items())]
+
+
+def _metric(metric_class, name: str, help_text: str):
+    """Returns the registered metric of a name, registering it on first use."""
+    metric = _metrics.get(name)
+    if metric is None:
+        with _metrics_lock:
+            metric = _metrics.get(name)
+            if metric is None:
+                metric = _metrics[name] = metric_class(name, help_text)
+    return metric
+
+
+def counter(name: str, help_text: str = '') -> Counter:
+    return _metric(Counter, PREFIX + name, help_text)
+
+
+def gauge(name: str, help_text: str = '') -> Gauge:
+    return _metric(Gauge, PREFIX + name, help_text)
+
+
+def histogram(name: str, help_text: str = '') -> Histogram:
+    return _metric(Histogram, PREFIX + name, help_text)
+
+
+class _Timer:
+    """Times a block into the histogram of an operation and counts its errors."""
+
+    __slots__ = ('operation', 'labels', 'start')
+
+    def __init__(self, operation: str, labels: dict):
+        self.operation = operation
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        histogram(f'{self.operation}_seconds', f'Latency of {self.operation} in seconds').observe(
+            time.perf_counter() - self.start, **self.labels)
+        if error_type is not None:
+            counter(f'{self.operation}_errors_total', f'Failed {self.operation} calls').inc(**self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(operation: str, **labels):
+    """Returns a context manager timing a block as one call of an operation."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(operation, labels)
+
+
+def timed(operation: str):
+    """Decorates a function so every call is timed as one call of an operation."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(operation, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset() -> None:
+    """Forgets every metric."""
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def _registered() -> list:
+    """Returns the registered metrics by name, copied under the lock so a metric
+    registered meanwhile by another thread cannot change the dictionary mid-iteration."""
+    with _metrics_lock:
+        return sorted(_metrics.items())
+
+
+def to_prometheus() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for name, metric in _registered():
+        if metric.help_text:
+            lines.append(f'# HELP {name} {metric.help_text}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        with metric._lock:
+            samples = list(metric.samples())
+        lines += [f'{sample}{_format_labels(labels)} {_format_value(value)}' for sample, labels, value in samples]
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot() -> dict:
+    """Returns every metric as a JSON-serialisable dictionary."""
+    result = {}
+    for name, metric in _registered():
+        with metric._lock:
+            result[name] = {'type': metric.kind, 'help': metric.help_text, 'values': metric.snapshot()}
+    return result
+
+
+def write(file_path: str) -> None:
+    """Writes the metrics to a file atomically: JSON for *.json, Prometheus text otherwise."""
+    # utils imports this module, so it is imported here rather than at the top.
+    from utils import _atomic_write
+    if file_path.endswith('.json'):
+        text = json.dumps(snapshot(), indent=4)
+    else:
+        text = to_prometheus()
+    _atomic_write(file_path, lambda file: file.write(text))
+
+
+def _write_at_exit() -> None:
+    file_path = os.environ.get('CINEMA_METRICS_FILE')
+    if file_path and _metrics:
+        write(file_path)
+
+
+atexit.register(_write_at_exit)
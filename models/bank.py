@@ -1,26 +1,32 @@
 import random
+import metrics
 from custom_log import logger as log
 from exeptions import InvalidPasswordError, InvalidCvv2Error, NegativeAmountError, InvalidAccountNumberError, \
     NotEnoughAmountError
-from utils import data_load , data_dump , hash_password
+from store import BankStore, open_store, transaction
+from utils import hash_password
 
 FILE_PATH = 'data/bank.json'
 
 
-def unique_account_number(account_list: list) -> str:
-    """Generates a unique 8-digit account number."""
-    existing_numbers = {account['account_number'] for account in account_list}
+def unique_account_number(accounts) -> str:
+    """Generates an 8-digit account number not yet present in the accounts store.
+
+    Each candidate is checked against the store's account_number index, so
+    the check costs O(1) instead of collecting every existing number."""
     while True:
         account_number = str(random.randint(10_000_000, 99_999_999))
 
-        if account_number not in existing_numbers:
+        if account_number not in accounts:
             return account_number
 
 
 class BankAccount:
     """A class to manage bank accounts, including creation and transactions."""
 
-    accounts = data_load(FILE_PATH) or []
+    __slots__ = ('owner_uid', 'account_number', 'password', 'cvv2', 'balance')
+
+    accounts = open_store(BankStore, FILE_PATH)
 
     def __init__(self, owner_uid: str, password: str, account_number: str):
         """Initializes a new bank account instance."""
@@ -75,14 +81,26 @@ class BankAccount:
         account_instance.balance = account_dict['balance']
         return account_instance
 
+    @classmethod
+    def get_account(cls, account_number: str):
+        """Returns the bank account with the given number, or None."""
+        account = cls.accounts.get(account_number)
+        if account is None:
+            return None
+        return cls.from_dict(account)
+
+    def refresh_balance(self):
+        """Re-reads the balance from the accounts store, picking up changes made elsewhere."""
+        self.accounts.refresh()
+        account = self.accounts.get(self.account_number)
+        if account is not None:
+            self.balance = account['balance']
+
     @classmethod
     def update_account(cls, self_account):
         """Updates a bank account's information in the accounts list file."""
-        for account in cls.accounts:
-            if account['account_number'] == self_account.account_number:
-                account['balance'] = self_account.balance
-
-        data_dump(FILE_PATH, cls.accounts)
+        if self_account.account_number in cls.accounts:
+            cls.accounts.update(self_account.account_number, {'balance': self_account.balance})
 
     @classmethod
     def create_account(cls, owner_uid: str, password: str):
@@ -90,62 +108,51 @@ class BankAccount:
         if cls._validate_password_length(password):
             account_number = unique_account_number(cls.accounts)
             account = cls(owner_uid, password, account_number)
-            cls.accounts.append(account.to_dict())
-            data_dump(FILE_PATH, cls.accounts)
+            cls.accounts.insert(account.to_dict())
             return account
 
 
+    @metrics.timed('bank_deposit')
     def deposit(self,  amount:int):
         """Deposits a specified amount into the account."""
         if amount <= 0:
             log.warning('Amount must be positive.')
             raise NegativeAmountError
-        self.balance += amount
-        self.update_account(self)
+        with self.accounts.lock(self.account_number):
+            self.refresh_balance()
+            self.balance += amount
+            self.update_account(self)
         log.info('balance updated')
 
 
+    @metrics.timed('bank_withdraw')
     def withdraw(self, amount:int , password:str , cvv2:int):
         """Withdraws a specified amount after verifying credentials."""
         if self._security_check(password, cvv2):
-            min_check = self.balance - amount
-            if self.balance >= amount and min_check > 10:
-                self.balance -= amount
-                self.update_account(self)
-                log.info('balance updated')
-            else:
-                log.info('account balance is insufficient.')
-                raise NotEnoughAmountError
-
-
+            with self.accounts.lock(self.account_number):
+                self.refresh_balance()
+                min_check = self.balance - amount
+                if self.balance >= amount and min_check > 10:
+                    self.balance -= amount
+                    self.update_account(self)
+                    log.info('balance updated')
+                else:
+                    log.info('account balance is insufficient.')
+                    raise NotEnoughAmountError
+
+
+    @metrics.timed('bank_transfer')
     def transfer(self , amount:int , password:str , cvv2:int , destination_account_number:str):
-        """Transfers funds from this account to another."""
-        try:
-            self.withdraw(amount, password, cvv2)
-        except NotEnoughAmountError:
-            print('Insufficient funds to transfer.')
-
-        destination_account = None
-        for account in self.accounts:
-            if account['account_number'] == destination_account_number:
-                destination_account = BankAccount.from_dict(account)
-                break
+        """Transfers funds from this account to another.
+
+        The withdrawal and the deposit are committed together, so a failed
+        transfer leaves both balances untouched."""
+        destination_account = self.get_account(destination_account_number)
         if destination_account is None:
-            self.deposit(amount)
             log.warning('Transfer failed. Destination account does not exist.')
             raise InvalidAccountNumberError
 
-
-        destination_account.deposit(amount)
+        with self.accounts.lock(self.account_number, destination_account_number), transaction():
+            self.withdraw(amount, password, cvv2)
+            destination_account.deposit(amount)
         log.info(f"Successfully transferred {amount} to {destination_account}")
-
-
-
-
-
-
-
-
-
-
-
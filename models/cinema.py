@@ -1,30 +1,266 @@
+import math
 import uuid
+from bisect import bisect_left
 
 import jdatetime
 
-from utils import data_load, data_dump, str_to_datetime, str_to_showimg_datetime
+import metrics
+from custom_log import logger as log
+from exeptions import SeatUnavailableError, ShowingConflictError
+from store import ShowingStore, ShowingArchive, open_store
+from utils import str_to_datetime, str_to_showimg_datetime
 
 FILE_PATH = 'data/showings.json'
+ARCHIVE_DIRECTORY = 'data/archive'
+SEATS_PER_ROW = 10
+DEFAULT_DURATION = 120
 
 class Movies:
     """A class to represent a movie with its details."""
+
+    __slots__ = ('name', 'age_group')
+
     def __init__(self, name:str, age_group:int):
         """Initializes a new movie instance."""
         self.name = name
         self.age_group = age_group
 
+class SeatMap:
+    """The seats of one showing laid out in rows of `columns` seats.
+
+    Seats are numbered from 0 row by row. `states` keeps one byte per seat
+    (0 free, 1 taken) and `holders` maps each taken seat to the uid holding
+    it, with a reverse index per uid, so availability and "has this user
+    booked" checks are O(1).
+
+    Older records may hold seats outside the map: more bookings than the
+    capacity, or seats past a capacity lowered later. Those bookings are
+    kept as holders and count towards is_full, but never become free seats."""
+
+    __slots__ = ('capacity', 'columns', 'rows', 'states', 'holders', '_seats_by_holder')
+
+    FREE = 0
+    TAKEN = 1
+
+    def __init__(self, capacity:int, columns:int = SEATS_PER_ROW, holders:dict | None = None):
+        """Initializes an empty seat map and marks the given holders' seats taken."""
+        self.capacity = capacity
+        self.columns = columns
+        self.rows = math.ceil(capacity / columns) if capacity else 0
+        self.states = bytearray(capacity)
+        self.holders = {}
+        self._seats_by_holder = {}
+        for seat, uid in (holders or {}).items():
+            self._take(int(seat), uid)
+
+    @classmethod
+    def from_record(cls, showing_dict:dict):
+        """Builds the seat map of a showing record.
+
+        Older records kept a plain list of uids; those get seats 0, 1, 2..."""
+        reserved_seat = showing_dict['reserved_seat']
+        if isinstance(reserved_seat, list):
+            reserved_seat = dict(enumerate(reserved_seat))
+        columns = showing_dict.get('seat_columns', SEATS_PER_ROW)
+        return cls(showing_dict['showing_capacity'], columns, reserved_seat)
+
+    def to_record(self) -> dict:
+        """Returns the taken seats as {seat number (str): uid}."""
+        return {str(seat): uid for seat, uid in sorted(self.holders.items())}
+
+    @property
+    def reserved_count(self) -> int:
+        return len(self.holders)
+
+    def is_full(self) -> bool:
+        return len(self.holders) >= self.capacity
+
+    def is_free(self, seat:int) -> bool:
+        return 0 <= seat < self.capacity and self.states[seat] == self.FREE
+
+    def has_booking(self, uid:str) -> bool:
+        return uid in self._seats_by_holder
+
+    def seats_of(self, uid:str) -> list:
+        return list(self._seats_by_holder.get(uid, []))
+
+    def seat_number(self, row:int, column:int) -> int:
+        """Returns the seat number of a 1-based row and column."""
+        return (row - 1) * self.columns + (column - 1)
+
+    def seat_position(self, seat:int) -> tuple:
+        """Returns the 1-based (row, column) of a seat number."""
+        return seat // self.columns + 1, seat % self.columns + 1
+
+    def best_adjacent(self, count:int) -> list:
+        """Returns the best block of `count` adjacent free seats in one row.
+
+        Blocks closest to the middle row, then to the middle of the row, win.
+        Returns an empty list when no row has such a block."""
+        if count <= 0:
+            return []
+        best_block, best_score = [], None
+        middle_row = (self.rows - 1) / 2
+        for row in range(self.rows):
+            row_start = row * self.columns
+            row_end = min(row_start + self.columns, self.capacity)
+            middle_seat = (row_start + row_end - 1) / 2
+            run_start = None
+            for seat in range(row_start, row_end + 1):
+                if seat < row_end and self.states[seat] == self.FREE:
+                    if run_start is None:
+                        run_start = seat
+                    continue
+                if run_start is not None:
+                    for start in range(run_start, seat - count + 1):
+                        score = (abs(row - middle_row), abs(start + (count - 1) / 2 - middle_seat))
+                        if best_score is None or score < best_score:
+                            best_block, best_score = list(range(start, start + count)), score
+                    run_start = None
+        return best_block
+
+    def reserve(self, uid:str, seats:list):
+        """Marks seats as held by uid. Raises SeatUnavailableError if any is taken or repeated."""
+        if len(set(seats)) != len(seats):
+            log.warning('The same seat was requested more than once.')
+            raise SeatUnavailableError
+        for seat in seats:
+            if not self.is_free(seat):
+                log.warning(f'Seat {seat} is not available.')
+                raise SeatUnavailableError
+        for seat in seats:
+            self._take(seat, uid)
+
+    def layout(self) -> str:
+        """Returns the seat map as text rows, '.' for free and 'X' for taken seats."""
+        lines = []
+        for row in range(self.rows):
+            row_seats = self.states[row * self.columns:(row + 1) * self.columns]
+            marks = ''.join('X' if state == self.TAKEN else '.' for state in row_seats)
+            lines.append(f'{row + 1:>3} {marks}')
+        return '\n'.join(lines)
+
+    def _take(self, seat:int, uid:str):
+        if 0 <= seat < self.capacity:
+            self.states[seat] = self.TAKEN
+        self.holders[seat] = uid
+        self._seats_by_holder.setdefault(uid, []).append(seat)
+
+
+class HallSchedule:
+    """The booked time intervals of every hall, for finding overlapping showings.
+
+    Each hall keeps its intervals sorted by start. They never overlap, so a
+    new interval can only collide with its neighbours in that order and one
+    bisect answers whether it fits."""
+
+    __slots__ = ('_halls',)
+
+    def __init__(self):
+        self._halls = {}
+
+    def conflict(self, hall:str, start, end):
+        """Returns the id of a showing in hall overlapping [start, end), or None."""
+        intervals = self._halls.get(hall, [])
+        position = bisect_left(intervals, (start,))
+        if position > 0 and intervals[position - 1][1] > start:
+            return intervals[position - 1][2]
+        if position < len(intervals) and intervals[position][0] < end:
+            return intervals[position][2]
+        return None
+
+    def add(self, hall:str, start, end, showing_id:str):
+        """Books [start, end) in hall. Raises ShowingConflictError if it overlaps a showing."""
+        other = self.conflict(hall, start, end)
+        if other is not None:
+            log.warning(f'Showing {showing_id} overlaps showing {other} in hall {hall}.')
+            raise ShowingConflictError
+        intervals = self._halls.setdefault(hall, [])
+        intervals.insert(bisect_left(intervals, (start,)), (start, end, showing_id))
+
+    def remove(self, hall:str, showing_id:str):
+        """Frees the interval of a showing in hall, if it is booked."""
+        intervals = self._halls.get(hall, [])
+        for position, (_, _, other) in enumerate(intervals):
+            if other == showing_id:
+                del intervals[position]
+                return
+
+    def copy(self):
+        """Returns a schedule with the same bookings that can be added to separately."""
+        schedule = HallSchedule()
+        schedule._halls = {hall: list(intervals) for hall, intervals in self._halls.items()}
+        return schedule
+
+
 class Showing:
-    """A class to manage movie showings."""
-    showings = data_load(FILE_PATH) or []
-    def __init__(self, movie:Movies, showing_capacity:int, price:int, showing_time:str):
-        """Initializes a new showing instance."""
+    """A class to manage movie showings.
+
+    A showing loaded from a record builds its seat map only when it is first
+    used; until then to_dict hands the stored seats back unchanged."""
+
+    __slots__ = ('showing_id', 'movie_name', 'movie_age_group', 'showing_capacity', 'price', 'hall', 'duration',
+                 '_showing_time', '_showing_datetime', '_seat_map', '_seat_record')
+
+    showings = open_store(ShowingStore, FILE_PATH)
+    archive = ShowingArchive(ARCHIVE_DIRECTORY)
+    _cached_schedule = None
+    def __init__(self, movie:Movies, showing_capacity:int, price:int, showing_time:str, hall:str | None = None,
+                 duration:int = DEFAULT_DURATION):
+        """Initializes a new showing instance; duration is in minutes."""
         self.showing_id = str(uuid.uuid4())
         self.movie_name = movie.name
         self.movie_age_group = movie.age_group
         self.showing_capacity = showing_capacity
         self.showing_time = showing_time
         self.price = price
-        self.reserved_seat = []
+        self.hall = hall
+        self.duration = duration
+        self.seat_map = SeatMap(showing_capacity)
+
+    @property
+    def seat_map(self) -> SeatMap:
+        if self._seat_map is None:
+            self._seat_map = SeatMap.from_record(self._seat_record)
+            self._seat_record = None
+        return self._seat_map
+
+    @seat_map.setter
+    def seat_map(self, seat_map:SeatMap):
+        self._seat_map = seat_map
+        self._seat_record = None
+
+    def _seat_fields(self) -> tuple:
+        """Returns the seat columns and reserved seats for a record, without building the seat map."""
+        if self._seat_map is None and isinstance(self._seat_record['reserved_seat'], dict):
+            return self._seat_record['seat_columns'], dict(self._seat_record['reserved_seat'])
+        return self.seat_map.columns, self.seat_map.to_record()
+
+    @property
+    def showing_time(self) -> str:
+        return self._showing_time
+
+    @showing_time.setter
+    def showing_time(self, showing_time:str):
+        self._showing_time = showing_time
+        self._showing_datetime = None
+
+    def get_showing_datetime(self) -> jdatetime.datetime:
+        """Returns the parsed showing time, parsing it only once per value."""
+        if self._showing_datetime is None:
+            self._showing_datetime = str_to_showimg_datetime(self._showing_time)
+        return self._showing_datetime
+
+    def get_end_datetime(self) -> jdatetime.datetime:
+        """Returns when the showing ends."""
+        return self.get_showing_datetime() + jdatetime.timedelta(minutes=self.duration)
+
+    def refresh_seats(self):
+        """Re-reads the seat map from the showings store, picking up bookings made elsewhere."""
+        self.showings.refresh()
+        showing_dict = self.showings.get(self.showing_id)
+        if showing_dict is not None:
+            self.seat_map = SeatMap.from_record(showing_dict)
 
     def __str__(self) -> str:
         """Returns a user-friendly string representation of the showing."""
@@ -33,6 +269,7 @@ class Showing:
 
     def to_dict(self)->dict:
         """Converts the showing object to a dictionary."""
+        seat_columns, reserved_seat = self._seat_fields()
         return {
             'id': self.showing_id,
             'name': self.movie_name,
@@ -40,56 +277,136 @@ class Showing:
             'showing_capacity': self.showing_capacity,
             'price': self.price,
             'showing_time': self.showing_time,
-            'reserved_seat': self.reserved_seat
+            'hall': self.hall,
+            'duration': self.duration,
+            'seat_columns': seat_columns,
+            'reserved_seat': reserved_seat
         }
 
+    @classmethod
+    def from_dict(cls, showing_dict:dict):
+        """Creates a showing instance from a dictionary."""
+        showing_instance = cls.__new__(cls)
+        showing_instance.showing_id = showing_dict['id']
+        showing_instance.movie_name = showing_dict['name']
+        showing_instance.movie_age_group = showing_dict['age_group']
+        showing_instance.showing_capacity = showing_dict['showing_capacity']
+        showing_instance.price = showing_dict['price']
+        showing_instance.showing_time = showing_dict['showing_time']
+        showing_instance.hall = showing_dict.get('hall')
+        showing_instance.duration = showing_dict.get('duration', DEFAULT_DURATION)
+        # Store records are updated in place, so keep only the fields the seat map needs.
+        showing_instance._seat_map = None
+        showing_instance._seat_record = {
+            'showing_capacity': showing_dict['showing_capacity'],
+            'seat_columns': showing_dict.get('seat_columns', SEATS_PER_ROW),
+            'reserved_seat': showing_dict['reserved_seat'],
+        }
+        return showing_instance
+
 
     @classmethod
-    def create_showing(cls, movie:Movies, showing_capacity:int, price:int , showing_time):
-        """Creates a new showing, saves it, and returns the instance."""
+    def create_showing(cls, movie:Movies, showing_capacity:int, price:int , showing_time, hall:str | None = None,
+                       duration:int = DEFAULT_DURATION):
+        """Creates a new showing, saves it, and returns the instance.
+
+        Raises ShowingConflictError if it overlaps another showing in its hall."""
         str_to_showimg_datetime(showing_time)
-        showing = cls(movie, showing_capacity, price , showing_time)
-        cls.showings.append(showing.to_dict())
-        data_dump(FILE_PATH, cls.showings)
+        showing = cls(movie, showing_capacity, price , showing_time, hall, duration)
+        schedule = cls.hall_schedule()
+        if hall is not None:
+            schedule.add(hall, showing.get_showing_datetime(), showing.get_end_datetime(), showing.showing_id)
+        try:
+            cls.showings.insert(showing.to_dict())
+        except BaseException:
+            schedule.remove(hall, showing.showing_id)
+            raise
         return showing
 
     @classmethod
-    def get_active_showings(cls):
-        """Returns a list of active showings."""
-        active_showings = []
-        now = jdatetime.datetime.now()
+    def create_showings(cls, showings:list) -> list:
+        """Saves many new showings with one write and returns them.
 
-        for showing in cls.showings:
-            try:
+        Every showing is checked against the stored ones and each other
+        first; nothing is saved if any two overlap in a hall."""
+        schedule = cls.hall_schedule().copy()
+        for showing in showings:
+            if showing.hall is not None:
+                schedule.add(showing.hall, showing.get_showing_datetime(), showing.get_end_datetime(),
+                             showing.showing_id)
+        cls.showings.insert_many([showing.to_dict() for showing in showings])
+        cls._cached_schedule = (cls.showings, schedule)
+        return showings
 
-                showing_time = str_to_showimg_datetime(showing['showing_time'])
-
-                is_not_full = len(showing['reserved_seat']) < showing['showing_capacity']
-                is_in_future = showing_time > now
+    @classmethod
+    def hall_schedule(cls) -> HallSchedule:
+        """Returns the hall schedule of the stored showings.
 
-                if is_not_full and is_in_future:
-                    active_showings.append(showing)
+        It is built from the store on first use and then kept in step with the
+        showings this process creates, updates and archives. Callers that
+        only try bookings out should add them to a copy()."""
+        if cls._cached_schedule is None or cls._cached_schedule[0] is not cls.showings:
+            cls.showings.refresh()
+            schedule = HallSchedule()
+            for showing_dict in cls.showings:
+                hall = showing_dict.get('hall')
+                if hall is not None:
+                    start = str_to_showimg_datetime(showing_dict['showing_time'])
+                    end = start + jdatetime.timedelta(minutes=showing_dict.get('duration', DEFAULT_DURATION))
+                    schedule.add(hall, start, end, showing_dict['id'])
+            cls._cached_schedule = (cls.showings, schedule)
+        return cls._cached_schedule[1]
 
-            except Exception as e:
-                print(e)
+    @classmethod
+    @metrics.timed('get_active_showings')
+    def get_active_showings(cls, viewer_age:int | None = None, max_price:int | None = None):
+        """Returns the showings that have not started and are not full, earliest first.
 
-        return active_showings
+        viewer_age keeps only the showings whose age group is below it and
+        max_price those whose ticket costs at most that."""
+        now = jdatetime.datetime.now().togregorian()
+        return cls.showings.search(now, viewer_age, max_price)
 
 
     @classmethod
-    def update_show(cls, self_showing):
-        """ update user information in users list file."""
-        for showing in cls.showings:
-            if showing['id'] == self_showing.showing_id:
-                showing['name'] = self_showing.movie_name
-                showing['age_group'] = self_showing.movie_age_group
-                showing['showing_capacity'] = self_showing.showing_capacity
-                showing['price'] = self_showing.price
-                showing['showing_time'] = self_showing.showing_time
-                showing['reserved_seat'] = self_showing.reserved_seat
-
-        data_dump(FILE_PATH, cls.showings)
-
+    def archive_showings(cls, before:jdatetime.datetime) -> int:
+        """Moves showings that started before a time into the monthly archive.
 
+        Returns the number of archived showings."""
+        past_showings = cls.showings.started_before(before.togregorian())
+        if not past_showings:
+            return 0
+        cls.archive.add(past_showings)
+        schedule = cls.hall_schedule()
+        for showing in past_showings:
+            cls.showings.delete(showing['id'])
+            schedule.remove(showing.get('hall'), showing['id'])
+        cls.showings.compact()
+        log.info(f'{len(past_showings)} showings archived.')
+        return len(past_showings)
 
+    @classmethod
+    def get_archived_showings(cls, first_month:tuple | None = None, last_month:tuple | None = None) -> list:
+        """Returns archived showings between two (year, month) pairs, inclusive."""
+        return list(cls.archive.query(first_month, last_month))
 
+    @classmethod
+    def update_show(cls, self_showing):
+        """ update user information in users list file."""
+        stored = cls.showings.get(self_showing.showing_id)
+        if stored is not None:
+            if (stored.get('hall'), stored['showing_time'], stored.get('duration', DEFAULT_DURATION)) != \
+                    (self_showing.hall, self_showing.showing_time, self_showing.duration):
+                cls._cached_schedule = None
+            seat_columns, reserved_seat = self_showing._seat_fields()
+            cls.showings.update(self_showing.showing_id, {
+                'name': self_showing.movie_name,
+                'age_group': self_showing.movie_age_group,
+                'showing_capacity': self_showing.showing_capacity,
+                'price': self_showing.price,
+                'showing_time': self_showing.showing_time,
+                'hall': self_showing.hall,
+                'duration': self_showing.duration,
+                'seat_columns': seat_columns,
+                'reserved_seat': reserved_seat,
+            })
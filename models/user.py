@@ -11,13 +11,17 @@ from uuid import uuid4
 import inspect
 import jdatetime
 
+import metrics
 from custom_log import logger as log
 from models.bank import BankAccount as Bank
 from exeptions import InvalidPasswordError, InvalidDateError, UsernameExistsError, PasswordsDoesNotMatchError, \
-    InvalidCredentialsError, InvalidAccountNumberError, InvalidChoiceError, InsufficientFundsError
+    InvalidCredentialsError, InvalidAccountNumberError, InvalidChoiceError, InsufficientFundsError, SeatUnavailableError, \
+    NegativeAmountError
 from models.cinema import Showing
-from utils import data_load, data_dump, hash_password, str_to_datetime, calculate_time_span, apply_discount, \
-    str_to_showimg_datetime
+from sessions import SessionCache
+from store import UserStore, open_store, transaction
+from utils import make_password, verify_password, password_needs_rehash, dummy_password_hash, str_to_datetime, \
+    calculate_time_span, apply_discount, LazyDatetime
 
 FILE_PATH = 'data/user.json'
 SUBSCRIPTION_DICT = {
@@ -35,10 +39,9 @@ def unique_username(func):
         bound_args.apply_defaults()
 
         username = bound_args.arguments.get('username') or bound_args.arguments.get('new_username')
-        for user in User.users:
-            if username == user['username']:
-                log.warning( "User '{}' already exists.".format(username))
-                raise UsernameExistsError
+        if User.users.find('username', username) is not None:
+            log.warning( "User '{}' already exists.".format(username))
+            raise UsernameExistsError
         return func(*args, **kwargs)
     return wrapper
 
@@ -49,17 +52,28 @@ class UserRole(Enum):
 class User:
     """A class to represent and manage users."""
 
-    users = data_load(FILE_PATH) or []
+    __slots__ = ('role', 'uid', 'username', 'phone_number', '_password', '_birth_date', '_birth_datetime',
+                 '_bank_account_numbers', '_bank_accounts', 'wallet_balance', 'subscription', 'cashback_count',
+                 '_cashback_date', 'cashback_percent', 'gift', '_created_at', 'is_hashed')
 
-    def __init__(self , username:str ,password:str, birth_date:str, phone_number:str = None, role = UserRole.USER)->None:
-        """Initializes a new user instance."""
+    users = open_store(UserStore, FILE_PATH)
+    sessions = SessionCache()
+    cashback_date = LazyDatetime('_cashback_date')
+    __created_at = LazyDatetime('_created_at')
+
+    def __init__(self , username:str ,password:str | None, birth_date:str, phone_number:str = None, role = UserRole.USER,
+                 password_hash:str | None = None)->None:
+        """Initializes a new user instance.
+
+        password_hash, from make_password, is used instead of hashing password when given."""
         self.role = role
         self.uid = str(uuid4())
         self.username = username
         self.phone_number = phone_number
-        self._password = hash_password(password)
+        self._password = password_hash or make_password(password)
         self.birth_date = birth_date
-        self.bank_accounts = []
+        self._bank_account_numbers = []
+        self._bank_accounts = []
         self.wallet_balance = 0
         self.subscription = 'bronze'
         self.cashback_count = 0
@@ -87,8 +101,42 @@ class User:
             raise PasswordsDoesNotMatchError
         return True
 
+    @property
+    def birth_date(self) -> str:
+        return self._birth_date
+
+    @birth_date.setter
+    def birth_date(self, birth_date:str):
+        self._birth_date = birth_date
+        self._birth_datetime = None
+
+    def get_birth_datetime(self) -> jdatetime.datetime:
+        """Returns the parsed birth date, parsing it only once per value."""
+        if self._birth_datetime is None:
+            self._birth_datetime = str_to_datetime(self._birth_date)
+        return self._birth_datetime
+
+    @property
+    def bank_accounts(self) -> list:
+        """The user's bank accounts, resolved from the bank store on first use."""
+        if self._bank_accounts is None:
+            self._bank_accounts = []
+            for account_number in self._bank_account_numbers:
+                bank_account = Bank.get_account(account_number)
+                if bank_account is None:
+                    log.warning(f'Bank account {account_number} of user {self.username} does not exist.')
+                    continue
+                self._bank_accounts.append(bank_account)
+        return self._bank_accounts
+
+    def get_bank_account_numbers(self) -> list:
+        """Returns the user's account numbers without loading the accounts."""
+        if self._bank_accounts is None:
+            return list(self._bank_account_numbers)
+        return [bank_account.account_number for bank_account in self._bank_accounts]
+
     def get_age(self)->int:
-        birth_date = str_to_datetime(self.birth_date)
+        birth_date = self.get_birth_datetime()
         now = jdatetime.datetime.now()
         age = calculate_time_span(birth_date , now).days // 365
         return int(age)
@@ -120,14 +168,14 @@ class User:
             'phone_number': self.phone_number,
             'password': self._password,
             'birth_date': self.birth_date,
-            'bank_accounts' : self.bank_accounts,
+            'bank_accounts' : self.get_bank_account_numbers(),
             'wallet_balance': self.wallet_balance,
             'subscription' : self.subscription,
             'cashback_count' : self.cashback_count,
-            'cashback_date' : self.cashback_date.isoformat(),
+            'cashback_date' : User.cashback_date.iso(self),
             'cashback_percent' : self.cashback_percent,
             'gift' : self.gift,
-            'created_at': self.__created_at.isoformat(),
+            'created_at': User.__created_at.iso(self),
             'is_hashed': self.is_hashed
         }
 
@@ -141,7 +189,12 @@ class User:
         user_instance._password = user_dict['password']
         user_instance.birth_date = user_dict['birth_date']
         user_instance.phone_number = user_dict['phone_number']
-        user_instance.bank_accounts = [Bank.from_dict(account) for account in user_dict['bank_accounts']]
+        # Older records embedded whole account dictionaries; only the number is kept.
+        user_instance._bank_account_numbers = [
+            account['account_number'] if isinstance(account, dict) else account
+            for account in user_dict['bank_accounts']
+        ]
+        user_instance._bank_accounts = None
         user_instance.wallet_balance = user_dict['wallet_balance']
         user_instance.subscription = user_dict['subscription']
         user_instance.cashback_count = user_dict['cashback_count']
@@ -149,30 +202,44 @@ class User:
         user_instance.gift = user_dict['gift']
         user_instance.is_hashed = user_dict['is_hashed']
 
-        iso_format = "%Y-%m-%dT%H:%M:%S.%f"
-        user_instance.cashback_date = jdatetime.datetime.strptime(user_dict['cashback_date'], iso_format)
-        user_instance.__created_at = jdatetime.datetime.strptime(user_dict['created_at'] , iso_format)
+        # Kept as stored; cashback_date and __created_at parse them on first read.
+        user_instance._cashback_date = user_dict['cashback_date']
+        user_instance._created_at = user_dict['created_at']
 
         return user_instance
 
+    def refresh_wallet(self):
+        """Re-reads the wallet and subscription fields from the users store."""
+        self.users.refresh()
+        user_dict = self.users.get(self.uid)
+        if user_dict is None:
+            return
+        self.wallet_balance = user_dict['wallet_balance']
+        self.subscription = user_dict['subscription']
+        self.cashback_count = user_dict['cashback_count']
+        self.cashback_date = user_dict['cashback_date']
+        self.cashback_percent = user_dict['cashback_percent']
+        self.gift = user_dict['gift']
+
     @classmethod
     def update_user(cls, self_user):
         """ update user information in users list file."""
-        for user in cls.users:
-            if user['uid'] == self_user.uid:
-                user['username'] = self_user.username
-                user['password'] = self_user._password
-                user['birth_date'] = self_user.birth_date
-                user['phone_number'] = self_user.phone_number
-                user['bank_accounts'] = [account.to_dict() for account in self_user.bank_accounts]
-                user['wallet_balance'] = self_user.wallet_balance
-                user['subscription'] = self_user.subscription
-                user['cashback_count'] = self_user.cashback_count
-                user['cashback_date'] = self_user.cashback_date.isoformat()
-                user['cashback_percent'] = self_user.cashback_percent
-                user['gift'] = self_user.gift
-
-        data_dump(FILE_PATH, cls.users)
+        if self_user.uid in cls.users:
+            cls.sessions.invalidate(self_user.uid, current=self_user)
+            cls.users.update(self_user.uid, {
+                'username': self_user.username,
+                'password': self_user._password,
+                'birth_date': self_user.birth_date,
+                'phone_number': self_user.phone_number,
+                'bank_accounts': self_user.get_bank_account_numbers(),
+                'wallet_balance': self_user.wallet_balance,
+                'subscription': self_user.subscription,
+                'cashback_count': self_user.cashback_count,
+                'cashback_date': User.cashback_date.iso(self_user),
+                'cashback_percent': self_user.cashback_percent,
+                'gift': self_user.gift,
+                'is_hashed': self_user.is_hashed,
+            })
 
     @classmethod
     @unique_username
@@ -180,22 +247,63 @@ class User:
         """ Registers a new user. """
         if cls._validate_password_length(password) and str_to_datetime(birth_date):
             user = cls(username, password, birth_date, phone_number)
-            cls.users.append(user.to_dict())
-            data_dump(FILE_PATH, cls.users)
+            cls.users.insert(user.to_dict())
             return user
 
     @classmethod
+    @metrics.timed('login')
     def login(cls , username:str , password:str) -> User | None:
         """ user login function. """
-        found_user = None
-        for user in cls.users:
-            if user['username'] == username and user['password'] == hash_password(password):
-                found_user = cls.from_dict(user)
-                return found_user
+        user = cls.users.find('username', username)
+        if user is None:
+            verify_password(password, dummy_password_hash())
+        elif verify_password(password, user['password'], user['is_hashed']):
+            if password_needs_rehash(user['password'], user['is_hashed']):
+                user = cls._rehash_password(user, password)
+            return cls.from_dict(user)
 
         log.warning('User {} not found.'.format(username))
         raise InvalidCredentialsError
 
+    @classmethod
+    def _rehash_password(cls , user_dict:dict , password:str) -> dict:
+        """Replaces a legacy or outdated password hash once its password has been verified."""
+        with cls.users.lock(user_dict['uid']):
+            cls.users.refresh()
+            current = cls.users.get(user_dict['uid'])
+            if current is None or current['password'] != user_dict['password']:
+                return current or user_dict
+            cls.users.update(user_dict['uid'], {'password': make_password(password), 'is_hashed': True})
+            log.info('Password hash of user {} upgraded.'.format(user_dict['username']))
+            return cls.users.get(user_dict['uid'])
+
+    @classmethod
+    def start_session(cls , username:str , password:str) -> str:
+        """Logs a user in and returns a session token for later calls."""
+        return cls.sessions.issue(cls.login(username, password))
+
+    @classmethod
+    def from_session(cls , token:str) -> User:
+        """Returns the user of a session token without checking the password again."""
+        session = cls.sessions.get(token)
+        if session is None:
+            log.warning('Session is unknown or has expired.')
+            raise InvalidCredentialsError
+        user = session.user
+        if user is None:
+            user_dict = cls.users.get(session.uid)
+            if user_dict is None:
+                cls.sessions.revoke(token)
+                log.warning('Session user no longer exists.')
+                raise InvalidCredentialsError
+            user = session.user = cls.from_dict(user_dict)
+        return user
+
+    @classmethod
+    def end_session(cls , token:str):
+        """Logs a session out."""
+        cls.sessions.revoke(token)
+
     @unique_username
     def update_username(self, new_username: str) -> bool:
         """Allows a logged-in user to updates a user's username."""
@@ -220,14 +328,15 @@ class User:
 
     def update_password(self, old_password: str, new_password: str, confirm_password: str) -> bool | None:
         """updates a user's password."""
-        if self._password != hash_password(old_password):
+        if not verify_password(old_password, self._password, self.is_hashed):
             log.warning('Old password does not match.')
             raise PasswordsDoesNotMatchError
 
         self._validate_password_length(new_password)
         self._validate_password_confirmation(new_password, confirm_password)
 
-        self._password = hash_password(new_password)
+        self._password = make_password(new_password)
+        self.is_hashed = True
         self.update_user(self)
         log.info('Password updated.')
         return True
@@ -241,9 +350,14 @@ class User:
 
     def charge_wallet(self , amount:int , bank_account , account_password:str , account_cvv2:int):
         """Charges the user's wallet by withdrawing from a bank account."""
-        bank_account.withdraw(amount , account_password , account_cvv2)
-        self.wallet_balance += amount
-        self.update_user(self)
+        if amount <= 0:
+            log.warning('Amount must be positive.')
+            raise NegativeAmountError
+        with self.users.lock(self.uid), transaction():
+            bank_account.withdraw(amount , account_password , account_cvv2)
+            self.refresh_wallet()
+            self.wallet_balance += amount
+            self.update_user(self)
 
     def deposit_to_bank_account(self , account_number:str , amount:int):
         """Deposits a specified amount into one of the user's bank accounts."""
@@ -267,71 +381,89 @@ class User:
         else:
             log.warning('Invalid Subscription Number. Please enter number of your subscription')
             raise InvalidChoiceError
-        if self.wallet_balance >= SUBSCRIPTION_DICT[subscription_type]:
-
-            self.wallet_balance -= SUBSCRIPTION_DICT[subscription_type]
-            self.subscription = subscription_type
-            if subscription_type == 'silver':
-                self.cashback_count = 3
-                self.cashback_percent = 20
-
-            if subscription_type == 'gold':
-                self.cashback_date = jdatetime.datetime.now() + jdatetime.timedelta(days=30)
-                self.cashback_percent = 50
-                self.gift = 'a free Soda'
+        with self.users.lock(self.uid):
+            self.refresh_wallet()
+            if self.wallet_balance >= SUBSCRIPTION_DICT[subscription_type]:
+
+                self.wallet_balance -= SUBSCRIPTION_DICT[subscription_type]
+                self.subscription = subscription_type
+                if subscription_type == 'silver':
+                    self.cashback_count = 3
+                    self.cashback_percent = 20
+
+                if subscription_type == 'gold':
+                    self.cashback_date = jdatetime.datetime.now() + jdatetime.timedelta(days=30)
+                    self.cashback_percent = 50
+                    self.gift = 'a free Soda'
+
+                self.update_user(self)
+                return True
+
+            else:
+                log.warning(f'User {self.username} has insufficient funds to buy {subscription_type} subscription.')
+                raise InsufficientFundsError
+
+    @metrics.timed('book_ticket')
+    def book_ticket(self , showing:Showing , seats:list | None = None):
+        """Handles the entire ticket booking process for a user.
+
+        Books the given seat numbers, or the best free seat when none are given.
+        The showing and the wallet are locked and re-read first, so concurrent
+        bookers in other threads or processes can never sell a seat twice, and
+        both are written in one transaction."""
+        with Showing.showings.lock(showing.showing_id), self.users.lock(self.uid), transaction():
+            showing.refresh_seats()
+            self.refresh_wallet()
+            if seats is None:
+                seats = showing.seat_map.best_adjacent(1)
+            if not seats or len(set(seats)) != len(seats) or \
+                    not all(showing.seat_map.is_free(seat) for seat in seats):
+                log.warning(f'Requested seats for {showing.movie_name} are not available.')
+                raise SeatUnavailableError
+
+            birth_date_obj = self.get_birth_datetime()
+            showing_time_obj = showing.get_showing_datetime()
+            now_obj = jdatetime.datetime.now()
+
+            # ۲. بررسی شرط تولد به صورت صحیح و خوانا
+            is_birthday_on_showing_date = (birth_date_obj.month == showing_time_obj.month and
+                                           birth_date_obj.day == showing_time_obj.day)
+
+            is_birthday_on_reserve_date = (birth_date_obj.month == now_obj.month and
+                                           birth_date_obj.day == now_obj.day)
+
+            birth_date_check = is_birthday_on_showing_date or is_birthday_on_reserve_date
+
+            membership_months = self.get_membership_months()
+
+            birth_day_discount = 0
+            if birth_date_check:
+                birth_day_discount = 50
+
+            final_price = apply_discount(showing.price, membership_months + birth_day_discount) * len(seats)
+
+            if final_price > self.wallet_balance:
+                log.warning(f'User {self.username} has insufficient funds to buy {showing.movie_name} ticket.')
+                raise InsufficientFundsError
+
+            showing.seat_map.reserve(self.uid, seats)
+            self.wallet_balance -= final_price
+
+            percent = lambda x : x/100
+            if self.subscription == 'silver' and self.cashback_count != 0:
+                self.wallet_balance += final_price * percent(self.cashback_percent)
+                self.cashback_count -=1
+                log.info(
+                         f"{self.cashback_percent}% of your purchase has been returned to your wallet as cashback.")
+                if self.cashback_count == 0:
+                    self.subscription = 'bronze'
+            if self.subscription == 'gold' and self.cashback_date != jdatetime.datetime.now():
+                self.wallet_balance += final_price * percent(self.cashback_percent)
+                log.info(
+                         f"{self.cashback_percent}% of your purchase has been returned to your wallet as cashback, along with {self.gift} for the movie.")
 
             self.update_user(self)
-            return True
-
-        else:
-            log.warning(f'User {self.username} has insufficient funds to buy {subscription_type} subscription.')
-            raise InsufficientFundsError
-
-    def book_ticket(self , showing:Showing):
-        """Handles the entire ticket booking process for a user."""
-        birth_date_obj = str_to_datetime(self.birth_date)
-        showing_time_obj = str_to_showimg_datetime(showing.showing_time)
-        now_obj = jdatetime.datetime.now()
-
-        # ۲. بررسی شرط تولد به صورت صحیح و خوانا
-        is_birthday_on_showing_date = (birth_date_obj.month == showing_time_obj.month and
-                                       birth_date_obj.day == showing_time_obj.day)
-
-        is_birthday_on_reserve_date = (birth_date_obj.month == now_obj.month and
-                                       birth_date_obj.day == now_obj.day)
-
-        birth_date_check = is_birthday_on_showing_date or is_birthday_on_reserve_date
-
-        membership_months = self.get_membership_months()
-
-        birth_day_discount = 0
-        if birth_date_check:
-            birth_day_discount = 50
-
-        final_price = apply_discount(showing.price, membership_months + birth_day_discount)
-
-        if final_price > self.wallet_balance:
-            log.warning(f'User {self.username} has insufficient funds to buy {showing.movie_name} ticket.')
-            raise InsufficientFundsError
-
-        self.wallet_balance -= final_price
-        showing.reserved_seat.append(self.uid)
-
-        percent = lambda x : x/100
-        if self.subscription == 'silver' and self.cashback_count != 0:
-            self.wallet_balance += final_price * percent(self.cashback_percent)
-            self.cashback_count -=1
-            log.info(
-                     f"{self.cashback_percent}% of your purchase has been returned to your wallet as cashback.")
-            if self.cashback_count == 0:
-                self.subscription = 'bronze'
-        if self.subscription == 'gold' and self.cashback_date != jdatetime.datetime.now():
-            self.wallet_balance += final_price * percent(self.cashback_percent)
-            log.info(
-                     f"{self.cashback_percent}% of your purchase has been returned to your wallet as cashback, along with {self.gift} for the movie.")
-
-        self.update_user(self)
-        Showing.update_show(showing)
+            Showing.update_show(showing)
 
     def __str__(self):
         """Returns a user-friendly string representation of the user."""
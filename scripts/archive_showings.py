@@ -0,0 +1,31 @@
+import argparse
+import os
+import sys
+
+import jdatetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from models.cinema import Showing
+from utils import str_to_datetime
+
+RECENT_DAYS = 7
+
+parser = argparse.ArgumentParser(description='Move past showings into the monthly archive')
+
+parser.add_argument('--before', type=str,
+                    help=f'Archive showings before this date ("YYYY-M-D"); default: {RECENT_DAYS} days ago')
+
+args = parser.parse_args()
+
+try:
+    if args.before:
+        cutoff = str_to_datetime(args.before)
+    else:
+        cutoff = jdatetime.datetime.now() - jdatetime.timedelta(days=RECENT_DAYS)
+
+    archived = Showing.archive_showings(cutoff)
+    print(f"{archived} showings archived to {Showing.archive.directory}")
+except Exception as e:
+    print(e)
@@ -0,0 +1,24 @@
+import argparse
+import os
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils import snapshot_dump, snapshot_stream, snapshot_format, SNAPSHOT_FORMATS
+
+parser = argparse.ArgumentParser(description='Convert a data file between snapshot formats')
+
+parser.add_argument('source', type=str, help='Data file to read, e.g. data/user.json')
+parser.add_argument('--to', type=str, choices=SNAPSHOT_FORMATS, help='Target snapshot format', required=True)
+parser.add_argument('--output', type=str, help='Target file (default: source with the new extension)')
+
+args = parser.parse_args()
+
+output = args.output or os.path.splitext(args.source)[0] + '.' + args.to
+if snapshot_format(output) != args.to:
+    parser.error(f"Output file '{output}' does not have a .{args.to} extension.")
+
+records = list(snapshot_stream(args.source))
+snapshot_dump(output, records)
+print(f"Converted {len(records)} records: {args.source} -> {output}")
@@ -0,0 +1,158 @@
+"""
+Imports users, and optionally one bank account each, from a CSV or
+JSON-lines file.
+
+Each row has username, password and birth_date, and may have phone_number
+and account_password (a 4-digit PIN that opens a bank account). Rows are
+read in batches: dates are checked with str_to_datetime, usernames against
+the store's index and the rows already read, and the passwords of the valid
+rows are hashed on a pool of processes. Nothing is written until the whole
+file has been read; then both stores are written in one transaction, so a
+failure leaves neither the users nor their accounts behind.
+
+    python scripts/import_users.py members.csv --rejects rejected.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from exeptions import InvalidDateError
+from models.bank import BankAccount, unique_account_number
+from models.user import User
+from store import transaction
+from utils import make_password, str_to_datetime, PASSWORD_COST
+
+BATCH_SIZE = 1000
+
+
+def read_rows(file_path: str, file_format: str):
+    """Yields the rows of a CSV or JSON-lines file as dictionaries."""
+    with open(file_path, newline='', encoding='utf8') as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+            return
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batches(rows, size: int):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def validate(row: dict, usernames: set) -> str | None:
+    """Returns why a row cannot be imported, or None."""
+    username = (row.get('username') or '').strip()
+    if not username:
+        return 'missing username'
+    if username in usernames or User.users.find('username', username) is not None:
+        return 'username exists'
+    if len(row.get('password') or '') < 4:
+        return 'password shorter than 4 characters'
+    account_password = row.get('account_password')
+    if account_password and not (len(account_password) == 4 and account_password.isdigit()):
+        return 'account password must be 4 digits'
+    try:
+        str_to_datetime(row.get('birth_date'))
+    except InvalidDateError:
+        return 'invalid birth date'
+    return None
+
+
+def hash_passwords(executor: ProcessPoolExecutor, workers: int, passwords: list, cost: int) -> list:
+    chunk_size = max(1, len(passwords) // (4 * workers))
+    return list(executor.map(make_password, passwords, [cost] * len(passwords), chunksize=chunk_size))
+
+
+def build_records(rows: list, password_hashes: list, account_numbers: set) -> tuple:
+    """Returns the user and bank account records of valid rows."""
+    users, accounts = [], []
+    for row, password_hash in zip(rows, password_hashes):
+        user = User(row['username'].strip(), None, row['birth_date'], row.get('phone_number') or None,
+                    password_hash=password_hash)
+        user_dict = user.to_dict()
+        if row.get('account_password'):
+            account_number = unique_account_number(BankAccount.accounts)
+            while account_number in account_numbers:
+                account_number = unique_account_number(BankAccount.accounts)
+            account_numbers.add(account_number)
+            accounts.append(BankAccount(user.uid, row['account_password'], account_number).to_dict())
+            user_dict['bank_accounts'] = [account_number]
+        users.append(user_dict)
+    return users, accounts
+
+
+def main() -> None:
+    # Worker processes import this module, so the import only runs under the __main__ guard.
+    parser = argparse.ArgumentParser(description='Import users and bank accounts from a CSV or JSON-lines file')
+
+    parser.add_argument('file', type=str, help='CSV or JSON-lines file of users')
+    parser.add_argument('--format', type=str, choices=('csv', 'jsonl'),
+                        help='File format; guessed from the extension by default')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows validated and hashed at a time')
+    parser.add_argument('--workers', type=int, default=None, help='Processes hashing passwords')
+    parser.add_argument('--cost', type=int, default=PASSWORD_COST,
+                        help='scrypt cost; a lower cost imports faster and is raised on each first login')
+    parser.add_argument('--rejects', type=str, help='Write rejected rows with the reason to this JSON-lines file')
+
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+
+    file_format = args.format or ('csv' if args.file.lower().endswith('.csv') else 'jsonl')
+    users, accounts, rejected = [], [], []
+    usernames, account_numbers = set(), set()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for batch in batches(read_rows(args.file, file_format), args.batch_size):
+                valid = []
+                for row in batch:
+                    reason = validate(row, usernames)
+                    if reason is None:
+                        usernames.add(row['username'].strip())
+                        valid.append(row)
+                    else:
+                        rejected.append({**row, 'reason': reason})
+                password_hashes = hash_passwords(executor, workers, [row['password'] for row in valid], args.cost)
+                batch_users, batch_accounts = build_records(valid, password_hashes, account_numbers)
+                users += batch_users
+                accounts += batch_accounts
+                print(f"{len(users)} users read, {len(rejected)} rejected")
+
+        with transaction():
+            taken = User.users.insert_many(users)
+            taken_uids = {user_dict['uid'] for user_dict in taken}
+            accounts = [account for account in accounts if account['owner_uid'] not in taken_uids]
+            taken_accounts = BankAccount.accounts.insert_many(accounts)
+            for account in taken_accounts:
+                User.users.delete(account['owner_uid'])
+        usernames_by_uid = {user_dict['uid']: user_dict['username'] for user_dict in users}
+        rejected += [{'username': user_dict['username'], 'reason': 'username exists'} for user_dict in taken]
+        rejected += [{'username': usernames_by_uid[account['owner_uid']], 'reason': 'account number taken'}
+                     for account in taken_accounts]
+        User.users.close()
+        BankAccount.accounts.close()
+
+        if args.rejects:
+            with open(args.rejects, 'w', encoding='utf8') as file:
+                for row in rejected:
+                    row.pop('password', None)
+                    row.pop('account_password', None)
+                    file.write(json.dumps(row) + '\n')
+        print(f"\nImported {len(users) - len(taken) - len(taken_accounts)} users and "
+              f"{len(accounts) - len(taken_accounts)} bank accounts; {len(rejected)} rows rejected.")
+    except Exception as e:
+        print(e)
+
+
+if __name__ == '__main__':
+    main()
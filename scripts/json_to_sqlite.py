@@ -0,0 +1,29 @@
+import argparse
+import os
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from sqlite_store import open_sqlite_store
+from store import UserStore, BankStore, ShowingStore, DATABASE_PATH
+
+DATA_FILES = (
+    (UserStore, 'data/user.json'),
+    (BankStore, 'data/bank.json'),
+    (ShowingStore, 'data/showings.json'),
+)
+
+parser = argparse.ArgumentParser(description='Copy the JSON data files into the SQLite database')
+parser.add_argument('--database', type=str, help='SQLite database path', default=DATABASE_PATH)
+
+args = parser.parse_args()
+
+for store_class, file_path in DATA_FILES:
+    json_store = store_class.load(file_path)
+    sqlite_store = open_sqlite_store(store_class, args.database)
+    with sqlite_store.database.transaction():
+        for record in json_store:
+            if record[store_class.primary_key] not in sqlite_store:
+                sqlite_store.insert(record)
+    print(f"{file_path}: {len(json_store)} records -> {store_class.table}")
@@ -1,4 +1,5 @@
 import argparse
+import csv
 import getpass
 import os
 import sys
@@ -7,10 +8,12 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 from custom_log import logger as log
-from exeptions import InvalidAccess
-from models.cinema import Showing, Movies
+from exeptions import InvalidAccess, InvalidDateError
+from models.cinema import Showing, Movies, DEFAULT_DURATION
 from models.user import User, UserRole
 
+SCHEDULE_FIELDS = ('movie', 'age_group', 'hall', 'times', 'price', 'capacity')
+
 
 def admin_login()-> User | None:
     """Handles admin login and role verification."""
@@ -28,17 +31,101 @@ def admin_login()-> User | None:
         log.warning("Access Denied: This user is not an admin.")
         raise InvalidAccess
 
+
+def read_schedule(file_path: str) -> list:
+    """Returns the rows of a CSV or YAML schedule file.
+
+    In CSV, several times of one row are separated by ';'. A YAML schedule
+    is a list of mappings whose times may also be a list."""
+    with open(file_path, newline='', encoding='utf8') as file:
+        if file_path.lower().endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(file) or []
+        return list(csv.DictReader(file))
+
+
+def schedule_showings(rows: list) -> tuple:
+    """Turns schedule rows into showings; returns them with a list of errors.
+
+    Every row is checked, and every showing against the stored showings and
+    the other rows, so all problems are reported at once."""
+    if not isinstance(rows, list):
+        return [], [f"the schedule must be a list of showings, not {type(rows).__name__}"]
+    showings, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append(f"row {number}: expected {', '.join(SCHEDULE_FIELDS)}")
+            continue
+        missing = [field for field in SCHEDULE_FIELDS if row.get(field) in (None, '')]
+        if missing:
+            errors.append(f"row {number}: missing {', '.join(missing)}")
+            continue
+        try:
+            age_group, price, capacity = int(row['age_group']), int(row['price']), int(row['capacity'])
+            duration = int(row.get('duration') or DEFAULT_DURATION)
+        except ValueError:
+            errors.append(f"row {number}: age_group, price, capacity and duration must be whole numbers")
+            continue
+        if price < 0 or capacity <= 0 or duration <= 0:
+            errors.append(f"row {number}: price must not be negative, capacity and duration must be positive")
+            continue
+        times = row['times'] if isinstance(row['times'], list) else str(row['times']).split(';')
+        movie = Movies(str(row['movie']), age_group)
+        for showing_time in (str(time).strip() for time in times):
+            showing = Showing(movie, capacity, price, showing_time, str(row['hall']), duration)
+            try:
+                showing.get_showing_datetime()
+            except InvalidDateError:
+                errors.append(f"row {number}: invalid time '{showing_time}'")
+                continue
+            showings.append(showing)
+
+    schedule = Showing.hall_schedule().copy()
+    for showing in showings:
+        start, end = showing.get_showing_datetime(), showing.get_end_datetime()
+        other = schedule.conflict(showing.hall, start, end)
+        if other is not None:
+            errors.append(f"{showing.movie_name} at {showing.showing_time} overlaps another showing "
+                          f"in hall {showing.hall}")
+            continue
+        schedule.add(showing.hall, start, end, showing.showing_id)
+    return showings, errors
+
+
 parser = argparse.ArgumentParser(description='Cinema Ticket Management')
 
-parser.add_argument('--movie-title' , type=str, help='Movie Title' , required=True)
-parser.add_argument('--time' , type=str, help='Showing time in "YYYY-M-D HH:MM" format' , required=True)
-parser.add_argument('--capacity' , type=int, help='Total number of seats' , required=True)
-parser.add_argument('--age-group' , type=int, help='Minimum age for the movie' , required=True)
-parser.add_argument('--price' , type=int, help='Ticket price' , required=True)
+parser.add_argument('--schedule' , type=str, help='CSV or YAML file of showings to create at once '
+                                                  f"(columns: {', '.join(SCHEDULE_FIELDS)}, duration)")
+parser.add_argument('--movie-title' , type=str, help='Movie Title')
+parser.add_argument('--time' , type=str, help='Showing time in "YYYY-M-D HH:MM" format')
+parser.add_argument('--capacity' , type=int, help='Total number of seats')
+parser.add_argument('--age-group' , type=int, help='Minimum age for the movie')
+parser.add_argument('--price' , type=int, help='Ticket price')
+parser.add_argument('--hall' , type=str, help='Hall of the showing')
+parser.add_argument('--duration' , type=int, default=DEFAULT_DURATION, help='Length of the showing in minutes')
 
 args = parser.parse_args()
 
+if args.schedule is None:
+    missing = [option for option, value in (('--movie-title', args.movie_title), ('--time', args.time),
+                                            ('--capacity', args.capacity), ('--age-group', args.age_group),
+                                            ('--price', args.price)) if value is None]
+    if missing:
+        parser.error(f"the following arguments are required without --schedule: {', '.join(missing)}")
+
 try:
+    if args.schedule:
+        showings, errors = schedule_showings(read_schedule(args.schedule))
+        if errors:
+            print('\n'.join(errors))
+            print(f"\n{len(errors)} problems found; no showings were created.")
+            sys.exit(1)
+
+        admin_login()
+        Showing.create_showings(showings)
+        print(f"\n{len(showings)} showings created successfully!")
+        sys.exit(0)
+
     admin_login()
 
     print(f"Creating showing for movie: {args.movie_title}")
@@ -48,8 +135,7 @@ try:
     print(f"Price: {args.price}")
 
     movie = Movies(args.movie_title , args.age_group)
-    Showing.create_showing(movie, args.capacity, args.price , args.time)
+    Showing.create_showing(movie, args.capacity, args.price , args.time, args.hall, args.duration)
     print("\nShowing created successfully!")
 except Exception as e:
     print(e)
-
@@ -0,0 +1,421 @@
+"""
+This module serves the cinema over HTTP with JSON bodies.
+
+It is built on asyncio streams from the standard library. The models and
+their stores block on file and lock I/O, so every call into them is handed
+to a thread pool and the event loop keeps serving other connections in the
+meantime. Connections are kept alive between requests.
+
+    python server.py --host 127.0.0.1 --port 8080 --workers 8
+
+Endpoints (request and response bodies are JSON):
+
+    POST /register             {username, password, birth_date, phone_number?}
+    POST /login                {username, password} -> {token, user}
+    POST /logout
+    POST /wallet/charge        {amount, account_number, account_password, cvv2}
+    POST /subscription         {subscription: "1" (silver) or "2" (gold)}
+    GET  /showings?age=&max_price=   upcoming showings with a free seat
+    GET  /metrics              JSON snapshot of metrics.py (CINEMA_METRICS=1 turns them on)
+    POST /showings/<id>/book   {seats?: [seat numbers]}
+
+The wallet, subscription, booking and logout endpoints authenticate with
+the token from /login (``Authorization: Bearer <token>``); HTTP basic
+credentials are accepted as well but hash the password on every call.
+
+Password hashing is slow on purpose, so /register and /login run on their
+own small pool: a storm of logins queues there instead of taking every
+worker away from the other endpoints.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import functools
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+import custom_log
+import metrics
+from custom_log import logger as log
+from exeptions import InvalidPasswordError, InvalidDateError, UsernameExistsError, InvalidCredentialsError, \
+    InvalidCvv2Error, NegativeAmountError, InvalidAccountNumberError, NotEnoughAmountError, InvalidChoiceError, \
+    InsufficientFundsError, InvalidAccess, SeatUnavailableError
+from models.cinema import Showing
+from models.user import User
+
+MAX_BODY_SIZE = 1 << 16
+LINGER_TIMEOUT = 2
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+DEFAULT_PASSWORD_WORKERS = os.cpu_count() or 1
+
+ERROR_STATUS = {
+    InvalidCredentialsError: HTTPStatus.UNAUTHORIZED,
+    InvalidAccess: HTTPStatus.FORBIDDEN,
+    UsernameExistsError: HTTPStatus.CONFLICT,
+    SeatUnavailableError: HTTPStatus.CONFLICT,
+    InsufficientFundsError: HTTPStatus.PAYMENT_REQUIRED,
+    NotEnoughAmountError: HTTPStatus.PAYMENT_REQUIRED,
+    InvalidPasswordError: HTTPStatus.BAD_REQUEST,
+    InvalidDateError: HTTPStatus.BAD_REQUEST,
+    InvalidCvv2Error: HTTPStatus.BAD_REQUEST,
+    NegativeAmountError: HTTPStatus.BAD_REQUEST,
+    InvalidAccountNumberError: HTTPStatus.BAD_REQUEST,
+    InvalidChoiceError: HTTPStatus.BAD_REQUEST,
+}
+
+
+class RequestError(Exception):
+    """Raised when a request cannot be served; carries the HTTP status to answer with."""
+
+    def __init__(self, status: HTTPStatus, message: str | None = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class Request:
+    """One parsed HTTP request."""
+
+    def __init__(self, method: str, path: str, version: str, headers: dict, body: bytes, query: str = ''):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+        self.query = {name: values[-1] for name, values in parse_qs(query).items()}
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    def json(self) -> dict:
+        """Returns the JSON object in the request body."""
+        if not self.body:
+            return {}
+        try:
+            payload = json.loads(self.body)
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Body is not valid JSON.')
+        if not isinstance(payload, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Body must be a JSON object.')
+        return payload
+
+
+def require(payload: dict, *fields: str) -> list:
+    """Returns the values of required body fields, in order."""
+    missing = [field for field in fields if field not in payload]
+    if missing:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Missing fields: {', '.join(missing)}.")
+    return [payload[field] for field in fields]
+
+
+def public_user(user: User) -> dict:
+    """Returns the fields of a user that may be sent to its owner."""
+    user_dict = user.to_dict()
+    del user_dict['password']
+    return user_dict
+
+
+def public_showing(showing_dict: dict) -> dict:
+    """Returns a showing record without the uids of the seat holders."""
+    return {
+        'id': showing_dict['id'],
+        'name': showing_dict['name'],
+        'age_group': showing_dict['age_group'],
+        'price': showing_dict['price'],
+        'showing_time': showing_dict['showing_time'],
+        'hall': showing_dict.get('hall'),
+        'showing_capacity': showing_dict['showing_capacity'],
+        'free_seats': showing_dict['showing_capacity'] - len(showing_dict['reserved_seat']),
+    }
+
+
+def authenticate(request: Request) -> User:
+    """Returns the user named by the request's session token or basic credentials."""
+    scheme, _, credentials = request.headers.get('authorization', '').partition(' ')
+    scheme = scheme.lower()
+    if scheme == 'bearer':
+        return User.from_session(credentials.strip())
+    if scheme != 'basic':
+        raise InvalidCredentialsError
+    try:
+        username, _, password = base64.b64decode(credentials).decode('utf8').partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        raise InvalidCredentialsError
+    return User.login(username, password)
+
+
+def register(request: Request) -> tuple:
+    payload = request.json()
+    username, password, birth_date = require(payload, 'username', 'password', 'birth_date')
+    user = User.register(username, password, birth_date, payload.get('phone_number'))
+    return HTTPStatus.CREATED, public_user(user)
+
+
+def login(request: Request) -> tuple:
+    username, password = require(request.json(), 'username', 'password')
+    token = User.start_session(username, password)
+    return HTTPStatus.OK, {'token': token, 'user': public_user(User.from_session(token))}
+
+
+def logout(request: Request) -> tuple:
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        raise InvalidCredentialsError
+    User.end_session(token.strip())
+    return HTTPStatus.OK, {}
+
+
+def charge_wallet(request: Request) -> tuple:
+    user = authenticate(request)
+    amount, account_number, account_password, cvv2 = require(
+        request.json(), 'amount', 'account_number', 'account_password', 'cvv2')
+    try:
+        amount = int(amount)
+    except (ValueError, TypeError):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'amount must be a whole number.')
+    if amount <= 0:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'amount must be positive.')
+    for bank_account in user.bank_accounts:
+        if bank_account.account_number == account_number:
+            user.charge_wallet(amount, bank_account, account_password, int(cvv2))
+            return HTTPStatus.OK, {'wallet_balance': user.wallet_balance}
+    raise InvalidAccountNumberError
+
+
+def buy_subscription(request: Request) -> tuple:
+    user = authenticate(request)
+    subscription_number, = require(request.json(), 'subscription')
+    user.change_subscription(str(subscription_number))
+    return HTTPStatus.OK, {'subscription': user.subscription, 'wallet_balance': user.wallet_balance}
+
+
+def query_int(request: Request, name: str) -> int | None:
+    """Returns a whole-number query parameter, or None when it is not given."""
+    value = request.query.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'{name} must be a whole number.')
+
+
+def list_showings(request: Request) -> tuple:
+    showings = Showing.get_active_showings(query_int(request, 'age'), query_int(request, 'max_price'))
+    return HTTPStatus.OK, [public_showing(showing_dict) for showing_dict in showings]
+
+
+def metrics_snapshot(request: Request) -> tuple:
+    return HTTPStatus.OK, metrics.snapshot()
+
+
+def book_ticket(request: Request, showing_id: str) -> tuple:
+    user = authenticate(request)
+    seats = request.json().get('seats')
+    if seats is not None and not (isinstance(seats, list) and all(isinstance(seat, int) for seat in seats)):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'seats must be a list of seat numbers.')
+    if seats is not None and len(set(seats)) != len(seats):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'seats must not repeat.')
+    showing_dict = Showing.showings.get(showing_id)
+    if showing_dict is None:
+        raise RequestError(HTTPStatus.NOT_FOUND, 'Showing not found.')
+    showing = Showing.from_dict(showing_dict)
+    user.book_ticket(showing, seats)
+    return HTTPStatus.OK, {'seats': showing.seat_map.seats_of(user.uid), 'wallet_balance': user.wallet_balance}
+
+
+ROUTES = (
+    ('POST', re.compile(r'^/register$'), register),
+    ('POST', re.compile(r'^/login$'), login),
+    ('POST', re.compile(r'^/logout$'), logout),
+    ('POST', re.compile(r'^/wallet/charge$'), charge_wallet),
+    ('POST', re.compile(r'^/subscription$'), buy_subscription),
+    ('GET', re.compile(r'^/showings$'), list_showings),
+    ('GET', re.compile(r'^/metrics$'), metrics_snapshot),
+    ('POST', re.compile(r'^/showings/(?P<showing_id>[^/]+)/book$'), book_ticket),
+)
+PASSWORD_HANDLERS = (register, login)
+
+
+def checks_password(request: Request, handler) -> bool:
+    """Tells whether a handler verifies a password, either its own or the request's basic credentials."""
+    scheme, _, _ = request.headers.get('authorization', '').partition(' ')
+    return handler.func in PASSWORD_HANDLERS or scheme.lower() == 'basic'
+
+
+def route(request: Request):
+    """Returns the handler of a request bound to the parameters of its path."""
+    path_matched = False
+    for method, pattern, handler in ROUTES:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        path_matched = True
+        if method == request.method:
+            return functools.partial(handler, request, **match.groupdict())
+    if path_matched:
+        raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED)
+    raise RequestError(HTTPStatus.NOT_FOUND)
+
+
+async def read_line(reader: asyncio.StreamReader, status: HTTPStatus) -> bytes:
+    """Reads one line of a request head; a line longer than the reader's limit is answered with status."""
+    try:
+        return await reader.readline()
+    except (asyncio.LimitOverrunError, ValueError):
+        raise RequestError(status)
+
+
+async def read_request(reader: asyncio.StreamReader) -> Request | None:
+    """Reads one request from a connection; returns None once the client has closed it."""
+    request_line = await read_line(reader, HTTPStatus.REQUEST_URI_TOO_LONG)
+    if not request_line.strip():
+        return None
+    try:
+        method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'Malformed request line.')
+    headers = {}
+    while True:
+        line = await read_line(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length.')
+    if length < 0:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length.')
+    if length > MAX_BODY_SIZE:
+        raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b''
+    path, _, query = target.partition('?')
+    return Request(method.upper(), path, version, headers, body, query)
+
+
+async def discard_input(reader: asyncio.StreamReader) -> None:
+    """Drops what the client is still sending, for at most LINGER_TIMEOUT seconds.
+
+    Closing a socket with unread input resets the connection, which can
+    destroy an error response the client has not read yet."""
+    async def read_to_end():
+        while await reader.read(MAX_BODY_SIZE):
+            pass
+
+    try:
+        await asyncio.wait_for(read_to_end(), LINGER_TIMEOUT)
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+
+
+def encode_response(status: HTTPStatus, payload, keep_alive: bool) -> bytes:
+    """Returns the bytes of a JSON response."""
+    body = json.dumps(payload).encode('utf8')
+    head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+class CinemaServer:
+    """The HTTP front end; blocking model calls run on a pool of worker threads."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080, workers: int = DEFAULT_WORKERS,
+                 password_workers: int = DEFAULT_PASSWORD_WORKERS):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cinema-worker')
+        self.password_executor = ThreadPoolExecutor(max_workers=password_workers,
+                                                    thread_name_prefix='cinema-password')
+        self.server = None
+
+    async def start(self) -> None:
+        """Starts listening; port 0 picks a free port, stored back in self.port."""
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        log.info(f'Serving on http://{self.host}:{self.port}')
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self) -> None:
+        """Stops accepting connections and waits for the running calls to finish."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+        self.password_executor.shutdown(wait=True)
+        custom_log.flush()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves the requests of one connection until either side closes it."""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except RequestError as error:
+                    writer.write(encode_response(error.status, {'error': str(error)}, keep_alive=False))
+                    await writer.drain()
+                    if writer.can_write_eof():
+                        writer.write_eof()
+                    await discard_input(reader)
+                    break
+                if request is None:
+                    break
+                status, payload = await self.dispatch(request)
+                writer.write(encode_response(status, payload, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Request) -> tuple:
+        """Runs the request's handler on a worker pool and turns errors into statuses."""
+        try:
+            handler = route(request)
+            executor = self.password_executor if checks_password(request, handler) else self.executor
+            return await asyncio.get_running_loop().run_in_executor(executor, handler)
+        except RequestError as error:
+            return error.status, {'error': str(error)}
+        except tuple(ERROR_STATUS) as error:
+            return ERROR_STATUS[type(error)], {'error': type(error).__name__}
+        except (ValueError, TypeError) as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except Exception:
+            log.exception(f'Request {request.method} {request.path} failed.')
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': HTTPStatus.INTERNAL_SERVER_ERROR.phrase}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Cinema Ticket HTTP service')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Threads running store I/O')
+    parser.add_argument('--password-workers', type=int, default=DEFAULT_PASSWORD_WORKERS,
+                        help='Threads hashing passwords for /register and /login')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(CinemaServer(args.host, args.port, args.workers, args.password_workers).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+This module keeps the sessions of logged-in users.
+
+Logging in issues a random token. The session cache maps each token to the
+uid and the hydrated User object, so an authenticated call neither hashes
+the password again nor rebuilds the user from its record. Sessions expire
+after SESSION_TTL seconds without use, and the least recently used ones
+are dropped once there are more than MAX_SESSIONS.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_TTL = 30 * 60
+MAX_SESSIONS = 10_000
+
+
+class Session:
+    """One issued token: whose it is, the cached user and when it expires."""
+
+    __slots__ = ('token', 'uid', 'user', 'expires_at')
+
+    def __init__(self, token: str, uid: str, user, expires_at: float):
+        self.token = token
+        self.uid = uid
+        self.user = user
+        self.expires_at = expires_at
+
+
+class SessionCache:
+    """Sessions by token, in least-recently-used order, with an idle timeout."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._tokens_by_uid = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def issue(self, user) -> str:
+        """Starts a session for a user and returns its token."""
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = Session(token, user.uid, user, self.clock() + self.ttl)
+            self._tokens_by_uid.setdefault(user.uid, set()).add(token)
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+        return token
+
+    def get(self, token: str) -> Session | None:
+        """Returns the live session of a token and extends it, or None.
+
+        The session's user is None when it has to be loaded again."""
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            now = self.clock()
+            if session.expires_at <= now:
+                self._drop(token)
+                return None
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(token)
+            return session
+
+    def revoke(self, token: str) -> None:
+        """Ends one session."""
+        with self._lock:
+            self._drop(token)
+
+    def invalidate(self, uid: str, current=None) -> None:
+        """Forgets the cached user objects of uid, except `current`, the one just saved.
+
+        The sessions stay valid and load the user again on their next use."""
+        with self._lock:
+            for token in self._tokens_by_uid.get(uid, ()):
+                session = self._sessions[token]
+                if session.user is not current:
+                    session.user = None
+
+    def _drop(self, token: str) -> None:
+        session = self._sessions.pop(token, None)
+        if session is None:
+            return
+        tokens = self._tokens_by_uid[session.uid]
+        tokens.discard(token)
+        if not tokens:
+            del self._tokens_by_uid[session.uid]
@@ -0,0 +1,363 @@
+"""
+This module implements the SQLite storage backend for the record stores.
+
+Every store maps to one table. The primary key, unique fields and indexed
+fields are real indexed columns and the full record is kept as JSON in a
+`data` column, so a lookup or an update touches a single row. Showing
+reservations live in their own `reservations` table with one row per seat,
+so booking a seat inserts one row instead of rewriting the showing.
+
+The stores expose the same interface as store.RecordStore and can be used
+wherever the models expect one. Record locks use a lock file per table next
+to the database file.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from locks import get_lock
+from store import showing_start, current_unit
+
+BUSY_TIMEOUT = 30
+
+
+class Database:
+    """A shared SQLite connection guarded by a lock."""
+
+    def __init__(self, db_path: str) -> None:
+        """Opens the database file and switches it to WAL mode.
+
+        A writer waits up to BUSY_TIMEOUT seconds for another process to
+        finish its write."""
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self._depth = 0
+
+    def execute(self, sql: str, params: tuple = ()) -> list:
+        """Runs one statement and returns its rows.
+
+        Outside a transaction the statement commits on its own, so a read
+        never holds the write lock."""
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """Groups the statements run inside the block into one commit.
+
+        Nested blocks join the outermost transaction. The outermost block
+        takes the write lock up front (BEGIN IMMEDIATE): a deferred
+        transaction that read first could not upgrade to a write while
+        another process writes, and SQLite fails that with SQLITE_BUSY at
+        once instead of waiting out the busy timeout."""
+        with self.lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield self.connection
+                finally:
+                    self._depth -= 1
+                return
+            self.connection.execute('BEGIN IMMEDIATE')
+            self._depth = 1
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            else:
+                self.connection.execute('COMMIT')
+            finally:
+                self._depth = 0
+
+    def close(self) -> None:
+        """Closes the underlying connection."""
+        with self.lock:
+            self.connection.close()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path: str) -> Database:
+    """Returns the shared Database for db_path, opening it on first use."""
+    with _databases_lock:
+        database = _databases.get(db_path)
+        if database is None:
+            database = _databases[db_path] = Database(db_path)
+        return database
+
+
+class SqliteStore:
+    """A record store kept in one SQLite table."""
+
+    derived_fields = ()
+
+    def __init__(self, schema, database: Database) -> None:
+        """Creates the table and indexes described by a store class if needed."""
+        self.database = database
+        self.table = schema.table
+        self.primary_key = schema.primary_key
+        self.unique_fields = tuple(schema.unique_fields)
+        self.indexed_fields = tuple(schema.indexed_fields)
+        self.columns = (self.primary_key, *self.unique_fields, *self.indexed_fields, *self.derived_fields)
+        self.record_locks = get_lock(f'{os.path.splitext(database.db_path)[0]}.{self.table}.lock')
+        self._create_table()
+
+    def _create_table(self) -> None:
+        """Creates the store's table and its indexes."""
+        column_sql = [f'{self.primary_key} TEXT PRIMARY KEY']
+        column_sql += [f'{field} TEXT UNIQUE' for field in self.unique_fields]
+        column_sql += [f'{field} TEXT' for field in self.indexed_fields + self.derived_fields]
+        column_sql.append('data TEXT NOT NULL')
+        with self.database.transaction() as connection:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({", ".join(column_sql)})')
+            existing = {row[1] for row in connection.execute(f'PRAGMA table_info({self.table})')}
+            added = [field for field in self.derived_fields if field not in existing]
+            for field in added:
+                connection.execute(f'ALTER TABLE {self.table} ADD COLUMN {field} TEXT')
+            for field in self.indexed_fields + self.derived_fields:
+                connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS {self.table}_{field} ON {self.table} ({field})')
+            if added:
+                for record in list(self):
+                    self._write(record, 'UPDATE')
+
+    def _column_value(self, record: dict, column: str):
+        """Returns the value of one indexed column for a record."""
+        return record[column]
+
+    def _encode(self, record: dict) -> tuple:
+        """Returns the column values for a record."""
+        return (*(self._column_value(record, column) for column in self.columns), json.dumps(record))
+
+    def _decode(self, data: str) -> dict:
+        """Returns the record stored in a data column."""
+        return json.loads(data)
+
+    def __len__(self) -> int:
+        return self.database.execute(f'SELECT COUNT(*) FROM {self.table}')[0][0]
+
+    def __iter__(self):
+        rows = self.database.execute(f'SELECT data FROM {self.table} ORDER BY rowid')
+        return (self._decode(data) for (data,) in rows)
+
+    def __contains__(self, key) -> bool:
+        rows = self.database.execute(
+            f'SELECT 1 FROM {self.table} WHERE {self.primary_key} = ?', (key,))
+        return bool(rows)
+
+    def lock(self, *keys):
+        """Returns a context manager that locks records against other threads and processes."""
+        return self.record_locks.hold(*keys)
+
+    def refresh(self) -> None:
+        """Every read already sees the committed rows; nothing to do."""
+
+    def get(self, key) -> dict | None:
+        """Returns the record with the given primary key, or None."""
+        return self.find(self.primary_key, key)
+
+    def find(self, field: str, value) -> dict | None:
+        """Returns the first record whose indexed field equals value, or None."""
+        if field not in self.columns:
+            raise KeyError(field)
+        rows = self.database.execute(
+            f'SELECT data FROM {self.table} WHERE {field} = ? LIMIT 1', (value,))
+        if not rows:
+            return None
+        return self._decode(rows[0][0])
+
+    def insert(self, record: dict) -> dict:
+        """Adds a new record."""
+        self._join_unit()
+        self._write(record, 'INSERT')
+        return record
+
+    def insert_many(self, records) -> list:
+        """Adds new records in one database transaction and returns those left
+        out because their key or a unique field is already taken."""
+        self._join_unit()
+        rejected = []
+        with self.database.transaction():
+            for record in records:
+                if any(self.database.execute(f'SELECT 1 FROM {self.table} WHERE {field} = ? LIMIT 1',
+                                             (record[field],))
+                       for field in (self.primary_key, *self.unique_fields)):
+                    rejected.append(record)
+                else:
+                    self._write(record, 'INSERT')
+        return rejected
+
+    def update(self, key, changes: dict) -> dict:
+        """Applies changes to one record."""
+        self._join_unit()
+        with self.database.transaction():
+            record = self.get(key)
+            if record is None:
+                raise KeyError(key)
+            record.update(changes)
+            self._write(record, 'UPDATE')
+        return record
+
+    def delete(self, key) -> None:
+        """Removes one record."""
+        self._join_unit()
+        with self.database.transaction() as connection:
+            cursor = connection.execute(f'DELETE FROM {self.table} WHERE {self.primary_key} = ?', (key,))
+            if cursor.rowcount == 0:
+                raise KeyError(key)
+
+    def records(self) -> list:
+        """Returns all records as a list, in insertion order."""
+        return list(self)
+
+    def compact(self) -> None:
+        """SQLite keeps its own files compact; nothing to do."""
+
+    def close(self) -> None:
+        """Every change is already committed; the shared connection stays open."""
+
+    def _join_unit(self) -> None:
+        """Runs the rest of a transaction() block inside one database transaction."""
+        unit = current_unit()
+        if unit is not None and self.database not in unit.databases:
+            unit.databases.add(self.database)
+            unit.resources.enter_context(self.database.transaction())
+
+    def _write(self, record: dict, verb: str) -> None:
+        """Writes a record's row: INSERT adds a new row, UPDATE rewrites the row with its primary key.
+
+        A key or unique field already taken by another row raises sqlite3.IntegrityError."""
+        columns = (*self.columns, 'data')
+        if verb == 'UPDATE':
+            assignments = ', '.join(f'{column} = ?' for column in columns)
+            self.database.execute(
+                f'UPDATE {self.table} SET {assignments} WHERE {self.primary_key} = ?',
+                (*self._encode(record), record[self.primary_key]))
+        else:
+            placeholders = ', '.join('?' * len(columns))
+            self.database.execute(
+                f'INSERT INTO {self.table} ({", ".join(columns)}) VALUES ({placeholders})', self._encode(record))
+
+
+class SqliteShowingStore(SqliteStore):
+    """Showings table plus a reservations table with one row per reserved seat.
+
+    The parsed start time is kept in an indexed start_time column, so
+    upcoming showings are read with one range query."""
+
+    derived_fields = ('start_time',)
+
+    def _column_value(self, record: dict, column: str):
+        if column == 'start_time':
+            start_time = showing_start(record)
+            return start_time.isoformat() if start_time else None
+        return super()._column_value(record, column)
+
+    def upcoming(self, after: datetime):
+        """Yields the showings starting after a (Gregorian) time, earliest first."""
+        yield from self._select_by_start('start_time > ?', after)
+
+    def started_before(self, before: datetime) -> list:
+        """Returns the showings that started before a (Gregorian) time, earliest first."""
+        return list(self._select_by_start('start_time < ?', before))
+
+    def search(self, after: datetime, viewer_age: int | None = None, max_price: float | None = None,
+               available: bool = True) -> list:
+        """Returns the showings starting after a (Gregorian) time, earliest first.
+
+        The filters run in the query: available keeps only showings with a
+        free seat, viewer_age only those whose age group is below it and
+        max_price those costing at most that."""
+        conditions, params = ['start_time > ?'], []
+        if available:
+            conditions.append("(SELECT COUNT(*) FROM reservations WHERE showing_id = "
+                              f"{self.table}.{self.primary_key}) < json_extract(data, '$.showing_capacity')")
+        if viewer_age is not None:
+            conditions.append("json_extract(data, '$.age_group') < ?")
+            params.append(viewer_age)
+        if max_price is not None:
+            conditions.append("json_extract(data, '$.price') <= ?")
+            params.append(max_price)
+        return list(self._select_by_start(' AND '.join(conditions), after, *params))
+
+    def _select_by_start(self, condition: str, moment: datetime, *params):
+        rows = self.database.execute(
+            f'SELECT data FROM {self.table} WHERE {condition} ORDER BY start_time', (moment.isoformat(), *params))
+        for (data,) in rows:
+            record = self._decode(data)
+            record['reserved_seat'] = self._reservations(record[self.primary_key])
+            yield record
+
+    def delete(self, key) -> None:
+        self._join_unit()
+        with self.database.transaction() as connection:
+            super().delete(key)
+            connection.execute('DELETE FROM reservations WHERE showing_id = ?', (key,))
+
+    def _create_table(self) -> None:
+        with self.database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS reservations ('
+                'showing_id TEXT NOT NULL, seat INTEGER NOT NULL, uid TEXT NOT NULL, '
+                'PRIMARY KEY (showing_id, seat))')
+            connection.execute('CREATE INDEX IF NOT EXISTS reservations_uid ON reservations (uid)')
+        super()._create_table()
+
+    def _encode(self, record: dict) -> tuple:
+        stored = {field: value for field, value in record.items() if field != 'reserved_seat'}
+        return super()._encode(stored)
+
+    def _reservations(self, showing_id) -> dict:
+        """Returns the reserved seats of a showing as {seat number (str): uid}."""
+        rows = self.database.execute(
+            'SELECT seat, uid FROM reservations WHERE showing_id = ? ORDER BY seat', (showing_id,))
+        return {str(seat): uid for seat, uid in rows}
+
+    def __iter__(self):
+        reserved = {}
+        for showing_id, seat, uid in self.database.execute(
+                'SELECT showing_id, seat, uid FROM reservations ORDER BY showing_id, seat'):
+            reserved.setdefault(showing_id, {})[str(seat)] = uid
+        for record in super().__iter__():
+            record['reserved_seat'] = reserved.get(record[self.primary_key], {})
+            yield record
+
+    def find(self, field: str, value) -> dict | None:
+        record = super().find(field, value)
+        if record is not None:
+            record['reserved_seat'] = self._reservations(record[self.primary_key])
+        return record
+
+    def _write(self, record: dict, verb: str) -> None:
+        """Writes the showing row and only the reservation rows that changed."""
+        showing_id = record[self.primary_key]
+        wanted = record.get('reserved_seat', {})
+        if isinstance(wanted, list):
+            wanted = {str(seat): uid for seat, uid in enumerate(wanted)}
+        with self.database.transaction() as connection:
+            super()._write(record, verb)
+            current = self._reservations(showing_id)
+            stale = [seat for seat, uid in current.items() if wanted.get(seat) != uid]
+            added = [(seat, uid) for seat, uid in wanted.items() if current.get(seat) != uid]
+            connection.executemany(
+                'DELETE FROM reservations WHERE showing_id = ? AND seat = ?',
+                [(showing_id, int(seat)) for seat in stale])
+            connection.executemany(
+                'INSERT INTO reservations (showing_id, seat, uid) VALUES (?, ?, ?)',
+                [(showing_id, int(seat), uid) for seat, uid in added])
+
+
+def open_sqlite_store(schema, db_path: str) -> SqliteStore:
+    """Opens the SQLite store for a store class in the database at db_path."""
+    store_class = SqliteShowingStore if schema.table == 'showings' else SqliteStore
+    return store_class(schema, get_database(db_path))
@@ -0,0 +1,749 @@
+"""
+This module defines the record stores used by the models.
+
+A store keeps its records in a dictionary keyed by the primary key and
+maintains one extra dictionary per unique field, so lookups by key or by an
+indexed field never have to scan every record.
+
+Stores opened on a data file persist every insert and update as one line in
+an append-only journal next to the snapshot (``data/user.json`` is journaled
+to ``data/user.journal.jsonl``). Loading replays the journal over the
+snapshot, and once the journal grows past ``JOURNAL_COMPACT_EVERY`` entries
+it is folded back into the snapshot file.
+
+Every store can lock single records (see locks.py). A change that reads a
+record and writes it back takes the record's lock and calls refresh()
+first, which replays whatever other processes journaled in the meantime.
+
+Changes made inside a transaction() block are committed together or not at
+all. Their journal entries are held back until the block ends and then
+written with one append per store. When several stores take part, the
+entries are tagged with the transaction id and bracketed by ``begin`` and
+``end`` lines in ``transactions.jsonl`` next to the data files; replay skips
+the entries of a transaction that began but never ended.
+
+The stores can also live in SQLite (see sqlite_store.py). open_store picks
+the backend named by the CINEMA_STORAGE_BACKEND environment variable:
+``json`` (the default) or ``sqlite``. It returns a LazyStore, so nothing is
+read until a model first touches its store.
+
+On the json backend the snapshot itself can be written as JSON, pickle or
+msgpack. CINEMA_SNAPSHOT_FORMAT sets the format for every store and
+CINEMA_<TABLE>_SNAPSHOT_FORMAT (for example CINEMA_USERS_SNAPSHOT_FORMAT)
+overrides it for one store. A store switched to a binary format keeps
+reading its JSON snapshot until the first compaction writes the new one.
+"""
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager, nullcontext, ExitStack
+from datetime import datetime
+
+import metrics
+from catalogue import ShowingCatalogue
+from exeptions import InvalidDateError
+from locks import get_lock
+from utils import str_to_showimg_datetime, journal_append, journal_read, journal_clear, journal_rewrite, group_commit, \
+    snapshot_dump, snapshot_stream, snapshot_path
+
+JOURNAL_COMPACT_EVERY = 500
+TRANSACTION_LOG = 'transactions.jsonl'
+TRANSACTION_LOG_TRIM_SIZE = 1 << 16
+STORAGE_BACKEND = os.environ.get('CINEMA_STORAGE_BACKEND', 'json')
+SNAPSHOT_FORMAT = os.environ.get('CINEMA_SNAPSHOT_FORMAT', 'json')
+DATABASE_PATH = 'data/cinema.db'
+
+
+def showing_start(record: dict) -> datetime | None:
+    """Returns a showing record's start as a Gregorian datetime, or None if unparsable."""
+    try:
+        return str_to_showimg_datetime(record.get('showing_time')).togregorian()
+    except InvalidDateError:
+        return None
+
+
+def journal_path_for(file_path: str) -> str:
+    """Returns the journal file path that belongs to a snapshot file."""
+    return os.path.splitext(file_path)[0] + '.journal.jsonl'
+
+
+def lock_path_for(file_path: str) -> str:
+    """Returns the lock file path that belongs to a snapshot file."""
+    return os.path.splitext(file_path)[0] + '.lock'
+
+
+def transaction_log_path_for(file_path: str) -> str:
+    """Returns the transaction log shared by the data files of a directory."""
+    return os.path.join(os.path.dirname(file_path), TRANSACTION_LOG)
+
+
+_log_states = {}
+_log_states_lock = threading.Lock()
+
+
+def unfinished_transactions(log_path: str) -> set:
+    """Returns the ids of the transactions in a log that began but never ended.
+
+    Only the lines added since the previous call are read; trimming
+    replaces the file, which starts the reading over."""
+    with get_lock(lock_path_for(log_path)).journal(), _log_states_lock:
+        try:
+            inode = os.stat(log_path).st_ino
+        except FileNotFoundError:
+            _log_states.pop(log_path, None)
+            return set()
+        state = _log_states.get(log_path)
+        if state is None or state[0] != inode:
+            state = _log_states[log_path] = (inode, [0], set())
+        _, offset, unfinished = state
+        entries, offset[0] = journal_read(log_path, offset[0])
+        for entry in entries:
+            if 'begin' in entry:
+                unfinished.add(entry['begin'])
+            else:
+                unfinished.discard(entry['end'])
+        return set(unfinished)
+
+
+def trim_transaction_log(log_path: str) -> None:
+    """Drops the finished transactions from a log once it has grown.
+
+    Entries of finished transactions replay whether or not the log still
+    names them, so only the unfinished ones have to be kept."""
+    try:
+        if os.path.getsize(log_path) < TRANSACTION_LOG_TRIM_SIZE:
+            return
+    except FileNotFoundError:
+        return
+    with get_lock(lock_path_for(log_path)).journal(exclusive=True):
+        entries, _ = journal_read(log_path)
+        ended = {entry['end'] for entry in entries if 'end' in entry}
+        journal_rewrite(log_path, [entry for entry in entries if 'begin' in entry and entry['begin'] not in ended])
+
+
+_units = threading.local()
+_open_units = set()
+_open_units_lock = threading.Lock()
+
+
+def current_unit():
+    """Returns the unit of work of the running transaction() block, or None."""
+    return getattr(_units, 'unit', None)
+
+
+@contextmanager
+def transaction():
+    """Groups the store changes made inside the block into one all-or-nothing commit.
+
+    Nested blocks join the outermost one."""
+    unit = current_unit()
+    if unit is not None:
+        yield unit
+        return
+    unit = _units.unit = UnitOfWork()
+    with _open_units_lock:
+        _open_units.add(unit)
+    try:
+        with unit.resources:
+            try:
+                yield unit
+            except BaseException:
+                unit.rollback()
+                raise
+            unit.commit()
+    finally:
+        unit.close()
+        _units.unit = None
+    unit.compact_full_journals()
+
+
+def held_versions(store) -> dict:
+    """Returns, by key, the last committed version of every record of a store
+    that an open transaction has changed; None for records it inserted."""
+    with _open_units_lock:
+        return {key: record for unit in _open_units for held_store, key, record in unit.undo.values()
+                if held_store is store}
+
+
+def rebase_held(store, key, record: dict | None) -> None:
+    """Makes a newly committed version of a record the one open transactions holding it roll back to."""
+    with _open_units_lock:
+        for unit in _open_units:
+            if (id(store), key) in unit.undo:
+                unit.undo[id(store), key] = (store, key, dict(record) if record is not None else None)
+
+
+class UnitOfWork:
+    """The store changes made inside one transaction() block.
+
+    Changes reach the in-memory stores straight away, so the block reads its
+    own writes, and the previous version of every touched record is kept to
+    undo them. Journal entries are held back until commit. SQLite stores
+    open one transaction per database instead and add it to `resources`,
+    which commits or rolls it back when the block ends."""
+
+    def __init__(self) -> None:
+        self.txn_id = uuid.uuid4().hex
+        self.entries = {}
+        self.undo = {}
+        self.databases = set()
+        self.resources = ExitStack()
+
+    def remember(self, store, key) -> None:
+        """Keeps the current version of a record the first time the unit touches it."""
+        undo_key = (id(store), key)
+        if undo_key not in self.undo:
+            record = store.get(key)
+            with _open_units_lock:
+                self.undo[undo_key] = (store, key, dict(record) if record is not None else None)
+
+    def add(self, store, entry: dict) -> None:
+        """Holds back a journal entry until commit."""
+        self.entries.setdefault(store, []).append(entry)
+
+    def rollback(self) -> None:
+        """Puts every touched record back the way it was before the block."""
+        for store, key, record in reversed(list(self.undo.values())):
+            if record is None:
+                store._remove(key)
+            else:
+                store._put(record)
+
+    def commit(self) -> None:
+        """Writes the held-back journal entries of every store at once."""
+        journaled = {store: entries for store, entries in self.entries.items() if store.file_path is not None}
+        try:
+            if len(journaled) == 1:
+                (store, entries), = journaled.items()
+                with store._files_lock():
+                    store._append_journal(entries, sync=False)
+                    self.close()
+                group_commit.request(store.journal_path)
+            elif journaled:
+                self._commit_journals(journaled)
+        except BaseException:
+            self.rollback()
+            raise
+
+    def close(self) -> None:
+        """Stops counting the unit's changes as pending.
+
+        Commits call it while still holding the journals, so a compaction
+        sees each change either as pending or as written, never as neither."""
+        with _open_units_lock:
+            _open_units.discard(self)
+
+    def _commit_journals(self, journaled: dict) -> None:
+        """Appends the entries of several stores between begin and end lines of the transaction log.
+
+        The journals are held exclusively meanwhile, so no reader ever sees
+        a transaction that is still being written. They are synced before
+        the end line is written, and the end line after the locks are let go."""
+        stores = sorted(journaled, key=lambda store: store.record_locks.lock_path)
+        log_paths = sorted({store.transaction_log_path for store in stores})
+        with ExitStack() as held:
+            for store in stores:
+                held.enter_context(store._files_lock(exclusive=True))
+            for log_path in log_paths:
+                held.enter_context(get_lock(lock_path_for(log_path)).journal())
+                journal_append(log_path, {'begin': self.txn_id}, sync=False)
+            for store in stores:
+                store._append_journal([{**entry, 'txn': self.txn_id} for entry in journaled[store]], sync=False)
+            for store in stores:
+                group_commit.request(store.journal_path)
+            for log_path in log_paths:
+                journal_append(log_path, {'end': self.txn_id}, sync=False)
+            self.close()
+        for log_path in log_paths:
+            group_commit.request(log_path)
+            trim_transaction_log(log_path)
+
+    def compact_full_journals(self) -> None:
+        """Compacts the journals that the commit pushed past JOURNAL_COMPACT_EVERY."""
+        for store in self.entries:
+            if store.file_path is not None and store.journal_size >= JOURNAL_COMPACT_EVERY:
+                store.compact()
+
+
+class RecordStore:
+    """A keyed collection of record dictionaries with unique field indexes."""
+
+    table = None
+    primary_key = 'id'
+    unique_fields = ()
+    indexed_fields = ()
+
+    def __init__(self, records: list | None = None, file_path: str | None = None) -> None:
+        """Initializes the store and indexes the given records.
+
+        Without a file_path the store lives only in memory."""
+        self.file_path = file_path
+        self.journal_path = journal_path_for(file_path) if file_path else None
+        self.transaction_log_path = transaction_log_path_for(file_path) if file_path else None
+        self.journal_size = 0
+        self.record_locks = get_lock(lock_path_for(file_path) if file_path else None)
+        self._files_mutex = threading.RLock()
+        self._journal_offset = 0
+        self._journal_lines = 0
+        self._snapshot_seen = None
+        self._clear()
+        with self._bulk():
+            for record in records or []:
+                self._put(record)
+
+    @classmethod
+    def load(cls, file_path: str):
+        """Creates a store from a snapshot file and replays its journal."""
+        store = cls(file_path=file_path)
+        with store._files_lock():
+            store._read_files()
+        return store
+
+    def lock(self, *keys):
+        """Returns a context manager that locks records against other threads and processes.
+
+        Changes that read a record and write it back based on what they read
+        should hold its lock and call refresh() first."""
+        return self.record_locks.hold(*keys)
+
+    def refresh(self) -> None:
+        """Picks up the changes other processes journaled since the files were last read."""
+        if self.file_path is None:
+            return
+        with self._files_lock():
+            self._catch_up()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def __contains__(self, key) -> bool:
+        return key in self._records
+
+    def get(self, key) -> dict | None:
+        """Returns the record with the given primary key, or None."""
+        return self._records.get(key)
+
+    def find(self, field: str, value) -> dict | None:
+        """Returns the record whose indexed field equals value, or None."""
+        key = self._indexes[field].get(value)
+        if key is None:
+            return None
+        return self._records[key]
+
+    def insert(self, record: dict) -> dict:
+        """Adds a new record, indexes it and persists it."""
+        self._remember(record[self.primary_key])
+        self._put(record)
+        self._persist(record)
+        return record
+
+    def insert_many(self, records) -> list:
+        """Adds new records in bulk and returns those left out because their key
+        or a unique field is already taken.
+
+        On a data file the records are written with one snapshot instead of
+        one journal line each; inside a transaction they are journaled as usual."""
+        if self.file_path is None or current_unit() is not None:
+            return self._insert_new(records, self.insert)
+        with self._files_lock(exclusive=True):
+            self._catch_up()
+            with self._bulk():
+                rejected = self._insert_new(records, self._put)
+            self.compact()
+        return rejected
+
+    def update(self, key, changes: dict) -> dict:
+        """Applies changes to a record, keeping the indexes in step, and persists it."""
+        record = self._records[key]
+        self._remember(key)
+        self._put({**record, **changes})
+        record = self._records[key]
+        self._persist(record)
+        return record
+
+    def delete(self, key) -> None:
+        """Removes a record and its index entries, and persists the removal."""
+        if key not in self._records:
+            raise KeyError(key)
+        self._remember(key)
+        self._remove(key)
+        self._journal({'op': 'delete', 'key': key})
+
+    def records(self) -> list:
+        """Returns all records as a list, in insertion order."""
+        return list(self._records.values())
+
+    def compact(self) -> None:
+        """Writes every record to the snapshot file and clears the journal."""
+        if self.file_path is None:
+            return
+        with self._files_lock(exclusive=True), metrics.timer('store_compact', table=self.table):
+            self._catch_up()
+            snapshot_dump(self.file_path, self._committed_records())
+            journal_clear(self.journal_path)
+            self.journal_size = self._journal_lines = self._journal_offset = 0
+            self._snapshot_seen = self._snapshot_signature()
+
+    def _committed_records(self) -> list:
+        """Returns the records as last committed, without the changes of open transactions."""
+        records = dict(self._records)
+        for key, record in held_versions(self).items():
+            if record is None:
+                records.pop(key, None)
+            else:
+                records[key] = record
+        return list(records.values())
+
+    def close(self) -> None:
+        """Makes sure every journaled change has reached the disk."""
+        if self.file_path is not None:
+            group_commit.flush()
+
+    def _clear(self) -> None:
+        """Drops every record and index entry from memory."""
+        self._records = {}
+        self._indexes = {field: {} for field in self.unique_fields}
+
+    @contextmanager
+    def _files_lock(self, exclusive: bool = False):
+        """Guards the snapshot and journal files against this and other processes."""
+        with self._files_mutex, self.record_locks.journal(exclusive):
+            yield
+
+    def _snapshot_source(self) -> str:
+        """Returns the snapshot file to read; a binary snapshot not written yet falls back to JSON."""
+        json_path = snapshot_path(self.file_path, 'json')
+        if not os.path.exists(self.file_path) and os.path.exists(json_path):
+            return json_path
+        return self.file_path
+
+    def _snapshot_signature(self) -> tuple | None:
+        """Identifies the snapshot file on disk; compaction always replaces it with a new one."""
+        for path in (self.file_path, snapshot_path(self.file_path, 'json')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return path, stat.st_ino, stat.st_mtime_ns, stat.st_size
+        return None
+
+    def _read_files(self) -> None:
+        """Loads the records from the snapshot file and replays the journal over them.
+
+        Snapshot records are streamed and indexed one at a time. Records an
+        open transaction has changed keep their pending version."""
+        with metrics.timer('store_load', table=self.table):
+            pending = {key: self._records.get(key) for key in held_versions(self)}
+            self._clear()
+            self._snapshot_seen = self._snapshot_signature()
+            with self._bulk():
+                for record in snapshot_stream(self._snapshot_source()):
+                    self._put(record)
+                for key in pending:
+                    rebase_held(self, key, self._records.get(key))
+                self._journal_offset = self._journal_lines = 0
+                self._catch_up()
+                for key, record in pending.items():
+                    if record is None:
+                        self._remove(key)
+                    else:
+                        self._put(record)
+        if metrics.enabled():
+            metrics.gauge('store_records', 'Records held by a store').set(len(self._records), table=self.table)
+
+    def _catch_up(self) -> None:
+        """Replays the journal entries written since the last read.
+
+        Entries this store wrote itself are replayed too, which is harmless:
+        the journal order is the order the changes were made in. Records an
+        open transaction has changed are left alone; the entry becomes the
+        version it rolls back to instead."""
+        if self._snapshot_signature() != self._snapshot_seen:
+            self._read_files()
+            return
+        entries, self._journal_offset = journal_read(self.journal_path, self._journal_offset)
+        unfinished = None
+        held = held_versions(self) if entries else {}
+        for entry in entries:
+            if 'txn' in entry:
+                if unfinished is None:
+                    unfinished = unfinished_transactions(self.transaction_log_path)
+                if entry['txn'] in unfinished:
+                    continue
+            key = entry['key'] if entry['op'] == 'delete' else entry['record'][self.primary_key]
+            if key in held:
+                rebase_held(self, key, entry.get('record'))
+            elif entry['op'] == 'delete':
+                self._remove(key)
+            else:
+                self._put(entry['record'])
+        self._journal_lines += len(entries)
+        self.journal_size = self._journal_lines
+
+    def _bulk(self):
+        """Returns a context manager around putting many records at once."""
+        return nullcontext()
+
+    def _insert_new(self, records, put) -> list:
+        """Puts the records whose key and unique fields are free; returns the others."""
+        rejected = []
+        for record in records:
+            if record[self.primary_key] in self._records or any(
+                    record[field] in self._indexes[field] for field in self.unique_fields):
+                rejected.append(record)
+            else:
+                put(record)
+        return rejected
+
+    def _put(self, record: dict) -> None:
+        """Stores a record in memory, replacing any record with the same key."""
+        key = record[self.primary_key]
+        old_record = self._records.get(key)
+        for field, index in self._indexes.items():
+            if old_record is not None and old_record[field] != record[field]:
+                index.pop(old_record[field], None)
+            index[record[field]] = key
+        if old_record is record:
+            return
+        if old_record is not None:
+            old_record.clear()
+            old_record.update(record)
+        else:
+            self._records[key] = record
+
+    def _remove(self, key) -> None:
+        """Drops a record from memory, if present."""
+        record = self._records.pop(key, None)
+        if record is None:
+            return
+        for field, index in self._indexes.items():
+            if index.get(record[field]) == key:
+                del index[record[field]]
+
+    def _persist(self, record: dict) -> None:
+        """Journals one stored record."""
+        self._journal({'op': 'put', 'record': record})
+
+    def _remember(self, key) -> None:
+        """Lets the running transaction keep the record's current version, if one is running."""
+        unit = current_unit()
+        if unit is not None:
+            unit.remember(self, key)
+
+    def _journal(self, entry: dict) -> None:
+        """Appends a journal entry and compacts the journal when it grows too long.
+
+        Inside a transaction the entry is held back until commit."""
+        unit = current_unit()
+        if unit is not None:
+            unit.add(self, entry)
+            return
+        if self.file_path is None:
+            return
+        self._append_journal([entry])
+        if self.journal_size >= JOURNAL_COMPACT_EVERY:
+            self.compact()
+
+    def _append_journal(self, entries: list, sync: bool = True) -> None:
+        """Appends entries to the journal in one write.
+
+        The sync waits outside the files lock, so writers that queue up behind
+        one another share one fsync instead of taking turns at it."""
+        with self._files_lock():
+            journal_append(self.journal_path, *entries, sync=False)
+            self.journal_size += len(entries)
+        if sync:
+            group_commit.request(self.journal_path)
+
+
+class UserStore(RecordStore):
+    """User records indexed by uid and by username."""
+
+    table = 'users'
+    primary_key = 'uid'
+    unique_fields = ('username',)
+
+
+class BankStore(RecordStore):
+    """Bank account records indexed by account number."""
+
+    table = 'bank_accounts'
+    primary_key = 'account_number'
+
+
+class ShowingStore(RecordStore):
+    """Showing records indexed by showing id and ordered by start time.
+
+    Start times are parsed once, when a record is stored, and every showing
+    is mirrored in a columnar ShowingCatalogue kept in start order (see
+    catalogue.py), so upcoming(), started_before() and search() bisect past
+    every showing that has already started."""
+
+    table = 'showings'
+    primary_key = 'id'
+
+    def _clear(self) -> None:
+        super()._clear()
+        self.catalogue = ShowingCatalogue()
+
+    def _bulk(self):
+        return self.catalogue.bulk()
+
+    def upcoming(self, after: datetime):
+        """Yields the showings starting after a (Gregorian) time, earliest first."""
+        for key in self.catalogue.after(after):
+            yield self._records[key]
+
+    def started_before(self, before: datetime) -> list:
+        """Returns the showings that started before a (Gregorian) time, earliest first."""
+        return [self._records[key] for key in self.catalogue.before(before)]
+
+    def search(self, after: datetime, viewer_age: int | None = None, max_price: float | None = None,
+               available: bool = True) -> list:
+        """Returns the showings starting after a (Gregorian) time, earliest first.
+
+        available keeps only showings with a free seat, viewer_age only those
+        whose age group is below it and max_price those costing at most that."""
+        return [self._records[key] for key in self.catalogue.search(after, viewer_age, max_price, available)]
+
+    def _put(self, record: dict) -> None:
+        super()._put(record)
+        key = record[self.primary_key]
+        self.catalogue.put(key, self._records[key], showing_start(self._records[key]))
+
+    def _remove(self, key) -> None:
+        super()._remove(key)
+        self.catalogue.remove(key)
+
+
+class ShowingArchive:
+    """Past showings partitioned into one snapshot file per (Jalali) month.
+
+    Partitions are named showings-YYYY-MM.<format> inside the archive
+    directory, so a report over a date range only reads the months it
+    covers."""
+
+    PARTITION_PATTERN = re.compile(r'^showings-(\d{4})-(\d{2})\.(\w+)$')
+
+    def __init__(self, directory: str, snapshot_format: str = 'json') -> None:
+        self.directory = directory
+        self.snapshot_format = snapshot_format
+
+    def partition_path(self, year: int, month: int) -> str:
+        """Returns the file holding the showings of one month."""
+        return os.path.join(self.directory, f'showings-{year:04d}-{month:02d}.{self.snapshot_format}')
+
+    def months(self) -> list:
+        """Returns the (year, month) of every existing partition, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        months = []
+        for name in names:
+            match = self.PARTITION_PATTERN.match(name)
+            if match and match.group(3) == self.snapshot_format:
+                months.append((int(match.group(1)), int(match.group(2))))
+        return sorted(months)
+
+    def add(self, records: list) -> None:
+        """Writes showing records into their month partitions.
+
+        Records already archived under the same id are replaced, so running
+        an interrupted archival again does not duplicate showings."""
+        by_month = {}
+        for record in records:
+            start_time = str_to_showimg_datetime(record['showing_time'])
+            by_month.setdefault((start_time.year, start_time.month), []).append(record)
+        os.makedirs(self.directory, exist_ok=True)
+        for (year, month), month_records in by_month.items():
+            path = self.partition_path(year, month)
+            partition = {record['id']: record for record in snapshot_stream(path)}
+            partition.update((record['id'], record) for record in month_records)
+            snapshot_dump(path, list(partition.values()))
+
+    def query(self, first_month: tuple | None = None, last_month: tuple | None = None):
+        """Yields archived showings of the months between first_month and last_month."""
+        for month in self.months():
+            if first_month is not None and month < first_month:
+                continue
+            if last_month is not None and month > last_month:
+                continue
+            yield from snapshot_stream(self.partition_path(*month))
+
+
+class LazyStore:
+    """A store that is opened on first access instead of at import time."""
+
+    def __init__(self, store_class, file_path: str) -> None:
+        """Remembers what to open without reading anything yet."""
+        self.store_class = store_class
+        self.file_path = file_path
+        self._store = None
+        self._open_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._store is not None
+
+    @property
+    def store(self):
+        """Returns the underlying store, opening it on first use (once, even across threads)."""
+        store = self._store
+        if store is None:
+            with self._open_lock:
+                if self._store is None:
+                    self._store = _open_backend(self.store_class, self.file_path)
+                store = self._store
+        return store
+
+    def reload(self) -> None:
+        """Closes the store and opens it again from its files."""
+        with self._open_lock:
+            self._close()
+            self._store = _open_backend(self.store_class, self.file_path)
+
+    def close(self) -> None:
+        """Flushes and drops the loaded records; the next access reopens them."""
+        with self._open_lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __contains__(self, key) -> bool:
+        return key in self.store
+
+
+def configured_snapshot_format(store_class) -> str:
+    """Returns the snapshot format configured for a store class."""
+    variable = f'CINEMA_{store_class.table.upper()}_SNAPSHOT_FORMAT'
+    return os.environ.get(variable, SNAPSHOT_FORMAT)
+
+
+def _open_backend(store_class, file_path: str):
+    """Opens the store for a store class on the configured backend."""
+    if STORAGE_BACKEND == 'sqlite':
+        from sqlite_store import open_sqlite_store
+        return open_sqlite_store(store_class, DATABASE_PATH)
+    return store_class.load(snapshot_path(file_path, configured_snapshot_format(store_class)))
+
+
+def open_store(store_class, file_path: str) -> LazyStore:
+    """Returns a lazily opened persistent store for a store class."""
+    return LazyStore(store_class, file_path)
@@ -1,19 +1,22 @@
 import unittest
+from unittest import mock
 
 from exeptions import NegativeAmountError, InsufficientFundsError, NotEnoughAmountError, InvalidPasswordError, \
     InvalidAccountNumberError
-from models.bank import BankAccount
+from models.bank import BankAccount, unique_account_number
+from store import BankStore
 
 
 class TestBankModel(unittest.TestCase):
     def setUp(self):
         self.original_bank_accounts = BankAccount.accounts
-        BankAccount.accounts = []
+        BankAccount.accounts = BankStore()
 
         self.test_bank_account = BankAccount.create_account('owner uid',
                                                             '1234', )
 
         self.test_bank_account.balance = 50
+        BankAccount.update_account(self.test_bank_account)
 
     def tearDown(self):
         BankAccount.accounts = self.original_bank_accounts
@@ -66,3 +69,24 @@ class TestBankModel(unittest.TestCase):
         with self.assertRaises(InvalidAccountNumberError):
             self.test_bank_account.transfer(20, '1234', cvv2, '12345678')
         self.assertEqual(self.test_bank_account.balance, 50)
+
+    def test_transfer_credits_destination_account(self):
+        cvv2 = self.test_bank_account.cvv2
+        destination_account = BankAccount.create_account('owner uid2', '1234')
+
+        self.test_bank_account.transfer(20, '1234', cvv2, destination_account.account_number)
+        self.assertEqual(BankAccount.get_account(destination_account.account_number).balance, 20)
+
+    def test_transfer_fails_without_crediting_destination(self):
+        cvv2 = self.test_bank_account.cvv2
+        destination_account = BankAccount.create_account('owner uid2', '1234')
+
+        with self.assertRaises(NotEnoughAmountError):
+            self.test_bank_account.transfer(45, '1234', cvv2, destination_account.account_number)
+        self.assertEqual(BankAccount.get_account(self.test_bank_account.account_number).balance, 50)
+        self.assertEqual(BankAccount.get_account(destination_account.account_number).balance, 0)
+
+    def test_unique_account_number_skips_existing_numbers(self):
+        existing_number = self.test_bank_account.account_number
+        with mock.patch('models.bank.random.randint', side_effect=[int(existing_number), 12345678]):
+            self.assertEqual(unique_account_number(BankAccount.accounts), '12345678')
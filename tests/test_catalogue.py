@@ -0,0 +1,93 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+import catalogue
+from catalogue import ShowingCatalogue
+
+
+class CatalogueSearchTests:
+    use_numpy = None
+
+    def setUp(self):
+        self.catalogue = ShowingCatalogue(self.use_numpy)
+        self.now = datetime(2025, 1, 1)
+
+    def put(self, key, hours, capacity=10, reserved=0, age_group=0, price=10):
+        record = {'showing_capacity': capacity, 'reserved_seat': {str(seat): 'uid' for seat in range(reserved)},
+                  'age_group': age_group, 'price': price}
+        self.catalogue.put(key, record, self.now + timedelta(hours=hours) if hours is not None else None)
+
+    def test_search_filters_and_orders_by_start(self):
+        self.put('late', 5)
+        self.put('past', -1)
+        self.put('full', 2, capacity=3, reserved=3)
+        self.put('adults', 3, age_group=18)
+        self.put('dear', 4, price=50)
+        self.put('early', 1)
+        self.put('unparsable', None)
+
+        self.assertEqual(self.catalogue.search(self.now), ['early', 'adults', 'dear', 'late'])
+        self.assertEqual(self.catalogue.search(self.now, viewer_age=12, max_price=20), ['early', 'late'])
+        self.assertEqual(self.catalogue.search(self.now, available=False), ['early', 'full', 'adults', 'dear', 'late'])
+
+    def test_put_updates_and_remove_moves_the_last_row(self):
+        for hours in range(1, 6):
+            self.put(f'show-{hours}', hours)
+        self.put('show-1', 1, capacity=1, reserved=1)
+        self.catalogue.remove('show-2')
+        self.catalogue.remove('missing')
+
+        self.assertEqual(len(self.catalogue), 4)
+        self.assertNotIn('show-2', self.catalogue)
+        self.assertEqual(self.catalogue.search(self.now), ['show-3', 'show-4', 'show-5'])
+
+    def test_rows_stay_in_start_order_when_rescheduled(self):
+        for key, hours in (('b', 2), ('past', -3), ('a', 1), ('c', 3)):
+            self.put(key, hours)
+        self.put('a', 4)
+        self.put('c', 3, reserved=10)
+
+        self.assertEqual(self.catalogue.after(self.now), ['b', 'c', 'a'])
+        self.assertEqual(self.catalogue.before(self.now + timedelta(hours=3)), ['past', 'b'])
+        self.assertEqual(self.catalogue.search(self.now), ['b', 'a'])
+
+    def test_bulk_sorts_once_at_the_end(self):
+        self.put('a', 1)
+        with self.catalogue.bulk():
+            self.put('c', 3)
+            self.put('b', 2)
+            self.put('a', 4)
+            self.put('gone', 5)
+            self.catalogue.remove('gone')
+
+        self.assertEqual(self.catalogue.after(self.now), ['b', 'c', 'a'])
+        self.put('d', 2.5)
+        self.assertEqual(self.catalogue.search(self.now), ['b', 'd', 'c', 'a'])
+
+    def test_search_matches_a_plain_filter(self):
+        rng = random.Random(7)
+        showings = {}
+        for number in range(500):
+            key = f'show-{number}'
+            showings[key] = (rng.randint(-100, 100), rng.randint(1, 5), rng.randint(0, 5), rng.choice((0, 12, 18)),
+                             rng.randint(5, 30))
+            self.put(key, *showings[key])
+            if number % 7 == 0:
+                removed = rng.choice(list(showings))
+                self.catalogue.remove(removed)
+                del showings[removed]
+
+        expected = [key for key, (hours, capacity, reserved, age_group, price) in
+                    sorted(showings.items(), key=lambda item: item[1][0])
+                    if hours > 0 and reserved < capacity and age_group < 15 and price <= 20]
+        self.assertEqual(sorted(self.catalogue.search(self.now, viewer_age=15, max_price=20)), sorted(expected))
+
+
+class TestPythonCatalogue(CatalogueSearchTests, unittest.TestCase):
+    use_numpy = False
+
+
+@unittest.skipIf(catalogue.numpy is None, 'NumPy is not installed')
+class TestNumpyCatalogue(CatalogueSearchTests, unittest.TestCase):
+    use_numpy = True
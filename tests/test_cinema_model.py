@@ -1,12 +1,17 @@
+import tempfile
 import unittest
 
-from models.cinema import Showing, Movies
+import jdatetime
+
+from exeptions import SeatUnavailableError, ShowingConflictError
+from models.cinema import Showing, Movies, SeatMap
+from store import ShowingStore, ShowingArchive
 
 
 class TestCinemaModel(unittest.TestCase):
     def setUp(self):
         self.original_showings = Showing.showings
-        Showing.showings = []
+        Showing.showings = ShowingStore()
 
         self.movie = Movies('Inception' , 17)
         self.test_showing = Showing.create_showing(self.movie , 80 , 20, "1404-06-16 22:00")
@@ -25,6 +30,122 @@ class TestCinemaModel(unittest.TestCase):
 
     def test_get_active_showings_excludes_full_shows(self):
         deactive_showing = Showing.create_showing(self.movie, 1, 20, "1404-06-16 22:00")
-        deactive_showing.reserved_seat.append("uid")
+        deactive_showing.seat_map.reserve("uid", [0])
+        Showing.update_show(deactive_showing)
         active_showings = self.test_showing.get_active_showings()
-        self.assertEqual(len(active_showings), 1)
\ No newline at end of file
+        self.assertEqual(len(active_showings), 1)
+
+    def test_archive_showings_moves_past_showings_out_of_the_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            original_archive = Showing.archive
+            Showing.archive = ShowingArchive(directory)
+            try:
+                Showing.create_showing(self.movie, 80, 20, "1403-05-16 22:00", hall='A')
+                archived = Showing.archive_showings(jdatetime.datetime(1404, 6, 1))
+
+                self.assertEqual(archived, 1)
+                self.assertEqual(len(Showing.showings), 1)
+                self.assertEqual(len(Showing.get_archived_showings((1403, 5), (1403, 5))), 1)
+                Showing.create_showing(self.movie, 80, 20, "1403-05-16 22:00", hall='A')
+            finally:
+                Showing.archive = original_archive
+
+    def test_create_showing_rejects_overlap_in_the_same_hall(self):
+        Showing.create_showing(self.movie, 80, 20, "1405-01-01 18:00", hall='A', duration=150)
+        Showing.create_showing(self.movie, 80, 20, "1405-01-01 19:00", hall='B')
+
+        with self.assertRaises(ShowingConflictError):
+            Showing.create_showing(self.movie, 80, 20, "1405-01-01 20:00", hall='A')
+        self.assertEqual(len(Showing.showings), 3)
+
+    def test_create_showings_saves_all_or_nothing(self):
+        showings = [Showing(self.movie, 80, 20, "1405-01-01 18:00", 'A', 120),
+                    Showing(self.movie, 80, 20, "1405-01-01 20:00", 'A', 120)]
+        Showing.create_showings(showings)
+        self.assertEqual(Showing.from_dict(Showing.showings.get(showings[1].showing_id)).hall, 'A')
+
+        with self.assertRaises(ShowingConflictError):
+            Showing.create_showings([Showing(self.movie, 80, 20, "1405-01-02 18:00", 'A', 120),
+                                     Showing(self.movie, 80, 20, "1405-01-01 21:59", 'A', 120)])
+        self.assertEqual(len(Showing.showings), 3)
+
+    def test_hall_schedule_is_kept_in_step_instead_of_rebuilt(self):
+        first = Showing.create_showing(self.movie, 80, 20, "1405-01-01 18:00", hall='A', duration=120)
+        Showing.create_showings([Showing(self.movie, 80, 20, "1405-01-01 20:00", 'B', 120)])
+
+        self.assertEqual(Showing.hall_schedule().conflict('A', first.get_showing_datetime(),
+                                                          first.get_end_datetime()), first.showing_id)
+        self.assertIsNotNone(Showing.hall_schedule().conflict('B', first.get_end_datetime(),
+                                                              first.get_end_datetime() + jdatetime.timedelta(hours=1)))
+        self.assertIs(Showing.hall_schedule(), Showing.hall_schedule())
+
+        Showing.showings = ShowingStore()
+        self.assertIsNone(Showing.hall_schedule().conflict('A', first.get_showing_datetime(),
+                                                           first.get_end_datetime()))
+
+    def test_from_dict_restores_seat_map(self):
+        self.test_showing.seat_map.reserve("uid", [3, 4])
+        Showing.update_show(self.test_showing)
+
+        showing = Showing.from_dict(Showing.showings.get(self.test_showing.showing_id))
+        self.assertEqual(showing.seat_map.seats_of("uid"), [3, 4])
+        self.assertFalse(showing.seat_map.is_free(3))
+
+    def test_from_dict_saves_without_building_the_seat_map(self):
+        record = Showing.showings.get(self.test_showing.showing_id)
+        showing = Showing.from_dict(record)
+
+        self.assertEqual(showing.to_dict(), record)
+        self.assertIsNone(showing._seat_map)
+        with self.assertRaises(AttributeError):
+            showing.note = 'slots'
+
+
+class TestSeatMap(unittest.TestCase):
+    def setUp(self):
+        self.seat_map = SeatMap(25, columns=5)
+
+    def test_layout_has_rows_and_columns(self):
+        self.assertEqual(self.seat_map.rows, 5)
+        self.assertEqual(self.seat_map.seat_number(2, 3), 7)
+        self.assertEqual(self.seat_map.seat_position(7), (2, 3))
+
+    def test_reserve_marks_seats_and_holder(self):
+        self.seat_map.reserve("uid", [7])
+
+        self.assertFalse(self.seat_map.is_free(7))
+        self.assertTrue(self.seat_map.has_booking("uid"))
+        self.assertEqual(self.seat_map.reserved_count, 1)
+        with self.assertRaises(SeatUnavailableError):
+            self.seat_map.reserve("other uid", [6, 7])
+        self.assertTrue(self.seat_map.is_free(6))
+
+    def test_best_adjacent_prefers_middle_of_the_hall(self):
+        self.assertEqual(self.seat_map.best_adjacent(3), [11, 12, 13])
+
+        self.seat_map.reserve("uid", [12])
+        self.assertEqual(self.seat_map.best_adjacent(3), [6, 7, 8])
+
+    def test_best_adjacent_returns_empty_when_no_block_fits(self):
+        self.assertEqual(self.seat_map.best_adjacent(6), [])
+
+    def test_legacy_list_of_uids_is_loaded_in_seat_order(self):
+        seat_map = SeatMap.from_record({'showing_capacity': 5, 'reserved_seat': ['a', 'b']})
+        self.assertEqual(seat_map.holders, {0: 'a', 1: 'b'})
+
+    def test_legacy_overbooked_records_load_as_full(self):
+        seat_map = SeatMap.from_record({'showing_capacity': 2, 'reserved_seat': ['a', 'b', 'c']})
+        self.assertTrue(seat_map.is_full())
+        self.assertEqual(seat_map.seats_of('c'), [2])
+        self.assertEqual(seat_map.to_record(), {'0': 'a', '1': 'b', '2': 'c'})
+
+        seat_map = SeatMap.from_record({'showing_capacity': 3, 'reserved_seat': {'7': 'a'}})
+        self.assertFalse(seat_map.is_full())
+        self.assertEqual(seat_map.best_adjacent(3), [0, 1, 2])
+        self.assertFalse(seat_map.is_free(7))
+        self.assertEqual(seat_map.layout(), '  1 ...')
+
+    def test_reserve_rejects_repeated_seats(self):
+        with self.assertRaises(SeatUnavailableError):
+            self.seat_map.reserve("uid", [4, 4])
+        self.assertTrue(self.seat_map.is_free(4))
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from logging.handlers import QueueListener, RotatingFileHandler
+
+import custom_log
+from custom_log import JsonLinesFormatter, MessageQueueHandler
+
+
+class TestLogPipeline(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.temp_dir.name, 'test.log')
+        self.file_handler = RotatingFileHandler(self.log_path, maxBytes=1 << 16, backupCount=2, delay=True)
+        self.file_handler.setFormatter(JsonLinesFormatter())
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, self.file_handler)
+        self.listener.start()
+
+        self.logger = logging.getLogger('test_custom_log')
+        self.logger.propagate = False
+        self.logger.addHandler(MessageQueueHandler(self.queue))
+
+    def tearDown(self):
+        if self.listener is not None:
+            self.listener.stop()
+        self.file_handler.close()
+        self.logger.handlers.clear()
+        self.temp_dir.cleanup()
+
+    def read_entries(self):
+        self.listener.stop()
+        self.listener = None
+        with open(self.log_path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_records_are_written_as_json_lines_by_the_listener(self):
+        self.logger.warning('Seat %s is not available.', 7)
+        try:
+            raise ValueError('bad')
+        except ValueError:
+            self.logger.exception('Booking failed.')
+
+        entries = self.read_entries()
+        self.assertEqual(entries[0]['message'], 'Seat 7 is not available.')
+        self.assertEqual(entries[0]['level'], 'WARNING')
+        self.assertIn('ValueError: bad', entries[1]['exception'])
+
+    def test_log_file_is_rotated_by_size(self):
+        self.file_handler.maxBytes = 400
+        for number in range(20):
+            self.logger.warning('balance updated %s', number)
+
+        self.read_entries()
+        self.assertTrue(os.path.exists(self.log_path + '.1'))
+
+
+class TestAppListener(unittest.TestCase):
+    def test_child_gets_a_new_listener_that_keeps_writing(self):
+        stream_records = []
+        custom_log.stream_handler.addFilter(lambda record: stream_records.append(record.getMessage()) and False)
+        original = custom_log.listener
+        original.stop()
+        try:
+            custom_log._restart_listener_in_child()
+            self.assertIsNot(custom_log.listener, original)
+
+            custom_log.logger.warning('written after the restart')
+            custom_log.flush()
+            self.assertEqual(stream_records, ['written after the restart'])
+        finally:
+            custom_log.stream_handler.filters.clear()
+
+    def test_concurrent_flushes_write_everything_once(self):
+        stream_records, errors = [], []
+        custom_log.stream_handler.addFilter(lambda record: stream_records.append(record.getMessage()) and False)
+
+        def log_and_flush(number):
+            try:
+                custom_log.logger.warning(f'record {number}')
+                custom_log.flush()
+            except Exception as error:
+                errors.append(error)
+
+        try:
+            threads = [threading.Thread(target=log_and_flush, args=(number,)) for number in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            custom_log.flush()
+
+            self.assertEqual(errors, [])
+            self.assertEqual(sorted(stream_records), [f'record {number}' for number in range(8)])
+        finally:
+            custom_log.stream_handler.filters.clear()
@@ -0,0 +1,182 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+from exeptions import SeatUnavailableError
+from locks import StripedLock, get_lock
+from models.bank import BankAccount
+from models.cinema import Showing, Movies
+from models.user import User
+from sqlite_store import open_sqlite_store
+from store import UserStore, BankStore, ShowingStore, LazyStore
+
+BOOKERS = 8
+CAPACITY = 5
+DEPOSITORS = 4
+DEPOSITS = 100
+
+
+def _open_stores(directory):
+    User.users = LazyStore(UserStore, os.path.join(directory, 'user.json'))
+    BankAccount.accounts = LazyStore(BankStore, os.path.join(directory, 'bank.json'))
+    Showing.showings = LazyStore(ShowingStore, os.path.join(directory, 'showings.json'))
+
+
+def _book_in_process(directory, uid, showing_id, barrier, results):
+    """Books one seat from a separate process, the way a second app instance would."""
+    _open_stores(directory)
+    user = User.from_dict(User.users.get(uid))
+    showing = Showing.from_dict(Showing.showings.get(showing_id))
+    barrier.wait()
+    try:
+        user.book_ticket(showing)
+        results.put(('booked', uid))
+    except SeatUnavailableError:
+        results.put(('full', uid))
+    finally:
+        User.users.close()
+        Showing.showings.close()
+
+
+def _deposit_in_process(db_path, account_number, barrier, results):
+    """Makes many deposits from a separate process sharing one SQLite database."""
+    BankAccount.accounts = open_sqlite_store(BankStore, db_path)
+    account = BankAccount.get_account(account_number)
+    barrier.wait()
+    failures = 0
+    for _ in range(DEPOSITS):
+        try:
+            account.deposit(1)
+        except Exception:
+            failures += 1
+    results.put(failures)
+
+
+class TestStripedLock(unittest.TestCase):
+    def test_hold_is_reentrant_and_excludes_other_threads(self):
+        striped_lock = StripedLock()
+        entered = threading.Event()
+
+        def other_thread():
+            with striped_lock.hold('showing-1'):
+                entered.set()
+
+        with striped_lock.hold('showing-1', 'showing-2'):
+            with striped_lock.hold('showing-1'):
+                thread = threading.Thread(target=other_thread)
+                thread.start()
+                self.assertFalse(entered.wait(0.05))
+        thread.join()
+        self.assertTrue(entered.is_set())
+
+    def test_file_locks_are_shared_per_lock_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock_path = os.path.join(directory, 'user.lock')
+            self.assertIs(get_lock(lock_path), get_lock(lock_path))
+            with get_lock(lock_path).hold('uid-1'):
+                self.assertTrue(os.path.exists(lock_path))
+
+
+class TestConcurrentBooking(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.originals = User.users, BankAccount.accounts, Showing.showings
+        _open_stores(self.temp_dir.name)
+
+        self.users = []
+        for number in range(BOOKERS):
+            user = User.register(f'booker{number}', 'password', '1370-01-01')
+            user.wallet_balance = 100
+            User.update_user(user)
+            self.users.append(user)
+        self.showing = Showing.create_showing(Movies('Inception', 0), CAPACITY, 10, '1410-01-01 20:00')
+
+    def tearDown(self):
+        for store in (User.users, BankAccount.accounts, Showing.showings):
+            store.close()
+        User.users, BankAccount.accounts, Showing.showings = self.originals
+        self.temp_dir.cleanup()
+
+    def assert_not_oversold(self, booked_uids):
+        Showing.showings.reload()
+        User.users.reload()
+        seat_map = Showing.from_dict(Showing.showings.get(self.showing.showing_id)).seat_map
+
+        self.assertEqual(len(booked_uids), CAPACITY)
+        self.assertTrue(seat_map.is_full())
+        self.assertEqual(sorted(seat_map.holders.values()), sorted(booked_uids))
+        for user in self.users:
+            wallet_balance = User.users.get(user.uid)['wallet_balance']
+            self.assertEqual(wallet_balance < 100, user.uid in booked_uids)
+
+    def test_parallel_threads_never_oversell(self):
+        barrier = threading.Barrier(BOOKERS)
+        booked_uids = []
+
+        def book(user):
+            showing = Showing.from_dict(Showing.showings.get(self.showing.showing_id))
+            barrier.wait()
+            try:
+                user.book_ticket(showing)
+                booked_uids.append(user.uid)
+            except SeatUnavailableError:
+                pass
+
+        threads = [threading.Thread(target=book, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assert_not_oversold(booked_uids)
+
+    def test_parallel_processes_never_oversell(self):
+        for store in (User.users, Showing.showings):
+            store.close()
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(BOOKERS)
+        results = context.Queue()
+        processes = [context.Process(target=_book_in_process,
+                                     args=(self.temp_dir.name, user.uid, self.showing.showing_id, barrier, results))
+                     for user in self.users]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join()
+
+        self.assert_not_oversold([uid for outcome, uid in outcomes if outcome == 'booked'])
+
+
+class TestConcurrentSqliteDeposits(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'cinema.db')
+        self.original_accounts = BankAccount.accounts
+        BankAccount.accounts = open_sqlite_store(BankStore, self.db_path)
+        self.account_numbers = [str(10_000_000 + number) for number in range(DEPOSITORS)]
+        for account_number in self.account_numbers:
+            BankAccount.accounts.insert(BankAccount(f'uid-{account_number}', '1234', account_number).to_dict())
+
+    def tearDown(self):
+        BankAccount.accounts.database.close()
+        BankAccount.accounts = self.original_accounts
+        self.temp_dir.cleanup()
+
+    def test_parallel_processes_lose_no_deposits(self):
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(DEPOSITORS)
+        results = context.Queue()
+        processes = [context.Process(target=_deposit_in_process, args=(self.db_path, account_number, barrier, results))
+                     for account_number in self.account_numbers]
+        for process in processes:
+            process.start()
+        failures = [results.get(timeout=120) for _ in processes]
+        for process in processes:
+            process.join()
+
+        self.assertEqual(failures, [0] * DEPOSITORS)
+        for account_number in self.account_numbers:
+            self.assertEqual(BankAccount.accounts.get(account_number)['balance'], DEPOSITS)
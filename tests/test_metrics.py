@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.was_enabled = metrics.enabled()
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.reset()
+        if not self.was_enabled:
+            metrics.disable()
+
+    def test_disabled_metrics_record_nothing(self):
+        metrics.disable()
+
+        @metrics.timed('noop')
+        def noop():
+            return 1
+
+        self.assertEqual(noop(), 1)
+        with metrics.timer('block'):
+            pass
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_timed_counts_calls_and_errors(self):
+        @metrics.timed('fails')
+        def fails(should_fail):
+            if should_fail:
+                raise ValueError
+
+        fails(False)
+        with self.assertRaises(ValueError):
+            fails(True)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['cinema_fails_seconds']['values'][0]['count'], 2)
+        self.assertEqual(snapshot['cinema_fails_errors_total']['values'][0]['value'], 1)
+
+    def test_prometheus_text_has_cumulative_buckets_and_labels(self):
+        histogram = metrics.histogram('store_load_seconds')
+        histogram.observe(0.0002, table='users')
+        histogram.observe(3, table='users')
+
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE cinema_store_load_seconds histogram', text)
+        self.assertIn('cinema_store_load_seconds_bucket{table="users",le="0.00025"} 1', text)
+        self.assertIn('cinema_store_load_seconds_bucket{table="users",le="+Inf"} 2', text)
+        self.assertIn('cinema_store_load_seconds_count{table="users"} 2', text)
+
+    def test_write_picks_format_from_extension(self):
+        metrics.counter('logins_total').inc()
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, 'metrics.json')
+            text_path = os.path.join(directory, 'metrics.prom')
+            metrics.write(json_path)
+            metrics.write(text_path)
+
+            with open(json_path) as file:
+                self.assertEqual(json.load(file)['cinema_logins_total']['values'][0]['value'], 1)
+            with open(text_path) as file:
+                self.assertIn('cinema_logins_total 1', file.read())
+
+    def test_export_while_other_threads_register_metrics(self):
+        done = threading.Event()
+
+        def register():
+            for number in range(2000):
+                metrics.counter(f'registered_{number}_total').inc()
+            done.set()
+
+        thread = threading.Thread(target=register)
+        thread.start()
+        while not done.is_set():
+            metrics.to_prometheus()
+            metrics.snapshot()
+        thread.join()
+        self.assertIn('cinema_registered_1999_total', metrics.snapshot())
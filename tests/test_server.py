@@ -0,0 +1,136 @@
+import asyncio
+import base64
+import json
+import unittest
+from unittest import mock
+
+from models.bank import BankAccount
+from models.cinema import Showing, Movies
+from models.user import User
+from server import CinemaServer
+from sessions import SessionCache
+from store import UserStore, BankStore, ShowingStore
+
+
+class TestCinemaServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.originals = User.users, BankAccount.accounts, Showing.showings
+        User.users, BankAccount.accounts, Showing.showings = UserStore(), BankStore(), ShowingStore()
+        self.original_sessions = User.sessions
+        User.sessions = SessionCache()
+        self.showing = Showing.create_showing(Movies('Inception', 0), 20, 10, '1410-01-01 20:00')
+
+        self.server = CinemaServer(port=0, workers=4)
+        await self.server.start()
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.server.port)
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        await self.server.close()
+        User.users, BankAccount.accounts, Showing.showings = self.originals
+        User.sessions = self.original_sessions
+
+    async def request(self, method, path, payload=None, credentials=None, token=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        head = f'{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n'
+        if credentials:
+            head += f"Authorization: Basic {base64.b64encode(':'.join(credentials).encode()).decode()}\r\n"
+        if token:
+            head += f'Authorization: Bearer {token}\r\n'
+        self.writer.write(head.encode() + b'\r\n' + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) != b'\r\n':
+            name, _, value = line.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return status, json.loads(await self.reader.readexactly(int(headers['content-length'])))
+
+    async def test_register_login_and_book_on_one_connection(self):
+        status, user = await self.request('POST', '/register',
+                                          {'username': 'alice', 'password': 'secret', 'birth_date': '1370-01-01'})
+        self.assertEqual(status, 201)
+        self.assertNotIn('password', user)
+
+        status, session = await self.request('POST', '/login', {'username': 'alice', 'password': 'secret'})
+        self.assertEqual((status, session['user']['username']), (200, 'alice'))
+
+        User.users.update(session['user']['uid'], {'wallet_balance': 100})
+        status, booking = await self.request('POST', f'/showings/{self.showing.showing_id}/book',
+                                             {'seats': [3]}, token=session['token'])
+        self.assertEqual((status, booking['seats']), (200, [3]))
+
+        status, booking = await self.request('POST', f'/showings/{self.showing.showing_id}/book',
+                                             {'seats': [4]}, credentials=('alice', 'secret'))
+        self.assertEqual((status, booking['seats']), (200, [3, 4]))
+
+        status, showings = await self.request('GET', '/showings')
+        self.assertEqual(showings[0]['free_seats'], 18)
+
+    async def test_showings_can_be_filtered_by_age_and_price(self):
+        Showing.create_showing(Movies('Alien', 18), 20, 30, '1410-01-02 20:00')
+
+        _, showings = await self.request('GET', '/showings?age=20&max_price=20')
+        self.assertEqual([showing['name'] for showing in showings], ['Inception'])
+        _, showings = await self.request('GET', '/showings?age=20')
+        self.assertEqual([showing['name'] for showing in showings], ['Inception', 'Alien'])
+
+        status, _ = await self.request('GET', '/showings?age=old')
+        self.assertEqual(status, 400)
+
+    async def test_logout_ends_the_session(self):
+        await self.request('POST', '/register', {'username': 'alice', 'password': 'secret', 'birth_date': '1370-01-01'})
+        _, session = await self.request('POST', '/login', {'username': 'alice', 'password': 'secret'})
+
+        status, _ = await self.request('POST', '/logout', token=session['token'])
+        self.assertEqual(status, 200)
+        status, _ = await self.request('POST', '/subscription', {'subscription': '1'}, token=session['token'])
+        self.assertEqual(status, 401)
+
+    async def test_errors_map_to_statuses(self):
+        status, _ = await self.request('POST', '/login', {'username': 'nobody', 'password': 'secret'})
+        self.assertEqual(status, 401)
+
+        status, _ = await self.request('POST', '/register', {'username': 'alice'})
+        self.assertEqual(status, 400)
+
+        status, _ = await self.request('GET', '/register')
+        self.assertEqual(status, 405)
+
+        status, _ = await self.request('GET', '/nowhere')
+        self.assertEqual(status, 404)
+
+        await self.request('POST', '/register', {'username': 'bob', 'password': 'secret',
+                                                'birth_date': '1370-01-01'})
+        status, _ = await self.request('POST', f'/showings/{self.showing.showing_id}/book', {'seats': [4, 4]},
+                                       credentials=('bob', 'secret'))
+        self.assertEqual(status, 400)
+
+        status, _ = await self.request('POST', '/wallet/charge', {'amount': -50, 'account_number': '1',
+                                                                  'account_password': '1234', 'cvv2': 1234},
+                                       credentials=('bob', 'secret'))
+        self.assertEqual(status, 400)
+        self.assertEqual(User.users.find('username', 'bob')['wallet_balance'], 0)
+
+    async def test_basic_credentials_are_checked_on_the_password_pool(self):
+        await self.request('POST', '/register', {'username': 'bob', 'password': 'secret', 'birth_date': '1370-01-01'})
+        password_pool = self.server.password_executor
+        with mock.patch.object(password_pool, 'submit', wraps=password_pool.submit) as submit:
+            status, _ = await self.request('POST', f'/showings/{self.showing.showing_id}/book', {'seats': [1]},
+                                           credentials=('bob', 'wrong'))
+        self.assertEqual(status, 401)
+        submit.assert_called_once()
+
+    async def test_negative_content_length_is_rejected(self):
+        self.writer.write(b'POST /login HTTP/1.1\r\nHost: test\r\nContent-Length: -5\r\n\r\n')
+        await self.writer.drain()
+        self.assertEqual(int((await self.reader.readline()).split()[1]), 400)
+
+    async def test_oversized_header_is_rejected_and_closes_the_connection(self):
+        self.writer.write(b'GET /showings HTTP/1.1\r\nHost: test\r\nX-Padding: ' + b'a' * (1 << 17) + b'\r\n\r\n')
+        await self.writer.drain()
+        self.assertEqual(int((await self.reader.readline()).split()[1]), 431)
+        while await self.reader.readline():
+            pass
+        self.assertTrue(self.reader.at_eof())
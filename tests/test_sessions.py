@@ -0,0 +1,57 @@
+import unittest
+
+from sessions import SessionCache
+
+
+class FakeUser:
+    def __init__(self, uid):
+        self.uid = uid
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sessions = SessionCache(ttl=60, max_sessions=2, clock=self.clock)
+
+    def test_session_expires_after_idle_ttl(self):
+        token = self.sessions.issue(FakeUser('uid-1'))
+
+        self.clock.now = 50
+        self.assertEqual(self.sessions.get(token).uid, 'uid-1')
+        self.clock.now = 100
+        self.assertIsNotNone(self.sessions.get(token))
+        self.clock.now = 160
+        self.assertIsNone(self.sessions.get(token))
+        self.assertEqual(len(self.sessions), 0)
+
+    def test_least_recently_used_session_is_evicted(self):
+        first = self.sessions.issue(FakeUser('uid-1'))
+        second = self.sessions.issue(FakeUser('uid-2'))
+        self.sessions.get(first)
+        self.sessions.issue(FakeUser('uid-3'))
+
+        self.assertIsNotNone(self.sessions.get(first))
+        self.assertIsNone(self.sessions.get(second))
+
+    def test_invalidate_keeps_sessions_but_drops_stale_users(self):
+        saved, stale = FakeUser('uid-1'), FakeUser('uid-1')
+        saved_token = self.sessions.issue(saved)
+        stale_token = self.sessions.issue(stale)
+
+        self.sessions.invalidate('uid-1', current=saved)
+
+        self.assertIs(self.sessions.get(saved_token).user, saved)
+        self.assertIsNone(self.sessions.get(stale_token).user)
+
+    def test_revoke_ends_the_session(self):
+        token = self.sessions.issue(FakeUser('uid-1'))
+        self.sessions.revoke(token)
+        self.assertIsNone(self.sessions.get(token))
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from exeptions import InvalidAccountNumberError, NegativeAmountError
+from models.bank import BankAccount
+from sqlite_store import Database, SqliteStore, SqliteShowingStore
+from store import UserStore, BankStore, ShowingStore
+
+
+class TestSqliteStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database = Database(os.path.join(self.temp_dir.name, 'cinema.db'))
+        self.users = SqliteStore(UserStore, self.database)
+        self.users.insert({'uid': 'uid-1', 'username': 'alice', 'wallet_balance': 0})
+
+    def tearDown(self):
+        self.database.close()
+        self.temp_dir.cleanup()
+
+    def test_get_and_find_use_indexed_columns(self):
+        self.assertEqual(self.users.get('uid-1')['username'], 'alice')
+        self.assertEqual(self.users.find('username', 'alice')['uid'], 'uid-1')
+        self.assertIsNone(self.users.find('username', 'bob'))
+        self.assertIn('uid-1', self.users)
+        self.assertEqual(len(self.users), 1)
+
+    def test_update_renames_and_persists(self):
+        self.users.update('uid-1', {'username': 'bob', 'wallet_balance': 50})
+
+        self.assertIsNone(self.users.find('username', 'alice'))
+        self.assertEqual(self.users.find('username', 'bob')['wallet_balance'], 50)
+
+    def test_update_to_a_taken_username_fails_and_keeps_both_rows(self):
+        self.users.insert({'uid': 'uid-2', 'username': 'bob', 'wallet_balance': 0})
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.users.update('uid-1', {'username': 'bob'})
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.users.insert({'uid': 'uid-3', 'username': 'alice', 'wallet_balance': 0})
+
+        self.users.update('uid-1', {'wallet_balance': 50})
+        self.assertEqual([record['uid'] for record in self.users.records()], ['uid-1', 'uid-2'])
+        self.assertEqual(self.users.find('username', 'bob')['uid'], 'uid-2')
+
+    def test_insert_many_skips_taken_keys_and_usernames(self):
+        rejected = self.users.insert_many([{'uid': 'uid-2', 'username': 'bob'},
+                                           {'uid': 'uid-3', 'username': 'alice'},
+                                           {'uid': 'uid-2', 'username': 'carol'}])
+
+        self.assertEqual([record['uid'] for record in rejected], ['uid-3', 'uid-2'])
+        self.assertEqual(len(self.users), 2)
+
+    def test_failed_transaction_is_rolled_back(self):
+        with self.assertRaises(RuntimeError):
+            with self.database.transaction():
+                self.users.update('uid-1', {'wallet_balance': 50})
+                raise RuntimeError
+
+        self.assertEqual(self.users.get('uid-1')['wallet_balance'], 0)
+
+    def test_showing_reservations_are_stored_per_seat(self):
+        showings = SqliteShowingStore(ShowingStore, self.database)
+        showings.insert({'id': 'show-1', 'name': 'Inception', 'showing_time': '1405-01-01 18:00',
+                          'reserved_seat': {'4': 'uid-1'}})
+        showings.update('show-1', {'reserved_seat': {'4': 'uid-1', '7': 'uid-2'}})
+
+        self.assertEqual(showings.get('show-1')['reserved_seat'], {'4': 'uid-1', '7': 'uid-2'})
+        rows = self.database.execute('SELECT seat, uid FROM reservations ORDER BY seat')
+        self.assertEqual(rows, [(4, 'uid-1'), (7, 'uid-2')])
+
+    def test_upcoming_showings_use_start_time_column(self):
+        showings = SqliteShowingStore(ShowingStore, self.database)
+        showings.insert({'id': 'late', 'showing_time': '1405-02-01 20:00', 'reserved_seat': {}})
+        showings.insert({'id': 'past', 'showing_time': '1403-01-01 20:00', 'reserved_seat': {}})
+        showings.insert({'id': 'early', 'showing_time': '1405-01-01 18:00', 'reserved_seat': {'0': 'uid-1'}})
+
+        upcoming = list(showings.upcoming(datetime(2025, 1, 1)))
+        self.assertEqual([showing['id'] for showing in upcoming], ['early', 'late'])
+        self.assertEqual(upcoming[0]['reserved_seat'], {'0': 'uid-1'})
+
+        showings.delete('early')
+        self.assertEqual([showing['id'] for showing in showings.started_before(datetime(2025, 1, 1))], ['past'])
+        self.assertEqual(self.database.execute('SELECT COUNT(*) FROM reservations'), [(0,)])
+
+    def test_search_filters_in_the_query(self):
+        showings = SqliteShowingStore(ShowingStore, self.database)
+        for showing_id, showing_time, capacity, age_group, price in (
+                ('full', '1405-01-01 18:00', 1, 0, 10), ('adults', '1405-01-02 18:00', 10, 18, 10),
+                ('dear', '1405-01-03 18:00', 10, 0, 50), ('open', '1405-01-04 18:00', 10, 0, 10),
+                ('past', '1403-01-01 18:00', 10, 0, 10)):
+            showings.insert({'id': showing_id, 'showing_time': showing_time, 'showing_capacity': capacity,
+                             'age_group': age_group, 'price': price, 'reserved_seat': {}})
+        showings.update('full', {'reserved_seat': {'0': 'uid-1'}})
+
+        found = showings.search(datetime(2025, 1, 1), viewer_age=12, max_price=20)
+        self.assertEqual([showing['id'] for showing in found], ['open'])
+        self.assertEqual([showing['id'] for showing in showings.search(datetime(2025, 1, 1))],
+                         ['adults', 'dear', 'open'])
+
+
+class TestBankModelOnSqlite(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database = Database(os.path.join(self.temp_dir.name, 'cinema.db'))
+        self.original_bank_accounts = BankAccount.accounts
+        BankAccount.accounts = SqliteStore(BankStore, self.database)
+
+    def tearDown(self):
+        BankAccount.accounts = self.original_bank_accounts
+        self.database.close()
+        self.temp_dir.cleanup()
+
+    def test_deposit_and_transfer_are_persisted(self):
+        source = BankAccount.create_account('owner uid', '1234')
+        destination = BankAccount.create_account('owner uid2', '1234')
+        source.deposit(100)
+        source.transfer(20, '1234', source.cvv2, destination.account_number)
+
+        self.assertEqual(BankAccount.accounts.get(source.account_number)['balance'], 80)
+        self.assertEqual(BankAccount.accounts.get(destination.account_number)['balance'], 20)
+
+    def test_transfer_fails_if_destination_not_found(self):
+        source = BankAccount.create_account('owner uid', '1234')
+        source.deposit(100)
+        with self.assertRaises(InvalidAccountNumberError):
+            source.transfer(20, '1234', source.cvv2, '12345678')
+        self.assertEqual(BankAccount.accounts.get(source.account_number)['balance'], 100)
+
+    def test_failed_transfer_rolls_back_both_accounts(self):
+        source = BankAccount.create_account('owner uid', '1234')
+        destination = BankAccount.create_account('owner uid2', '1234')
+        source.deposit(100)
+        with mock.patch.object(BankAccount, 'deposit', side_effect=NegativeAmountError):
+            with self.assertRaises(NegativeAmountError):
+                source.transfer(20, '1234', source.cvv2, destination.account_number)
+
+        self.assertEqual(BankAccount.accounts.get(source.account_number)['balance'], 100)
+        self.assertEqual(BankAccount.accounts.get(destination.account_number)['balance'], 0)
@@ -0,0 +1,315 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import store
+import utils
+from store import UserStore, BankStore, LazyStore, ShowingStore, ShowingArchive, transaction
+from utils import data_load, journal_append, journal_read
+
+
+class TestUserStore(unittest.TestCase):
+    def setUp(self):
+        self.store = UserStore()
+        self.store.insert({'uid': 'uid-1', 'username': 'alice'})
+
+    def test_get_returns_record_by_uid(self):
+        self.assertEqual(self.store.get('uid-1')['username'], 'alice')
+        self.assertIsNone(self.store.get('uid-2'))
+
+    def test_find_returns_record_by_username(self):
+        self.assertEqual(self.store.find('username', 'alice')['uid'], 'uid-1')
+        self.assertIsNone(self.store.find('username', 'bob'))
+
+    def test_update_keeps_username_index_in_step(self):
+        self.store.update('uid-1', {'username': 'bob'})
+
+        self.assertIsNone(self.store.find('username', 'alice'))
+        self.assertEqual(self.store.find('username', 'bob')['uid'], 'uid-1')
+        self.assertEqual(len(self.store), 1)
+
+
+class TestStoreJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, 'user.json')
+        self.store = UserStore.load(self.file_path)
+        self.store.insert({'uid': 'uid-1', 'username': 'alice', 'wallet_balance': 0})
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_update_appends_one_journal_line(self):
+        self.store.update('uid-1', {'wallet_balance': 50})
+
+        with open(self.store.journal_path) as file:
+            self.assertEqual(len(file.readlines()), 2)
+        self.assertFalse(os.path.exists(self.file_path))
+
+    def test_load_replays_journal_over_snapshot(self):
+        self.store.compact()
+        self.store.update('uid-1', {'username': 'bob', 'wallet_balance': 50})
+
+        reloaded = UserStore.load(self.file_path)
+        self.assertEqual(reloaded.find('username', 'bob')['wallet_balance'], 50)
+        self.assertIsNone(reloaded.find('username', 'alice'))
+
+    def test_load_replays_deletions(self):
+        self.store.insert({'uid': 'uid-2', 'username': 'bob', 'wallet_balance': 0})
+        self.store.delete('uid-1')
+
+        reloaded = UserStore.load(self.file_path)
+        self.assertIsNone(reloaded.find('username', 'alice'))
+        self.assertEqual(len(reloaded), 1)
+
+    def test_journal_is_compacted_into_snapshot(self):
+        original_limit = store.JOURNAL_COMPACT_EVERY
+        store.JOURNAL_COMPACT_EVERY = 3
+        try:
+            self.store.update('uid-1', {'wallet_balance': 10})
+            self.store.update('uid-1', {'wallet_balance': 20})
+        finally:
+            store.JOURNAL_COMPACT_EVERY = original_limit
+
+        self.assertFalse(os.path.exists(self.store.journal_path))
+        self.assertEqual(data_load(self.file_path)[0]['wallet_balance'], 20)
+
+    def test_insert_many_writes_one_snapshot_and_skips_taken_usernames(self):
+        rejected = self.store.insert_many([{'uid': f'uid-{i}', 'username': f'user{i}', 'wallet_balance': 0}
+                                           for i in range(2, 1000)] +
+                                          [{'uid': 'uid-x', 'username': 'alice', 'wallet_balance': 0}])
+
+        self.assertEqual([record['uid'] for record in rejected], ['uid-x'])
+        self.assertFalse(os.path.exists(self.store.journal_path))
+        self.assertEqual(len(UserStore.load(self.file_path)), 999)
+
+    def test_concurrent_updates_share_fsyncs(self):
+        for number in range(2, 22):
+            self.store.insert({'uid': f'uid-{number}', 'username': f'user{number}', 'wallet_balance': 0})
+        writers = [threading.Thread(target=self.store.update, args=(f'uid-{number}', {'wallet_balance': number}))
+                   for number in range(2, 22)]
+
+        with mock.patch.object(utils.group_commit, 'window', 0.05), mock.patch('utils.os.fsync') as fsync:
+            for writer in writers:
+                writer.start()
+            for writer in writers:
+                writer.join()
+
+        self.assertLess(fsync.call_count, len(writers))
+        self.assertEqual(UserStore.load(self.file_path).get('uid-21')['wallet_balance'], 21)
+
+    def test_refresh_picks_up_changes_of_another_store(self):
+        other = UserStore.load(self.file_path)
+        other.update('uid-1', {'wallet_balance': 70})
+
+        self.store.refresh()
+        self.assertEqual(self.store.get('uid-1')['wallet_balance'], 70)
+
+        other.insert({'uid': 'uid-2', 'username': 'bob', 'wallet_balance': 0})
+        other.compact()
+        self.store.refresh()
+        self.assertEqual(self.store.find('username', 'bob')['uid'], 'uid-2')
+        self.assertEqual(self.store.journal_size, 0)
+
+
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.users = UserStore.load(os.path.join(self.temp_dir.name, 'user.json'))
+        self.accounts = BankStore.load(os.path.join(self.temp_dir.name, 'bank.json'))
+        self.users.insert({'uid': 'uid-1', 'username': 'alice', 'wallet_balance': 0})
+        self.accounts.insert({'account_number': '11111111', 'owner_uid': 'uid-1', 'balance': 100})
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_error_rolls_back_every_store(self):
+        with self.assertRaises(RuntimeError):
+            with transaction():
+                self.accounts.update('11111111', {'balance': 40})
+                self.users.update('uid-1', {'wallet_balance': 60})
+                self.users.insert({'uid': 'uid-2', 'username': 'bob', 'wallet_balance': 0})
+                raise RuntimeError
+
+        self.assertEqual(self.accounts.get('11111111')['balance'], 100)
+        self.assertEqual(self.users.get('uid-1')['wallet_balance'], 0)
+        self.assertIsNone(self.users.find('username', 'bob'))
+        self.assertEqual(len(UserStore.load(self.users.file_path)), 1)
+
+    def test_commit_writes_each_journal_once(self):
+        with transaction():
+            self.accounts.update('11111111', {'balance': 40})
+            self.users.update('uid-1', {'wallet_balance': 30})
+            self.users.update('uid-1', {'wallet_balance': 60})
+
+        self.assertEqual(UserStore.load(self.users.file_path).get('uid-1')['wallet_balance'], 60)
+        self.assertEqual(BankStore.load(self.accounts.file_path).get('11111111')['balance'], 40)
+        entries, _ = journal_read(self.users.transaction_log_path)
+        self.assertEqual([list(entry) for entry in entries], [['begin'], ['end']])
+
+    def test_load_skips_transactions_that_never_ended(self):
+        journal_append(self.users.transaction_log_path, {'begin': 'crashed'})
+        journal_append(self.users.journal_path,
+                       {'op': 'put', 'record': {'uid': 'uid-1', 'username': 'alice', 'wallet_balance': 99},
+                        'txn': 'crashed'})
+
+        self.assertEqual(UserStore.load(self.users.file_path).get('uid-1')['wallet_balance'], 0)
+
+    def test_compaction_leaves_out_changes_of_an_open_transaction(self):
+        updated, compacted = threading.Event(), threading.Event()
+
+        def update_then_fail():
+            with self.assertRaises(RuntimeError):
+                with transaction():
+                    self.users.update('uid-1', {'wallet_balance': 999})
+                    updated.set()
+                    compacted.wait()
+                    raise RuntimeError
+
+        self.users.refresh()
+        writer = threading.Thread(target=update_then_fail)
+        writer.start()
+        updated.wait()
+        self.users.compact()
+        compacted.set()
+        writer.join()
+
+        self.assertEqual(self.users.get('uid-1')['wallet_balance'], 0)
+        self.assertEqual(UserStore.load(self.users.file_path).get('uid-1')['wallet_balance'], 0)
+
+    def test_refresh_keeps_changes_of_an_open_transaction(self):
+        self.users.update('uid-1', {'wallet_balance': 50})
+        other = UserStore.load(self.users.file_path)
+
+        with self.assertRaises(RuntimeError):
+            with transaction():
+                self.users.update('uid-1', {'wallet_balance': 999})
+                writer = threading.Thread(target=other.update, args=('uid-1', {'wallet_balance': 70}))
+                writer.start()
+                writer.join()
+                self.users.refresh()
+                self.assertEqual(self.users.get('uid-1')['wallet_balance'], 999)
+                raise RuntimeError
+
+        self.assertEqual(self.users.get('uid-1')['wallet_balance'], 70)
+
+
+class TestLazyStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, 'user.json')
+        with open(self.file_path, 'w') as file:
+            json.dump([{'uid': 'uid-1', 'username': 'alice'}], file)
+        self.store = LazyStore(UserStore, self.file_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_store_is_not_loaded_until_first_access(self):
+        self.assertFalse(self.store.loaded)
+        self.assertEqual(self.store.find('username', 'alice')['uid'], 'uid-1')
+        self.assertTrue(self.store.loaded)
+
+    def test_reload_reads_the_files_again(self):
+        self.assertEqual(len(self.store), 1)
+        UserStore.load(self.file_path).insert({'uid': 'uid-2', 'username': 'bob'})
+
+        self.store.reload()
+        self.assertIn('uid-2', self.store)
+
+    def test_close_drops_records_until_next_access(self):
+        self.store.insert({'uid': 'uid-2', 'username': 'bob'})
+        self.store.close()
+
+        self.assertFalse(self.store.loaded)
+        self.assertEqual(len(self.store), 2)
+
+
+class TestBinarySnapshot(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.temp_dir.name, 'user.json')
+        self.pickle_path = os.path.join(self.temp_dir.name, 'user.pickle')
+        with open(self.json_path, 'w') as file:
+            json.dump([{'uid': 'uid-1', 'username': 'alice'}], file)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_binary_store_reads_json_until_first_compaction(self):
+        users = UserStore.load(self.pickle_path)
+        self.assertEqual(users.find('username', 'alice')['uid'], 'uid-1')
+
+        users.insert({'uid': 'uid-2', 'username': 'bob'})
+        users.compact()
+
+        self.assertTrue(os.path.exists(self.pickle_path))
+        self.assertEqual(len(UserStore.load(self.pickle_path)), 2)
+
+
+class TestShowingStoreTimeIndex(unittest.TestCase):
+    def setUp(self):
+        self.store = ShowingStore()
+        for showing_id, showing_time in (('late', '1405-02-01 20:00'), ('past', '1403-01-01 20:00'),
+                                         ('early', '1405-01-01 18:00')):
+            self.store.insert({'id': showing_id, 'showing_time': showing_time, 'reserved_seat': {}})
+        self.now = datetime(2025, 1, 1)
+
+    def test_upcoming_skips_past_showings_in_start_order(self):
+        upcoming = [showing['id'] for showing in self.store.upcoming(self.now)]
+        self.assertEqual(upcoming, ['early', 'late'])
+
+    def test_started_before_and_delete_use_the_index(self):
+        started = [showing['id'] for showing in self.store.started_before(self.now)]
+        self.assertEqual(started, ['past'])
+
+        self.store.delete('past')
+        self.assertEqual(self.store.started_before(self.now), [])
+
+    def test_rescheduling_moves_showing_in_the_index(self):
+        self.store.update('past', {'showing_time': '1405-03-01 20:00'})
+        self.store.update('late', {'showing_time': '1403-03-01 20:00'})
+
+        upcoming = [showing['id'] for showing in self.store.upcoming(self.now)]
+        self.assertEqual(upcoming, ['early', 'past'])
+
+    def test_search_filters_upcoming_showings_by_seats_age_and_price(self):
+        self.store.update('early', {'showing_capacity': 1, 'reserved_seat': {'0': 'uid'}})
+        self.store.update('late', {'showing_capacity': 10, 'age_group': 12, 'price': 20})
+        self.store.insert({'id': 'cheap', 'showing_time': '1405-03-01 20:00', 'showing_capacity': 10,
+                           'age_group': 0, 'price': 5, 'reserved_seat': {}})
+
+        self.assertEqual([showing['id'] for showing in self.store.search(self.now)], ['late', 'cheap'])
+        self.assertEqual([showing['id'] for showing in self.store.search(self.now, viewer_age=12)], ['cheap'])
+        self.assertEqual([showing['id'] for showing in self.store.search(self.now, max_price=10)], ['cheap'])
+
+        self.store.delete('cheap')
+        self.assertEqual([showing['id'] for showing in self.store.search(self.now)], ['late'])
+
+
+class TestShowingArchive(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.archive = ShowingArchive(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_add_partitions_by_month_without_duplicates(self):
+        self.archive.add([{'id': 'a', 'showing_time': '1403-05-02 20:00'},
+                          {'id': 'b', 'showing_time': '1403-06-10 20:00'}])
+        self.archive.add([{'id': 'a', 'showing_time': '1403-05-02 20:00'}])
+
+        self.assertEqual(self.archive.months(), [(1403, 5), (1403, 6)])
+        self.assertEqual([showing['id'] for showing in self.archive.query()], ['a', 'b'])
+
+    def test_query_reads_only_requested_months(self):
+        self.archive.add([{'id': 'a', 'showing_time': '1403-05-02 20:00'},
+                          {'id': 'b', 'showing_time': '1403-06-10 20:00'}])
+
+        showings = list(self.archive.query(first_month=(1403, 6)))
+        self.assertEqual([showing['id'] for showing in showings], ['b'])
@@ -1,18 +1,30 @@
 import unittest
+from unittest import mock
+
 import jdatetime
 
-from exeptions import UsernameExistsError, InvalidCredentialsError, InsufficientFundsError
+from exeptions import UsernameExistsError, InvalidCredentialsError, InsufficientFundsError, SeatUnavailableError
+from models.bank import BankAccount
 from models.cinema import Showing, Movies
 from models.user import User
+from sessions import SessionCache
+from store import UserStore, BankStore, ShowingStore
+from utils import hash_password, dummy_password_hash
 
 
 class TestUserModel(unittest.TestCase):
     def setUp(self):
-        self.original_users = list(User.users)
-        User.users = []
+        self.original_users = User.users
+        User.users = UserStore()
+
+        self.original_accounts = BankAccount.accounts
+        BankAccount.accounts = BankStore()
 
-        self.original_showings = list(Showing.showings)
-        Showing.showings = []
+        self.original_showings = Showing.showings
+        Showing.showings = ShowingStore()
+
+        self.original_sessions = User.sessions
+        User.sessions = SessionCache()
 
         self.test_user = User.register(
             username="testuser",
@@ -22,14 +34,18 @@ class TestUserModel(unittest.TestCase):
 
         self.test_user_bank = self.test_user.create_bank_account('1234')
         self.test_user_bank.balance = 100
+        BankAccount.update_account(self.test_user_bank)
         self.test_user.wallet_balance = 100
+        User.update_user(self.test_user)
 
         movie = Movies("Inception", 17)
 
         self.test_showing = Showing.create_showing(movie,80 , 80,  "1404-06-15 22:00")
     def tearDown(self):
         User.users = self.original_users
+        BankAccount.accounts = self.original_accounts
         Showing.showings = self.original_showings
+        User.sessions = self.original_sessions
 
 
 
@@ -57,6 +73,50 @@ class TestUserModel(unittest.TestCase):
         with self.assertRaises(InvalidCredentialsError):
             User.login("test user", "password")
 
+    def test_login_checks_a_dummy_hash_for_an_unknown_username(self):
+        with mock.patch('models.user.verify_password', return_value=False) as verify:
+            with self.assertRaises(InvalidCredentialsError):
+                User.login("test user", "password")
+        verify.assert_called_once_with("password", dummy_password_hash())
+
+    def test_login_upgrades_legacy_password_hash(self):
+        User.users.update(self.test_user.uid, {'password': hash_password("password123")})
+
+        User.login("testuser", "password123")
+
+        stored = User.users.get(self.test_user.uid)['password']
+        self.assertTrue(stored.startswith('scrypt$'))
+        self.assertIsInstance(User.login("testuser", "password123"), User)
+
+    def test_session_returns_cached_user_until_another_copy_is_saved(self):
+        token = User.start_session("testuser", "password123")
+        user = User.from_session(token)
+        self.assertIs(User.from_session(token), user)
+
+        self.test_user.wallet_balance = 70
+        User.update_user(self.test_user)
+
+        reloaded = User.from_session(token)
+        self.assertIsNot(reloaded, user)
+        self.assertEqual(reloaded.wallet_balance, 70)
+
+    def test_ended_session_is_rejected(self):
+        token = User.start_session("testuser", "password123")
+        User.end_session(token)
+        with self.assertRaises(InvalidCredentialsError):
+            User.from_session(token)
+
+    def test_user_record_keeps_only_account_numbers(self):
+        record = User.users.get(self.test_user.uid)
+        self.assertEqual(record['bank_accounts'], [self.test_user_bank.account_number])
+
+    def test_login_resolves_bank_accounts_from_bank_store(self):
+        self.test_user_bank.deposit(30)
+
+        user = User.login("testuser", "password123")
+        self.assertEqual(user.bank_accounts[0].account_number, self.test_user_bank.account_number)
+        self.assertEqual(user.bank_accounts[0].balance, 130)
+
     def test_get_age_returns_correct_age(self):
         self.assertEqual(self.test_user.get_age() , 24)
 
@@ -72,13 +132,31 @@ class TestUserModel(unittest.TestCase):
 
     def test_book_ticket_succeeds_with_enough_balance(self):
         self.test_user.book_ticket(self.test_showing)
-        self.assertEqual(len(self.test_showing.reserved_seat) ,1)
+        self.assertEqual(self.test_showing.seat_map.reserved_count ,1)
 
     def test_book_ticket_fails_with_insufficient_funds(self):
         self.test_user.wallet_balance = 10
+        User.update_user(self.test_user)
         with self.assertRaises(InsufficientFundsError):
             self.test_user.book_ticket(self.test_showing)
-        self.assertEqual(len(self.test_showing.reserved_seat), 0)
+        self.assertEqual(self.test_showing.seat_map.reserved_count, 0)
+
+    def test_book_ticket_reserves_chosen_seat(self):
+        self.test_user.book_ticket(self.test_showing, [12])
+        self.assertEqual(self.test_showing.seat_map.seats_of(self.test_user.uid), [12])
+
+    def test_book_ticket_fails_for_taken_seat(self):
+        self.test_showing.seat_map.reserve("other uid", [12])
+        Showing.update_show(self.test_showing)
+        with self.assertRaises(SeatUnavailableError):
+            self.test_user.book_ticket(self.test_showing, [12])
+        self.assertEqual(self.test_user.wallet_balance, 100)
+
+    def test_book_ticket_fails_for_repeated_seat(self):
+        with self.assertRaises(SeatUnavailableError):
+            self.test_user.book_ticket(self.test_showing, [4, 4])
+        self.assertEqual(self.test_user.wallet_balance, 100)
+        self.assertEqual(self.test_showing.seat_map.seats_of(self.test_user.uid), [])
 
     def test_book_ticket_applies_birthday_discount(self):
         self.test_user.birth_date = "1381-06-15"
@@ -89,6 +167,7 @@ class TestUserModel(unittest.TestCase):
         self.test_user.subscription = 'gold'
         self.test_user.cashback_percent = 50
         self.test_user.cashback_date = jdatetime.datetime.now() + jdatetime.timedelta(days=5)
+        User.update_user(self.test_user)
 
         self.test_user.book_ticket(self.test_showing)
         self.assertEqual(self.test_user.wallet_balance, 60)
@@ -97,13 +176,15 @@ class TestUserModel(unittest.TestCase):
         self.test_user.subscription = 'silver'
         self.test_user.cashback_percent = 20
         self.test_user.cashback_count=3
+        User.update_user(self.test_user)
         self.test_user.book_ticket(self.test_showing)
         self.assertEqual(self.test_user.wallet_balance, 36)
 
+    def test_from_dict_round_trips_dates_without_parsing_them(self):
+        record = User.users.get(self.test_user.uid)
+        user = User.from_dict(record)
 
-
-
-
-
-
-
+        self.assertEqual(user.to_dict(), record)
+        self.assertIsInstance(user._cashback_date, str)
+        self.assertIsInstance(user.cashback_date, jdatetime.datetime)
+        self.assertEqual(user.to_dict(), record)
@@ -1,13 +1,20 @@
 import hashlib
+import json
+import os
+import tempfile
+import threading
 import unittest
+from unittest import mock
 
 import jdatetime
 from django.utils.datetime_safe import new_date
 from jdatetime import datetime
 from openpyxl.styles.builtins import percent
 
-from exeptions import InvalidDateError
-from utils import hash_password, str_to_datetime, calculate_time_span, apply_discount
+from exeptions import InvalidDateError, CorruptDataFileError
+from utils import hash_password, str_to_datetime, calculate_time_span, apply_discount, data_dump, data_load, \
+    GroupCommit, data_stream, snapshot_dump, snapshot_stream, str_to_showimg_datetime, iso_to_datetime, \
+    datetime_cache_info, clear_datetime_cache, make_password, verify_password, password_needs_rehash
 
 
 class TestUtils(unittest.TestCase):
@@ -25,6 +32,24 @@ class TestUtils(unittest.TestCase):
 
         self.assertEqual(hashed_password, expected_hash)
 
+    def test_make_password_is_salted_and_verifies(self):
+        hashed_1 = make_password("<PASSWORD>", cost=1024)
+        hashed_2 = make_password("<PASSWORD>", cost=1024)
+
+        self.assertNotEqual(hashed_1, hashed_2)
+        self.assertTrue(verify_password("<PASSWORD>", hashed_1))
+        self.assertFalse(verify_password("<WRONG>", hashed_1))
+
+    def test_verify_password_accepts_legacy_and_plain_passwords(self):
+        self.assertTrue(verify_password("<PASSWORD>", hash_password("<PASSWORD>")))
+        self.assertTrue(verify_password("<PASSWORD>", "<PASSWORD>", is_hashed=False))
+        self.assertFalse(verify_password("<PASSWORD>", "scrypt$broken"))
+
+    def test_password_needs_rehash_for_old_schemes_and_costs(self):
+        self.assertTrue(password_needs_rehash(hash_password("<PASSWORD>")))
+        self.assertTrue(password_needs_rehash(make_password("<PASSWORD>", cost=1024)))
+        self.assertFalse(password_needs_rehash(make_password("<PASSWORD>")))
+
     def test_str_to_datetime_returns_datetime_for_valid_formats(self):
         format_1 = "1400-01-01"
         format_2 = "1400-1-1"
@@ -45,6 +70,21 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(InvalidDateError):
             str_to_datetime(input_none)
 
+    def test_parsed_datetimes_are_cached(self):
+        clear_datetime_cache()
+        first = str_to_showimg_datetime("1404-06-16 22:00")
+        second = str_to_showimg_datetime("1404-06-16 22:00")
+
+        self.assertIs(first, second)
+        self.assertEqual(datetime_cache_info().hits, 1)
+        self.assertEqual(datetime_cache_info().misses, 1)
+
+    def test_iso_to_datetime_accepts_timestamps_without_microseconds(self):
+        self.assertEqual(iso_to_datetime("1404-06-14T22:32:56"), jdatetime.datetime(1404, 6, 14, 22, 32, 56))
+        self.assertEqual(iso_to_datetime("1404-06-14T22:32:56.731855").microsecond, 731855)
+        with self.assertRaises(InvalidDateError):
+            iso_to_datetime("yesterday")
+
     def test_calculate_time_span_returns_correct_type(self):
         new_date = jdatetime.datetime.now() + jdatetime.timedelta(days=20)
         time_span = calculate_time_span(jdatetime.datetime.now() , new_date)
@@ -63,3 +103,94 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(apply_discount(price , twenty_percent) , 80)
         self.assertEqual(apply_discount(price , zero_percent) , price)
         self.assertEqual(apply_discount(price , hundred_percent) , 0)
+
+
+class TestDataFiles(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, 'user.json')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_data_dump_replaces_file_without_leaving_temp_files(self):
+        data_dump(self.file_path, [{'uid': '1'}])
+        data_dump(self.file_path, [{'uid': '2'}])
+
+        self.assertEqual(data_load(self.file_path), [{'uid': '2'}])
+        self.assertEqual(os.listdir(self.temp_dir.name), ['user.json'])
+
+    def test_data_dump_keeps_old_file_when_write_fails(self):
+        data_dump(self.file_path, [{'uid': '1'}])
+        with mock.patch('utils.json.dump', side_effect=OSError):
+            with self.assertRaises(OSError):
+                data_dump(self.file_path, [{'uid': '2'}])
+
+        self.assertEqual(data_load(self.file_path), [{'uid': '1'}])
+        self.assertEqual(os.listdir(self.temp_dir.name), ['user.json'])
+
+    def test_data_load_raises_for_corrupt_file(self):
+        with open(self.file_path, 'w') as file:
+            file.write('[{"uid": ')
+
+        with self.assertRaises(CorruptDataFileError):
+            data_load(self.file_path)
+
+    def test_data_stream_yields_same_records_as_data_load(self):
+        records = [{'uid': str(i), 'name': 'user ' * i, 'tags': [i, {'x': None}]} for i in range(50)]
+        data_dump(self.file_path, records)
+
+        self.assertEqual(list(data_stream(self.file_path, chunk_size=7)), records)
+        self.assertEqual(list(data_stream(self.file_path)), data_load(self.file_path))
+
+    def test_data_stream_handles_missing_and_empty_list_files(self):
+        self.assertEqual(list(data_stream(self.file_path)), [])
+        data_dump(self.file_path, [])
+        self.assertEqual(list(data_stream(self.file_path, chunk_size=1)), [])
+
+    def test_data_stream_raises_for_truncated_file(self):
+        with open(self.file_path, 'w') as file:
+            file.write('[{"uid": "1"}, {"uid": ')
+
+        with self.assertRaises(CorruptDataFileError):
+            list(data_stream(self.file_path, chunk_size=4))
+
+    def test_pickle_snapshot_round_trips_in_batches(self):
+        pickle_path = os.path.join(self.temp_dir.name, 'user.pickle')
+        records = [{'uid': str(i)} for i in range(2500)]
+        snapshot_dump(pickle_path, records)
+
+        self.assertEqual(list(snapshot_stream(pickle_path)), records)
+
+    def test_pickle_snapshot_raises_when_truncated(self):
+        pickle_path = os.path.join(self.temp_dir.name, 'user.pickle')
+        snapshot_dump(pickle_path, [{'uid': str(i)} for i in range(10)])
+        with open(pickle_path, 'r+b') as file:
+            file.truncate(os.path.getsize(pickle_path) - 5)
+
+        with self.assertRaises(CorruptDataFileError):
+            list(snapshot_stream(pickle_path))
+
+    def test_group_commit_shares_one_fsync_per_window(self):
+        commit = GroupCommit(window=0.2)
+        with open(self.file_path, 'w') as file:
+            json.dump([], file)
+
+        with mock.patch('utils.os.fsync') as fsync:
+            writers = [threading.Thread(target=commit.request, args=(self.file_path,)) for _ in range(5)]
+            for writer in writers:
+                writer.start()
+            for writer in writers:
+                writer.join()
+            self.assertEqual(fsync.call_count, 1)
+
+    def test_group_commit_returns_after_the_fsync(self):
+        commit = GroupCommit(window=0)
+        with open(self.file_path, 'w') as file:
+            json.dump([], file)
+
+        with mock.patch('utils.os.fsync') as fsync:
+            commit.request(self.file_path)
+            self.assertEqual(fsync.call_count, 1)
+            commit.flush()
+            self.assertEqual(fsync.call_count, 1)
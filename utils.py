@@ -1,36 +1,406 @@
+import atexit
+import base64
+import functools
 import hashlib
+import hmac
 import json
+import os
+import pickle
 import re
+import secrets
+import tempfile
+import threading
+import time
 
 from datetime import datetime
 
 import jdatetime
 from django.utils.formats import date_format
 
+import metrics
 from custom_log import logger as log
-from exeptions import InvalidDateError
+from exeptions import InvalidDateError, CorruptDataFileError
 
 
+class GroupCommit:
+    """Shares the fsync calls of files written by concurrent writers.
+
+    request() returns only once the file has been synced, so a write it
+    acknowledges survives an OS crash. The first writer of a batch waits up
+    to `window` seconds for others, then syncs every file of the batch once;
+    writers arriving meanwhile, or while that fsync runs, share the next one.
+    A window of 0 syncs at once and still shares the fsync between writers
+    that arrive while one is in progress."""
+
+    def __init__(self, window:float):
+        self.window = window
+        self._condition = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._pending = set()
+        self._batch = 0
+        self._synced = -1
+        self._has_leader = False
+
+    def request(self, file_path:str):
+        """Returns once file_path has been synced, sharing the fsync with other writers."""
+        with self._condition:
+            self._pending.add(file_path)
+            batch = self._batch
+            leader = not self._has_leader
+            self._has_leader = True
+        if leader and self.window > 0:
+            time.sleep(self.window)
+        if leader:
+            self._commit(batch)
+        with self._condition:
+            while self._synced < batch:
+                self._condition.wait()
+
+    def flush(self):
+        """Syncs every pending file now."""
+        with self._condition:
+            batch = self._batch
+        self._commit(batch)
+
+    def _commit(self, batch:int):
+        """Closes the open batch, if it is still `batch`, and syncs its files.
+
+        Batches are closed and synced in order under _sync_lock, so a batch
+        closed earlier by another writer is already synced once the lock is held."""
+        with self._sync_lock:
+            with self._condition:
+                if self._synced >= batch:
+                    return
+                pending, self._pending = self._pending, set()
+                closed = self._batch
+                self._batch += 1
+                self._has_leader = False
+            for file_path in pending:
+                _fsync_file(file_path)
+            with self._condition:
+                self._synced = closed
+                self._condition.notify_all()
+
+
+def _fsync_file(file_path:str):
+    """Flushes a file's contents to disk, ignoring files removed meanwhile."""
+    try:
+        fd = os.open(file_path, os.O_RDWR)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _fsync_directory(directory:str):
+    """Makes a rename inside directory durable (POSIX only)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+FSYNC_WINDOW = float(os.environ.get('CINEMA_FSYNC_WINDOW', 0))
+group_commit = GroupCommit(FSYNC_WINDOW)
+atexit.register(group_commit.flush)
+
+
+def _atomic_write(file_path:str , write , binary:bool = False):
+    """Writes a file through write(file) without ever exposing a partial file.
+
+    The data goes to a temporary file in the same directory, is synced and
+    then renamed over the target, so a crash never leaves a truncated file."""
+    directory = os.path.dirname(file_path) or '.'
+    suffix = os.path.splitext(file_path)[1]
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+@metrics.timed('data_dump')
 def data_dump(file_path:str , data:list):
-    """Saves a dictionary to a JSON file."""
-    with open(file_path,'w') as file:
-        json.dump(data, file, indent=4)
+    """Saves a list of records to a JSON file atomically."""
+    _atomic_write(file_path, lambda file: json.dump(data, file, indent=4))
 
+@metrics.timed('data_load')
 def data_load(file_path:str):
-    """Loads a dictionary from a JSON file."""
+    """Loads a list of records from a JSON file.
+
+    A missing file means no records yet; an unreadable one raises
+    CorruptDataFileError instead of being treated as empty."""
     try:
         with open(file_path) as file:
             try:
                 return json.load(file)
             except json.JSONDecodeError:
-                return []
+                log.error(f"Data file '{file_path}' is corrupt and was not loaded.")
+                raise CorruptDataFileError
     except FileNotFoundError:
         return []
 
+def data_stream(file_path:str , chunk_size:int = 1 << 16):
+    """Yields the records of a JSON list file one at a time.
+
+    The file is read in chunks and each list item is decoded as soon as it is
+    complete, so the whole file is never held in memory next to its parsed
+    records. A missing file yields nothing; an unreadable one raises
+    CorruptDataFileError."""
+    decoder = json.JSONDecoder()
+    try:
+        file = open(file_path)
+    except FileNotFoundError:
+        return
+    with file:
+        buffer = ''
+        position = 0
+        at_eof = False
+        started = False
+
+        def skip(chars:str):
+            nonlocal position
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+
+        while True:
+            skip(' \t\r\n,' if started else ' \t\r\n')
+            if position == len(buffer) and not at_eof:
+                buffer = file.read(chunk_size)
+                position = 0
+                at_eof = not buffer
+                continue
+            if not started:
+                if buffer[position:position + 1] != '[':
+                    break
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                record, end = None, None
+            if end is None or (end == len(buffer) and not at_eof):
+                if at_eof:
+                    break
+                more = file.read(chunk_size)
+                at_eof = not more
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield record
+            position = end
+
+    log.error(f"Data file '{file_path}' is corrupt and was not loaded.")
+    raise CorruptDataFileError
+
+SNAPSHOT_FORMATS = ('json', 'pickle', 'msgpack')
+PICKLE_BATCH_SIZE = 1024
+
+def snapshot_format(file_path:str) -> str:
+    """Returns the snapshot format of a data file, judged by its extension."""
+    extension = os.path.splitext(file_path)[1].lstrip('.')
+    return extension if extension in SNAPSHOT_FORMATS else 'json'
+
+def snapshot_path(file_path:str , snapshot_format:str) -> str:
+    """Returns the path of a data file saved in another snapshot format."""
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format '{snapshot_format}'.")
+    return os.path.splitext(file_path)[0] + '.' + snapshot_format
+
+@metrics.timed('snapshot_dump')
+def snapshot_dump(file_path:str , records):
+    """Saves records atomically in the format named by the file extension.
+
+    pickle snapshots are a sequence of protocol 5 pickles of up to
+    PICKLE_BATCH_SIZE records and msgpack snapshots a sequence of maps, so
+    both can be read back one batch at a time. Only load pickle snapshots
+    you wrote yourself."""
+    file_format = snapshot_format(file_path)
+    if file_format == 'json':
+        data_dump(file_path, list(records))
+    elif file_format == 'pickle':
+        def write(file):
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) == PICKLE_BATCH_SIZE:
+                    pickle.dump(batch, file, protocol=5)
+                    batch = []
+            if batch:
+                pickle.dump(batch, file, protocol=5)
+        _atomic_write(file_path, write, binary=True)
+    else:
+        import msgpack
+        def write(file):
+            packer = msgpack.Packer()
+            for record in records:
+                file.write(packer.pack(record))
+        _atomic_write(file_path, write, binary=True)
+
+def snapshot_stream(file_path:str):
+    """Yields the records of a snapshot file in any supported format."""
+    file_format = snapshot_format(file_path)
+    if file_format == 'json':
+        yield from data_stream(file_path)
+        return
+    try:
+        file = open(file_path, 'rb')
+    except FileNotFoundError:
+        return
+    with file:
+        try:
+            if file_format == 'pickle':
+                while file.peek(1):
+                    yield from pickle.load(file)
+                return
+            import msgpack
+            unpacker = msgpack.Unpacker(file, raw=False)
+            yield from unpacker
+            if unpacker.tell() != os.fstat(file.fileno()).st_size:
+                raise ValueError('unexpected end of data')
+        except (pickle.UnpicklingError, EOFError, ValueError) as error:
+            log.error(f"Data file '{file_path}' is corrupt and was not loaded: {error}")
+            raise CorruptDataFileError
+
+@metrics.timed('journal_append')
+def journal_append(journal_path:str , *entries:dict, sync:bool = True):
+    """Appends change entries to a JSON-lines journal file in one write.
+
+    Returns once the lines are synced; the fsync is shared with the appends
+    of other writers in the same group-commit window. With sync=False the
+    caller requests the sync itself, typically after releasing its locks."""
+    with open(journal_path, 'a') as file:
+        file.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+    if sync:
+        group_commit.request(journal_path)
+
+def journal_rewrite(journal_path:str , entries:list):
+    """Replaces the entries of a JSON-lines journal file atomically."""
+    _atomic_write(journal_path, lambda file: file.write(''.join(json.dumps(entry) + '\n' for entry in entries)))
+
+def journal_read(journal_path:str , offset:int = 0):
+    """Returns the journal entries written after a byte offset, and the offset after them.
+
+    Only complete lines are read, so a line another process is still writing
+    is left for the next read. Unreadable lines (from a crash mid-append)
+    are skipped."""
+    try:
+        with open(journal_path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+    except FileNotFoundError:
+        return [], 0
+    end = data.rfind(b'\n') + 1
+    entries = []
+    for line in data[:end].splitlines():
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            log.warning(f"Skipping unreadable journal entry in '{journal_path}'.")
+    return entries, offset + end
+
+def journal_clear(journal_path:str):
+    """Removes a journal file once its entries are part of the snapshot."""
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
+
 def hash_password(password: str) -> str:
-    """Hashes the password using SHA-256."""
+    """Hashes the password using SHA-256.
+
+    This is the legacy, unsalted scheme; user passwords are stored with
+    make_password and old hashes are replaced on the next login."""
     return hashlib.sha256(password.encode('utf8')).hexdigest()
 
+PASSWORD_SCHEME = 'scrypt'
+PASSWORD_COST = 2 ** 14
+PASSWORD_BLOCK_SIZE = 8
+PASSWORD_SALT_SIZE = 16
+
+def _scrypt(password:str , salt:bytes , cost:int , block_size:int) -> bytes:
+    # hashlib releases the GIL while deriving, so callers on threads hash in parallel.
+    return hashlib.scrypt(password.encode('utf8'), salt=salt, n=cost, r=block_size, p=1,
+                          maxmem=256 * cost * block_size, dklen=32)
+
+def _b64(data:bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def _unb64(text:str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def make_password(password:str , cost:int | None = None) -> str:
+    """Returns a salted scrypt hash of the password as 'scrypt$cost$block$salt$hash'."""
+    cost = cost or PASSWORD_COST
+    salt = secrets.token_bytes(PASSWORD_SALT_SIZE)
+    derived = _scrypt(password, salt, cost, PASSWORD_BLOCK_SIZE)
+    return f'{PASSWORD_SCHEME}${cost}${PASSWORD_BLOCK_SIZE}${_b64(salt)}${_b64(derived)}'
+
+def verify_password(password:str , stored:str , is_hashed:bool = True) -> bool:
+    """Checks a password against a stored scrypt hash, legacy SHA-256 hash, or,
+    when is_hashed is False, plain text."""
+    if not is_hashed:
+        return hmac.compare_digest(password.encode('utf8'), stored.encode('utf8'))
+    if not stored.startswith(PASSWORD_SCHEME + '$'):
+        return hmac.compare_digest(hash_password(password), stored)
+    try:
+        _, cost, block_size, salt, derived = stored.split('$')
+        expected = _unb64(derived)
+        actual = _scrypt(password, _unb64(salt), int(cost), int(block_size))
+    except ValueError:
+        log.warning('Stored password hash is malformed.')
+        return False
+    return hmac.compare_digest(actual, expected)
+
+@functools.lru_cache(maxsize=1)
+def dummy_password_hash() -> str:
+    """Returns the hash of a random password to check against when a user does
+    not exist, so that costs as much as a wrong password."""
+    return make_password(secrets.token_hex(16))
+
+def password_needs_rehash(stored:str , is_hashed:bool = True) -> bool:
+    """Tells whether a stored password predates the current scheme or cost."""
+    if not is_hashed or not stored.startswith(PASSWORD_SCHEME + '$'):
+        return True
+    parts = stored.split('$')
+    return len(parts) != 5 or parts[1:3] != [str(PASSWORD_COST), str(PASSWORD_BLOCK_SIZE)]
+
+DATETIME_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _parse_jalali(value:str , datetime_format:str | None):
+    """Parses a Jalali date string, or an ISO string when datetime_format is None.
+
+    Results are memoised with LRU eviction: the same birth dates, showing
+    times and timestamps are parsed over and over, and strptime is slow.
+    jdatetime objects are immutable, so sharing them is safe."""
+    if datetime_format is None:
+        return jdatetime.datetime.fromisoformat(value)
+    return jdatetime.datetime.strptime(value, datetime_format)
+
+def datetime_cache_info():
+    """Returns the hits, misses, maxsize and currsize of the parsed-datetime cache."""
+    return _parse_jalali.cache_info()
+
+def clear_datetime_cache():
+    """Empties the parsed-datetime cache and resets its counters."""
+    _parse_jalali.cache_clear()
+
 def str_to_datetime(date:str):
     """
         Converts a date string in 'YYYY-M-D' or 'YYYY-MM-DD' format to a jdatetime object.
@@ -38,7 +408,7 @@ def str_to_datetime(date:str):
         """
     date_format = "%Y-%m-%d"
     try:
-        new_date = jdatetime.datetime.strptime(date, date_format)
+        new_date = _parse_jalali(date, date_format)
         return new_date
 
     except (ValueError , TypeError):
@@ -49,12 +419,50 @@ def str_to_showimg_datetime(datetime_str:str):
     """Converts a showing datetime string ('YYYY-M-D HH:MM') to a jdatetime object."""
     datetime_format = "%Y-%m-%d %H:%M"
     try:
-        new_datetime = jdatetime.datetime.strptime(datetime_str, datetime_format)
+        new_datetime = _parse_jalali(datetime_str, datetime_format)
         return new_datetime
     except (ValueError , TypeError):
         log.warning(f"Validation failed for showing time: '{datetime_str}'. Format should be YYYY-M-D HH:MM.")
         raise InvalidDateError
 
+def iso_to_datetime(iso_str:str):
+    """Converts a stored ISO timestamp (with or without microseconds) to a jdatetime object."""
+    try:
+        return _parse_jalali(iso_str, None)
+    except (ValueError , TypeError):
+        log.warning(f"Validation failed for timestamp: '{iso_str}'.")
+        raise InvalidDateError
+
+class LazyDatetime:
+    """A jdatetime attribute of a slotted class kept as its stored ISO string until first read.
+
+    `slot` names the slot holding either the string or the parsed value, so
+    records that are loaded and saved again without reading it are never
+    parsed or re-formatted."""
+
+    def __init__(self, slot:str):
+        self.slot = slot
+
+    def __set_name__(self, owner, name):
+        self.member = owner.__dict__[self.slot]
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.member.__get__(instance)
+        if isinstance(value, str):
+            value = iso_to_datetime(value)
+            self.member.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.member.__set__(instance, value)
+
+    def iso(self, instance) -> str:
+        """Returns the attribute as an ISO string without parsing it."""
+        value = self.member.__get__(instance)
+        return value if isinstance(value, str) else value.isoformat()
+
 def calculate_time_span(start:jdatetime.datetime , end:jdatetime.datetime):
     """
     Calculates the time difference (span) between two time.